@@ -18,7 +18,6 @@ Para producción:
 import argparse
 import logging
 from datetime import datetime, timezone
-from calendar import monthrange
 from zoneinfo import ZoneInfo
 
 from flask import Flask, render_template
@@ -27,13 +26,28 @@ from werkzeug.exceptions import HTTPException
 
 # Configuración y extensiones
 from config import config
-from extensions import db, login_manager
+from extensions import db, login_manager, init_sqlite
 
 # Utilidades
 from utils.filters import register_filters
+from utils.product_search import setup_product_fts
+from utils.code_index import register_code_index_events
+from utils.sales_stats import register_sales_stats_events, setup_sales_stats
+from utils.sales_rollups import register_sales_rollup_events, setup_sales_rollups
+from utils.report_cache import register_report_cache_events
+from utils.numbering import setup_document_sequences
+from utils.credit_notes import setup_credit_note_balances
+from utils.stock_ledger import setup_stock_ledger
+from utils.product_metrics import init_product_metrics
+from utils.query_counter import init_query_counter
+from utils.sql_profiler import init_sql_profiler
+from utils.metrics import init_metrics
+from utils.slow_queries import init_slow_query_log
+from utils.backup import init_backup_service
+from utils.context_cache import setting_snapshot, inventory_status
 
 # Modelos
-from models.models import Setting, User, ServiceType, Product, ProductStockLog
+from models.models import User, ServiceType
 
 # Blueprints
 from routes.auth import auth_bp
@@ -48,6 +62,8 @@ from routes.settings import settings_bp
 from routes.reports import reports_bp
 from routes.services import services_bp
 from routes.inventory import inventory_bp
+from routes.exports import exports_bp
+from routes.metrics import metrics_bp
 
 # Timezone de Colombia
 CO_TZ = ZoneInfo("America/Bogota")
@@ -71,45 +87,42 @@ def create_app(config_name='development'):
     db.init_app(app)
     login_manager.init_app(app)
     
+    # Perfil de rendimiento SQLite (WAL, PRAGMAs por conexión, mantenimiento)
+    init_sqlite(app)
+    
     # Registrar filtros Jinja2
     register_filters(app)
     
+    # Invalidación del índice de códigos en memoria ante escrituras de productos
+    register_code_index_events()
+    
+    # Contadores de ventas por producto y rollups de reportes, mantenidos en la
+    # transacción de cada factura
+    register_sales_stats_events()
+    register_sales_rollup_events()
+    
+    # Invalidación de la caché de /reports por días tocados en cada commit
+    register_report_cache_events()
+    
     # Registrar context processor
     @app.context_processor
     def inject_globals():
         """Inyecta variables globales en todos los templates."""
         return {
             "now": datetime.now(timezone.utc),
-            "setting": Setting.get(),
+            "setting": setting_snapshot(),
             "colombia_tz": CO_TZ
         }
     
     @app.context_processor
     def inject_inventory_status():
-        """Inyecta estado de inventario del día en todas las plantillas."""
+        """Inyecta estado de inventario del día en todas las plantillas.
+        
+        Valores cacheados por proceso (utils/context_cache.py): no consulta la
+        BD en cada render.
+        """
         if current_user.is_authenticated:
-            today = datetime.now(CO_TZ).date()
-            
-            # Productos totales (excl. servicios)
-            total_products = Product.query.filter(Product.category != 'Servicios').count()
-            
-            # Meta diaria (productos / días del mes)
-            _, days_in_month = monthrange(today.year, today.month)
-            daily_target = max(1, total_products // days_in_month)
-            
-            # Productos inventariados HOY
-            inventoried_today = ProductStockLog.query.filter(
-                ProductStockLog.is_inventory == True,
-                db.func.date(ProductStockLog.created_at) == today
-            ).count()
-            
-            # Pendientes del día
-            pending_today = max(0, daily_target - inventoried_today)
-            
-            return {
-                'products_pending_inventory_today': pending_today,
-                'daily_inventory_target': daily_target
-            }
+            return inventory_status()
         
         return {
             'products_pending_inventory_today': 0,
@@ -135,6 +148,8 @@ def create_app(config_name='development'):
     app.register_blueprint(reports_bp)
     app.register_blueprint(services_bp)
     app.register_blueprint(inventory_bp)
+    app.register_blueprint(exports_bp)
+    app.register_blueprint(metrics_bp)
     
     # Manejadores de errores
     @app.errorhandler(404)
@@ -165,6 +180,40 @@ def create_app(config_name='development'):
     with app.app_context():
         db.create_all()
         
+        # Saldo por NC (columna nueva en bases existentes) antes de consultar Invoice
+        setup_credit_note_balances()
+        
+        # Conteo de consultas SQL por request (header X-Query-Count en debug/testing)
+        init_query_counter(app)
+        
+        # Tiempo de BD, sentencias repetidas y N+1 por request (Server-Timing)
+        init_sql_profiler(app)
+        
+        # Consultas lentas con su plan de ejecución (archivo rotativo + /settings/slow-queries)
+        init_slow_query_log(app)
+        
+        # Histogramas de latencia por endpoint para /metrics (formato Prometheus)
+        init_metrics(app)
+        
+        # Backup automático en segundo plano (fecha del último backup en memoria)
+        init_backup_service(app)
+        
+        # Índice FTS5 de búsqueda de productos (fallback LIKE si no hay soporte)
+        setup_product_fts()
+        
+        # Contadores de ventas (reconstruye desde historial si la tabla está vacía)
+        setup_sales_stats()
+        setup_sales_rollups()
+        
+        # Libro de movimientos de stock (backfill desde logs y ventas si está vacío)
+        setup_stock_ledger()
+        
+        # Métricas de inventario por producto (recálculo nocturno en segundo plano)
+        init_product_metrics(app)
+        
+        # Consecutivo de facturas (se crea desde Setting en bases existentes)
+        setup_document_sequences()
+        
         # Crear usuarios por defecto si no existen
         if User.query.count() == 0:
             User.create_defaults()
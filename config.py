@@ -22,6 +22,54 @@ class Config:
         }
     }
     
+    # Perfil de SQLite aplicado en cada conexión (ver extensions.init_sqlite).
+    # Se combina con SQLITE_DEFAULT_PRAGMAS; None omite un PRAGMA
+    SQLITE_PRAGMAS = {}
+    # Mantenimiento en un hilo aparte (extensions.SQLiteMaintenance); 0 desactiva
+    SQLITE_CHECKPOINT_INTERVAL = 300       # segundos entre wal_checkpoint(PASSIVE)
+    SQLITE_OPTIMIZE_INTERVAL = 6 * 3600    # segundos entre PRAGMA optimize
+    
+    # Numeración de documentos (utils/numbering.py): bloques por terminal opcionales
+    TERMINAL_ID = os.environ.get('TERMINAL_ID')
+    INVOICE_NUMBER_BLOCK_SIZE = int(os.environ.get('INVOICE_NUMBER_BLOCK_SIZE', '1'))
+    
+    # Instrumentación SQL por request (utils/sql_profiler.py): opt-in en producción
+    SQL_PROFILING = os.environ.get('SQL_PROFILING') == '1'
+    SQL_PROFILING_SAMPLE_RATE = float(os.environ.get('SQL_PROFILING_SAMPLE_RATE', '1.0'))
+    SQL_N_PLUS_ONE_THRESHOLD = 10          # misma sentencia > N veces = posible N+1
+    
+    # Log de consultas lentas con EXPLAIN QUERY PLAN (utils/slow_queries.py); 0 desactiva
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '200'))
+    SLOW_QUERY_LOG_FILE = 'slow_queries.log'   # relativo a instance/
+    
+    # Histogramas de latencia por endpoint (utils/metrics.py, expuestos en /metrics)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    
+    # Backup en segundo plano (utils/backup.py): API de backup de SQLite por pasos
+    BACKUP_INTERVAL_DAYS = 1               # 0 desactiva el backup automático
+    BACKUP_PAGES_PER_STEP = 256            # páginas copiadas por paso
+    BACKUP_STEP_SLEEP = 0.01               # pausa (segundos) entre pasos
+    BACKUP_RETRY_MINUTES = 30              # espera tras un backup fallido
+    
+    # Cadena de backups comprimidos (utils/backup_store.py, en instance/backups/)
+    BACKUP_DIR = None                      # None = instance/backups
+    BACKUP_COMPRESSION = None              # 'gz' | 'zst' | None (zst si está instalado)
+    BACKUP_FULL_EVERY = 7                  # incrementales entre completos
+    BACKUP_KEEP_DAILY = 7                  # retención: días, semanas y meses
+    BACKUP_KEEP_WEEKLY = 4
+    BACKUP_KEEP_MONTHLY = 6
+    BACKUP_VERIFY = True                   # integrity_check sobre una restauración temporal
+    
+    # Métricas de inventario por producto (utils/product_metrics.py): recálculo
+    # en segundo plano una vez por día local; False = solo migrations/refresh_product_metrics.py
+    PRODUCT_METRICS_NIGHTLY = True
+    PRODUCT_METRICS_RETRY_MINUTES = 30     # espera tras un cálculo fallido
+    
+    # Pedido sugerido por proveedor (utils/reorder.py, /suppliers/reorder)
+    REORDER_LEAD_TIME_DAYS = 3             # días entre el pedido y la llegada
+    REORDER_REVIEW_DAYS = 7                # días que debe cubrir cada pedido
+    REORDER_FORECAST_METHOD = 'ses'        # 'ses' (suavizado exponencial) | 'moving_average'
+    
     # Configuración de sesión
     PERMANENT_SESSION_LIFETIME = timedelta(hours=2)
     SESSION_COOKIE_SECURE = False  # True en producción con HTTPS
@@ -39,6 +87,7 @@ class DevelopmentConfig(Config):
     """Configuración para desarrollo."""
     DEBUG = True
     SQLALCHEMY_ECHO = False  # True para ver SQL generado
+    SQL_PROFILING = True
 
 
 class ProductionConfig(Config):
@@ -61,6 +110,7 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    SLOW_QUERY_LOG_FILE = None              # solo en memoria
 
 
 # Mapeo de configuraciones
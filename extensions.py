@@ -1,9 +1,24 @@
 """Green-POS - Extensiones de Flask
 Extensiones de Flask inicializadas aquí para evitar imports circulares.
+
+Incluye el perfil de rendimiento de SQLite (init_sqlite):
+- PRAGMAs aplicados en CADA conexión nueva del pool (WAL, synchronous,
+  cache_size, mmap_size, temp_store, busy_timeout), configurables con
+  SQLITE_PRAGMAS en config.py
+- Mantenimiento periódico en un hilo aparte: wal_checkpoint(PASSIVE) y
+  PRAGMA optimize (un request lo dispara al vencer el intervalo y no espera;
+  intervalos SQLITE_CHECKPOINT_INTERVAL / SQLITE_OPTIMIZE_INTERVAL en config.py)
+- Reporte en el log de los valores efectivos al iniciar
 """
 
+import logging
+import threading
+import time
+from functools import partial
+
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from sqlalchemy import event
 
 # Inicializar extensiones (sin app aún)
 db = SQLAlchemy()
@@ -13,3 +28,164 @@ login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Debe iniciar sesión para acceder a esta página'
 login_manager.login_message_category = 'warning'
+
+logger = logging.getLogger(__name__)
+
+# Perfil por defecto (se combina con app.config['SQLITE_PRAGMAS'])
+# - WAL: lectores (/reports) no bloquean a la caja que escribe facturas
+# - synchronous=NORMAL: seguro en WAL, solo arriesga el último commit ante corte de energía
+# - cache_size negativo = KiB (64 MB), mmap_size en bytes (256 MB)
+SQLITE_DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 30000,
+}
+
+
+def _apply_pragmas(pragmas, dbapi_connection, connection_record):
+    """Listener 'connect': aplica el perfil de PRAGMAs a la conexión DBAPI."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            if value is not None:
+                cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def sqlite_report(engine, pragmas=None):
+    """Valores efectivos de los PRAGMAs en una conexión del pool.
+
+    Args:
+        engine: Engine SQLAlchemy
+        pragmas: Nombres a consultar (default: los del perfil por defecto)
+
+    Returns:
+        dict: nombre -> valor efectivo (ej: {'journal_mode': 'wal', ...})
+    """
+    names = list(pragmas or SQLITE_DEFAULT_PRAGMAS)
+    with engine.connect() as connection:
+        return {
+            name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in names
+        }
+
+
+class SQLiteMaintenance:
+    """Ejecuta checkpoint del WAL y PRAGMA optimize cada cierto intervalo.
+
+    before_request llama a schedule(): si alguna tarea venció lanza un hilo
+    (uno a la vez) y el request sigue sin esperar. Intervalos en segundos;
+    0 desactiva la tarea.
+    """
+
+    def __init__(self, engine, checkpoint_interval, optimize_interval):
+        self.engine = engine
+        self.checkpoint_interval = checkpoint_interval
+        self.optimize_interval = optimize_interval
+        self._lock = threading.Lock()
+        self._thread = None
+        now = time.monotonic()
+        self._last_checkpoint = now
+        self._last_optimize = now
+
+    @property
+    def running(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def _due(self, now):
+        checkpoint_due = bool(self.checkpoint_interval) and \
+            now - self._last_checkpoint >= self.checkpoint_interval
+        optimize_due = bool(self.optimize_interval) and \
+            now - self._last_optimize >= self.optimize_interval
+        return checkpoint_due, optimize_due
+
+    def is_due(self, now=None):
+        """True si alguna tarea venció (sin tocar la BD)."""
+        return any(self._due(now or time.monotonic()))
+
+    def schedule(self):
+        """Lanza el mantenimiento en segundo plano si toca y no hay otro en curso.
+
+        Returns:
+            bool: True si se lanzó el hilo
+        """
+        if not self.is_due():
+            return False
+        with self._lock:
+            if self.running or not self.is_due():
+                return False
+            self._thread = threading.Thread(
+                target=self.run, name='greenpos-sqlite-maintenance', daemon=True
+            )
+            self._thread.start()
+        return True
+
+    def run(self):
+        """Ejecuta las tareas vencidas (bloquea al llamador)."""
+        now = time.monotonic()
+        checkpoint_due, optimize_due = self._due(now)
+        # Marcar antes de ejecutar: un fallo espera al siguiente intervalo
+        if checkpoint_due:
+            self._last_checkpoint = now
+        if optimize_due:
+            self._last_optimize = now
+        try:
+            with self.engine.connect() as connection:
+                if checkpoint_due:
+                    busy, wal_pages, moved = connection.exec_driver_sql(
+                        "PRAGMA wal_checkpoint(PASSIVE)"
+                    ).one()
+                    logger.debug(f"wal_checkpoint: busy={busy} wal={wal_pages} copiadas={moved}")
+                if optimize_due:
+                    connection.exec_driver_sql("PRAGMA optimize")
+                    logger.debug("PRAGMA optimize ejecutado")
+        except Exception as e:
+            logger.warning(f"Mantenimiento SQLite falló: {e}")
+
+    def wait(self, timeout=None):
+        """Espera el mantenimiento en curso (scripts y pruebas)."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+def init_sqlite(app):
+    """Configura el perfil de SQLite para la app (llamar después de db.init_app).
+
+    Args:
+        app: Aplicación Flask
+
+    Returns:
+        dict|None: Valores efectivos de los PRAGMAs, o None si la BD no es SQLite
+    """
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return None
+
+        pragmas = {**SQLITE_DEFAULT_PRAGMAS, **app.config.get('SQLITE_PRAGMAS', {})}
+        event.listen(engine, 'connect', partial(_apply_pragmas, pragmas))
+        # Conexiones abiertas antes del listener no tendrían el perfil
+        engine.dispose()
+
+        report = sqlite_report(engine, pragmas)
+
+    app.logger.info("SQLite: " + ", ".join(f"{name}={value}" for name, value in report.items()))
+    if str(pragmas.get('journal_mode', '')).lower() == 'wal' and report.get('journal_mode') not in ('wal', 'memory'):
+        app.logger.warning(f"SQLite no activó WAL (journal_mode={report.get('journal_mode')})")
+
+    maintenance = SQLiteMaintenance(
+        engine,
+        app.config['SQLITE_CHECKPOINT_INTERVAL'],
+        app.config['SQLITE_OPTIMIZE_INTERVAL']
+    )
+    app.extensions['sqlite_maintenance'] = maintenance
+    # Base en memoria (testing): sin WAL que vaciar y una sola conexión compartida
+    if engine.url.database not in (None, '', ':memory:'):
+        app.before_request(maintenance.schedule)
+    return report
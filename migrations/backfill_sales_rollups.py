@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Migración: Backfill de los rollups de ventas de /reports
+(sales_rollup_hourly, sales_rollup_daily, sales_rollup_payment y
+sales_rollup_product) desde el historial de facturas.
+
+Los rollups se mantienen incrementalmente en cada escritura de factura
+(utils/sales_rollups.py); este script los construye en bases existentes o
+los corrige tras modificaciones con SQL directo.
+
+Ejecución:
+    # Desde raíz del proyecto (RECOMENDADO):
+    python migrations/backfill_sales_rollups.py
+
+    # Solo sales_rollup_product de algunos productos (ej: tras fusionarlos):
+    python migrations/backfill_sales_rollups.py 12 57 98
+
+Notas:
+    - Este script usa Path(__file__).parent para resolver rutas
+    - El CWD (current working directory) NO afecta la ejecución
+    - Siempre crea backup automático antes de migrar
+    - La utilidad se recalcula con el precio de compra ACTUAL de cada producto
+"""
+
+import sys
+import shutil
+from pathlib import Path
+from datetime import datetime
+
+# ============================================================================
+# RESOLUCIÓN DE PATHS (NUNCA usar rutas relativas simples)
+# ============================================================================
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+DB_PATH = PROJECT_ROOT / 'instance' / 'app.db'
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# ============================================================================
+# FUNCIONES AUXILIARES
+# ============================================================================
+
+def create_backup():
+    """Crea backup de la base de datos antes de migrar.
+
+    Returns:
+        Path: Ruta del backup creado, o None si falla
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    backup_path = PROJECT_ROOT / 'instance' / f'app_backup_{timestamp}.db'
+
+    if not DB_PATH.exists():
+        print(f"[ERROR] Base de datos no encontrada: {DB_PATH}")
+        return None
+
+    try:
+        shutil.copy2(DB_PATH, backup_path)
+        print(f"[OK] Backup creado: {backup_path}")
+        return backup_path
+    except Exception as e:
+        print(f"[ERROR] No se pudo crear backup: {e}")
+        return None
+
+# ============================================================================
+# MIGRACIÓN PRINCIPAL
+# ============================================================================
+
+def run_migration(product_ids=None):
+    """Reconstruye los rollups de ventas.
+
+    Args:
+        product_ids: Lista de IDs (solo sales_rollup_product) o None para todo
+
+    Returns:
+        bool: True si exitosa, False si falla
+    """
+    print("\n" + "="*60)
+    print("BACKFILL DE ROLLUPS DE VENTAS")
+    print("="*60)
+    print(f"[INFO] Base de datos: {DB_PATH}")
+
+    if not create_backup():
+        return False
+
+    from app import app
+    from extensions import db
+    from utils.sales_rollups import rebuild_sales_rollups
+
+    with app.app_context():
+        try:
+            if product_ids:
+                print(f"[INFO] Recalculando rollups de {len(product_ids)} productos...")
+            else:
+                print("[INFO] Agregando facturas y notas de crédito por hora/día local...")
+            rows = rebuild_sales_rollups(product_ids)
+            db.session.commit()
+
+            unit = "filas de producto" if product_ids else "días con ventas"
+            print(f"[OK] Rollups reconstruidos: {rows} {unit}")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Error en backfill de rollups: {e}")
+            return False
+
+# ============================================================================
+# PUNTO DE ENTRADA
+# ============================================================================
+
+if __name__ == '__main__':
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    success = run_migration(ids)
+
+    if success:
+        print("\n[OK] BACKFILL COMPLETADO EXITOSAMENTE")
+        exit(0)
+    else:
+        print("\n[ERROR] BACKFILL FALLIDO")
+        exit(1)
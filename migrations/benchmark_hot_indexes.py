@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark: consultas frecuentes antes/después de migration_add_hot_indexes.py
+
+Genera una base SQLite sintética (esquema de models/models.py) con ~500k
+items de factura, mide las consultas de reportes, dashboard, inventario,
+historial de stock y citas SIN los índices nuevos, los crea con la misma
+función de la migración y vuelve a medir.
+
+NO toca instance/app.db: la base sintética se crea en un archivo temporal.
+
+Ejecución:
+    # Desde raíz del proyecto:
+    python migrations/benchmark_hot_indexes.py
+    python migrations/benchmark_hot_indexes.py --items 100000 --repeat 5
+"""
+
+import argparse
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# ============================================================================
+# RESOLUCIÓN DE PATHS (NUNCA usar rutas relativas simples)
+# ============================================================================
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from migration_add_hot_indexes import INDEXES, create_indexes  # noqa: E402
+
+ITEMS_PER_INVOICE = 5
+CATEGORIES = ['Perros', 'Gatos', 'Accesorios', 'Medicamentos', 'Snacks', 'Servicios']
+
+# (nombre, SQL, constructor de parámetros)
+QUERIES = [
+    ('reportes: ventas recientes del rango',
+     "SELECT id, number, total FROM invoice WHERE date >= ? AND date < ? ORDER BY date DESC LIMIT 20",
+     lambda ctx: (ctx['range_start'], ctx['range_end'])),
+    ('facturas de un cliente',
+     "SELECT id, number, total FROM invoice WHERE customer_id = ? ORDER BY date DESC",
+     lambda ctx: (random.randint(1, ctx['customers']),)),
+    ('facturas canceladas',
+     "SELECT COUNT(*) FROM invoice WHERE status = 'cancelled'",
+     lambda ctx: ()),
+    ('items de una factura',
+     "SELECT product_id, quantity, price FROM invoice_item WHERE invoice_id = ?",
+     lambda ctx: (random.randint(1, ctx['invoices']),)),
+    ('historial: ventas de un producto',
+     "SELECT i.date, ii.quantity FROM invoice_item ii JOIN invoice i ON i.id = ii.invoice_id "
+     "WHERE ii.product_id = ? AND i.document_type = 'invoice'",
+     lambda ctx: (random.randint(1, ctx['products']),)),
+    ('historial: movimientos de stock',
+     "SELECT * FROM product_stock_log WHERE product_id = ? ORDER BY created_at DESC LIMIT 50",
+     lambda ctx: (random.randint(1, ctx['products']),)),
+    ('inventario: conteos del día',
+     "SELECT COUNT(*) FROM product_stock_log WHERE is_inventory = 1 AND created_at >= ? AND created_at < ?",
+     lambda ctx: (ctx['day_start'], ctx['day_end'])),
+    ('dashboard: próximas citas',
+     "SELECT id FROM appointment WHERE status = 'pending' ORDER BY scheduled_at LIMIT 10",
+     lambda ctx: ()),
+    ('citas de un día',
+     "SELECT id FROM appointment WHERE scheduled_at >= ? AND scheduled_at < ?",
+     lambda ctx: (ctx['day_start'], ctx['day_end'])),
+    ('mascotas de un cliente',
+     "SELECT id, name FROM pet WHERE customer_id = ?",
+     lambda ctx: (random.randint(1, ctx['customers']),)),
+    ('servicios de una cita',
+     "SELECT id, price FROM pet_service WHERE appointment_id = ?",
+     lambda ctx: (random.randint(1, ctx['appointments']),)),
+    ('productos por categoría',
+     "SELECT id, name FROM product WHERE category = ?",
+     lambda ctx: ('Gatos',)),
+]
+
+# ============================================================================
+# DATASET SINTÉTICO
+# ============================================================================
+
+def create_schema(db_path):
+    """Crea el esquema de models.py y elimina los índices a medir."""
+    from sqlalchemy import create_engine
+    from models.models import db
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    db.metadata.create_all(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    for name, _table, _columns in INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    return conn
+
+
+def _stamp(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def populate(conn, items):
+    """Inserta el dataset sintético.
+
+    Returns:
+        dict: Tamaños y parámetros de referencia para las consultas
+    """
+    random.seed(42)
+    invoices = items // ITEMS_PER_INVOICE
+    products = 3000
+    customers = 2000
+    pets = 3000
+    appointments = 20000
+    stock_logs = 200000
+    start = datetime(2023, 1, 1)
+    span = 3 * 365 * 24 * 3600
+    now = datetime.utcnow()
+
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("BEGIN")
+
+    conn.executemany(
+        "INSERT INTO customer (id, name, document, credit_balance, created_at) VALUES (?, ?, ?, 0, ?)",
+        [(i, f'Cliente {i}', str(10000 + i), _stamp(now)) for i in range(1, customers + 1)]
+    )
+    conn.executemany(
+        "INSERT INTO product (id, code, name, sale_price, purchase_price, stock, category) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(i, f'P{i:06d}', f'Producto {i}', 1000.0 + i, 500.0, 10, random.choice(CATEGORIES))
+         for i in range(1, products + 1)]
+    )
+    conn.executemany(
+        "INSERT INTO pet (id, customer_id, name) VALUES (?, ?, ?)",
+        [(i, random.randint(1, customers), f'Mascota {i}') for i in range(1, pets + 1)]
+    )
+
+    invoice_rows = []
+    for i in range(1, invoices + 1):
+        when = start + timedelta(seconds=span * i // invoices)
+        status = 'cancelled' if i % 97 == 0 else 'pending'
+        invoice_rows.append((i, f'INV-{i:07d}', 'invoice', random.randint(1, customers), _stamp(when),
+                             5000.0, status, 'cash'))
+    conn.executemany(
+        "INSERT INTO invoice (id, number, document_type, customer_id, date, total, status, payment_method) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", invoice_rows
+    )
+    conn.executemany(
+        "INSERT INTO invoice_item (invoice_id, product_id, quantity, price, discount) VALUES (?, ?, ?, ?, 0)",
+        ((i, random.randint(1, products), random.randint(1, 3), 1000.0)
+         for i in range(1, invoices + 1) for _ in range(ITEMS_PER_INVOICE))
+    )
+
+    conn.executemany(
+        "INSERT INTO product_stock_log (product_id, quantity, movement_type, reason, previous_stock, "
+        "new_stock, is_inventory, created_at) VALUES (?, ?, ?, 'sintético', 10, 10, ?, ?)",
+        ((random.randint(1, products), 1, 'inventory', 1 if i % 5 == 0 else 0,
+          _stamp(start + timedelta(seconds=span * i // stock_logs)))
+         for i in range(stock_logs))
+    )
+    conn.executemany(
+        "INSERT INTO appointment (id, pet_id, customer_id, status, total_price, scheduled_at) "
+        "VALUES (?, ?, ?, ?, 0, ?)",
+        [(i, random.randint(1, pets), random.randint(1, customers),
+          'pending' if i % 10 == 0 else 'done',
+          _stamp(start + timedelta(seconds=span * i // appointments)))
+         for i in range(1, appointments + 1)]
+    )
+    conn.executemany(
+        "INSERT INTO pet_service (pet_id, customer_id, appointment_id, price) VALUES (?, ?, ?, 0)",
+        ((random.randint(1, pets), random.randint(1, customers), i) for i in range(1, appointments + 1))
+    )
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+
+    day = start + timedelta(days=400)
+    return {
+        'invoices': invoices,
+        'products': products,
+        'customers': customers,
+        'appointments': appointments,
+        'range_start': _stamp(day),
+        'range_end': _stamp(day + timedelta(days=30)),
+        'day_start': _stamp(day),
+        'day_end': _stamp(day + timedelta(days=1)),
+    }
+
+# ============================================================================
+# MEDICIÓN
+# ============================================================================
+
+def measure(conn, ctx, repeat):
+    """Mediana en milisegundos de cada consulta.
+
+    Returns:
+        dict: nombre -> ms
+    """
+    results = {}
+    for name, sql, params in QUERIES:
+        timings = []
+        for _ in range(repeat):
+            args = params(ctx)
+            started = time.perf_counter()
+            conn.execute(sql, args).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(timings)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de índices de consultas frecuentes')
+    parser.add_argument('--items', type=int, default=500000, help='Items de factura sintéticos')
+    parser.add_argument('--repeat', type=int, default=9, help='Repeticiones por consulta')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'benchmark.db'
+        print(f"[INFO] Generando dataset sintético ({args.items} items) en {db_path}...")
+        started = time.perf_counter()
+        conn = create_schema(db_path)
+        ctx = populate(conn, args.items)
+        print(f"[OK] Dataset listo en {time.perf_counter() - started:.1f}s\n")
+
+        print("[INFO] Midiendo SIN índices...")
+        before = measure(conn, ctx, args.repeat)
+
+        print("[INFO] Creando índices con migration_add_hot_indexes.create_indexes...")
+        started = time.perf_counter()
+        create_indexes(conn, verbose=False)
+        conn.execute("ANALYZE")
+        print(f"[OK] Índices creados en {time.perf_counter() - started:.1f}s\n")
+
+        print("[INFO] Midiendo CON índices...")
+        after = measure(conn, ctx, args.repeat)
+        conn.close()
+
+    width = max(len(name) for name, _sql, _params in QUERIES)
+    print(f"\n{'Consulta'.ljust(width)}  {'Antes (ms)':>11}  {'Después (ms)':>13}  {'Mejora':>8}")
+    print('-' * (width + 40))
+    for name, _sql, _params in QUERIES:
+        speedup = before[name] / after[name] if after[name] > 0 else float('inf')
+        print(f"{name.ljust(width)}  {before[name]:>11.2f}  {after[name]:>13.2f}  {speedup:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,8 @@ Características:
 - Migra códigos antiguos a ProductCode (type='legacy')
 - Migra proveedores (product_supplier)
 - Elimina productos origen
+- CLI: recalcula contadores de ventas, rollups y libro de stock de los
+  productos involucrados (lo mismo que products.merge desde la web)
 
 Uso:
     # Consola Python
@@ -27,7 +29,7 @@ Uso:
 """
 
 import sqlite3
-import shutil
+import sys
 import json
 from pathlib import Path
 from datetime import datetime
@@ -37,6 +39,11 @@ SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPT_DIR.parent
 DB_PATH = PROJECT_ROOT / 'instance' / 'app.db'
 
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config import Config
+from utils.backup import make_store
+
 
 def merge_products(source_product_ids: list, 
                   target_product_id: int, 
@@ -86,12 +93,11 @@ def merge_products(source_product_ids: list,
         raise ValueError("source_product_ids debe ser una lista")
     
     # BACKUP AUTOMÁTICO
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_path = DB_PATH.parent / f'app_backup_merge_{timestamp}.db'
-    
-    print(f"\n[INFO] Creando backup: {backup_path.name}")
-    shutil.copy2(DB_PATH, backup_path)
-    print(f"[OK] Backup creado")
+    # Incremental comprimido en instance/backups/ (restaurar con migrations/restore_backup.py)
+    print(f"\n[INFO] Creando backup...")
+    backup = make_store(Config, str(DB_PATH.parent)).snapshot(str(DB_PATH), label='merge_products')
+    backup_path = backup['name']
+    print(f"[OK] Backup creado: {backup_path} ({backup['kind']}, {backup['stored_size'] / 1024:.0f} KB)")
     
     # Conectar a base de datos
     conn = sqlite3.connect(DB_PATH)
@@ -301,6 +307,53 @@ def merge_products(source_product_ids: list,
         conn.close()
 
 
+# Reconstrucciones pendientes tras escribir con sqlite3 directo (mismo orden que products.merge)
+REBUILD_COMMANDS = (
+    'migrations/rebuild_product_sales_stats.py',
+    'migrations/backfill_sales_rollups.py',
+    'migrations/rebuild_stock_ledger.py',
+)
+
+
+def rebuild_derived_data(product_ids):
+    """Recalcula los datos derivados de los productos fusionados.
+
+    product_sales_stats, sales_rollup_product y stock_ledger no se
+    actualizan con las escrituras sqlite3 de merge_products.
+
+    Args:
+        product_ids: IDs del destino y los orígenes
+
+    Returns:
+        bool: True si exitoso, False si falla (se imprimen los comandos)
+    """
+    from app import app
+    from extensions import db
+    from utils.sales_rollups import rebuild_sales_rollups
+    from utils.sales_stats import rebuild_sales_stats
+    from utils.stock_ledger import rebuild_stock_ledger
+
+    with app.app_context():
+        try:
+            rebuild_sales_stats(product_ids)
+            rebuild_sales_rollups(product_ids)
+            rebuild_stock_ledger(product_ids)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            ids = ' '.join(str(pid) for pid in product_ids)
+            print(f"[ERROR] Error recalculando datos derivados: {e}")
+            print("[INFO] Ejecutar manualmente:")
+            for command in REBUILD_COMMANDS:
+                print(f"    python {command} {ids}")
+            return False
+
+    print("[OK] Contadores de ventas, rollups y libro de stock recalculados")
+    # La app en ejecución guarda reportes en memoria (utils/report_cache.py)
+    print("[INFO] Reiniciar la aplicación para descartar reportes en caché")
+    return True
+
+
 def interactive_merge():
     """Modo interactivo CLI para consolidar productos."""
     print("="*60)
@@ -348,6 +401,9 @@ def interactive_merge():
                 json.dump(stats, f, indent=2)
             
             print(f"[INFO] Estadisticas guardadas: {stats_file.name}")
+            
+            # Desde la web esto lo hace products.merge
+            rebuild_derived_data([target_id] + source_ids)
         
     except ValueError as e:
         print(f"\n[ERROR] Input invalido: {e}")
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Migración: Índices para los predicados más consultados (reportes, dashboard,
+inventario, historial de stock y citas).
+
+Los índices están declarados en models/models.py (bases nuevas los reciben con
+db.create_all()); este script los crea en bases existentes SIN detener la
+aplicación:
+    - Modo WAL + busy_timeout: los lectores siguen atendiendo mientras se
+      construye cada índice y los escritores esperan en lugar de fallar
+    - Un índice por transacción: el bloqueo de escritura dura solo lo que
+      tarda cada CREATE INDEX, no la migración completa
+    - Idempotente: omite índices existentes (mismo nombre o mismas columnas,
+      ej: idx_stock_log_inventory de migration_add_inventory_flag.sql)
+    - Al final ejecuta PRAGMA optimize para actualizar estadísticas
+
+Ejecución:
+    # Desde raíz del proyecto (RECOMENDADO):
+    python migrations/migration_add_hot_indexes.py
+
+Benchmark antes/después (dataset sintético, no toca la BD real):
+    python migrations/benchmark_hot_indexes.py
+
+Notas:
+    - Este script usa Path(__file__).parent para resolver rutas
+    - El CWD (current working directory) NO afecta la ejecución
+    - Siempre crea backup automático antes de migrar
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+from datetime import datetime
+
+# ============================================================================
+# RESOLUCIÓN DE PATHS (NUNCA usar rutas relativas simples)
+# ============================================================================
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+DB_PATH = PROJECT_ROOT / 'instance' / 'app.db'
+
+# (nombre, tabla, columnas) - mismos nombres que genera SQLAlchemy en models.py
+INDEXES = [
+    ('ix_invoice_date', 'invoice', ('date',)),
+    ('ix_invoice_customer_id', 'invoice', ('customer_id',)),
+    ('ix_invoice_status', 'invoice', ('status',)),
+    ('ix_invoice_item_invoice_id', 'invoice_item', ('invoice_id',)),
+    ('ix_invoice_item_product_id', 'invoice_item', ('product_id',)),
+    ('ix_product_stock_log_product_id_created_at', 'product_stock_log', ('product_id', 'created_at')),
+    ('ix_product_stock_log_is_inventory_created_at', 'product_stock_log', ('is_inventory', 'created_at')),
+    ('ix_appointment_scheduled_at', 'appointment', ('scheduled_at',)),
+    ('ix_appointment_status', 'appointment', ('status',)),
+    ('ix_pet_customer_id', 'pet', ('customer_id',)),
+    ('ix_pet_service_appointment_id', 'pet_service', ('appointment_id',)),
+    ('ix_product_category', 'product', ('category',)),
+]
+
+# ============================================================================
+# FUNCIONES AUXILIARES
+# ============================================================================
+
+def create_backup():
+    """Crea backup de la base de datos antes de migrar.
+
+    Usa la API de backup de SQLite: copia consistente aunque la app esté
+    escribiendo (en modo WAL el archivo .db solo no basta).
+
+    Returns:
+        Path: Ruta del backup creado, o None si falla
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    backup_path = PROJECT_ROOT / 'instance' / f'app_backup_{timestamp}.db'
+
+    if not DB_PATH.exists():
+        print(f"[ERROR] Base de datos no encontrada: {DB_PATH}")
+        print(f"[INFO] CWD actual: {Path.cwd()}")
+        print(f"[INFO] Script location: {SCRIPT_DIR}")
+        return None
+
+    try:
+        source = sqlite3.connect(DB_PATH, timeout=30)
+        target = sqlite3.connect(backup_path)
+        with target:
+            source.backup(target)
+        target.close()
+        source.close()
+        print(f"[OK] Backup creado: {backup_path}")
+        return backup_path
+    except Exception as e:
+        print(f"[ERROR] No se pudo crear backup: {e}")
+        return None
+
+
+def existing_index_columns(conn, table):
+    """Índices existentes de una tabla.
+
+    Returns:
+        dict: nombre -> tupla de columnas
+    """
+    indexes = {}
+    for row in conn.execute(f"PRAGMA index_list({table})"):
+        name = row[1]
+        indexes[name] = tuple(info[2] for info in conn.execute(f"PRAGMA index_info('{name}')"))
+    return indexes
+
+
+def create_indexes(conn, indexes=INDEXES, verbose=True):
+    """Crea los índices faltantes, uno por transacción.
+
+    Args:
+        conn: Conexión SQLite (autocommit: isolation_level=None)
+        indexes: Lista de (nombre, tabla, columnas)
+        verbose: Imprime el progreso
+
+    Returns:
+        int: Índices creados
+    """
+    created = 0
+    for name, table, columns in indexes:
+        existing = existing_index_columns(conn, table)
+        if name in existing or columns in existing.values():
+            if verbose:
+                print(f"[INFO] {name}: ya existe (omitido)")
+            continue
+
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        created += 1
+        if verbose:
+            print(f"[OK] {name} creado en {time.perf_counter() - started:.2f}s")
+    return created
+
+
+def verify_migration(conn):
+    """Verifica que cada índice (o uno equivalente) exista.
+
+    Returns:
+        bool: True si todos existen
+    """
+    missing = []
+    for name, table, columns in INDEXES:
+        existing = existing_index_columns(conn, table)
+        if name not in existing and columns not in existing.values():
+            missing.append(name)
+    for name in missing:
+        print(f"[ERROR] Falta índice: {name}")
+    return not missing
+
+# ============================================================================
+# FUNCIÓN PRINCIPAL DE MIGRACIÓN
+# ============================================================================
+
+def run_migration():
+    """Ejecuta la migración completa con backup y verificación.
+
+    Returns:
+        bool: True si migración exitosa, False en caso contrario
+    """
+    print("[INFO] ================================================")
+    print("[INFO] Ejecutando migracion: Indices de consultas frecuentes")
+    print("[INFO] ================================================\n")
+
+    print("[INFO] Paso 1/3: Creando backup...")
+    if not create_backup():
+        print("\n[ERROR] Migracion abortada. No se pudo crear backup.")
+        return False
+
+    print("\n[INFO] Paso 2/3: Creando indices (en linea)...")
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA journal_mode=WAL")
+        created = create_indexes(conn)
+        conn.execute("PRAGMA optimize")
+        print(f"[OK] {created} indices creados")
+    except sqlite3.Error as e:
+        print(f"[ERROR] Error en migracion: {e}")
+        return False
+
+    print("\n[INFO] Paso 3/3: Verificando...")
+    try:
+        return verify_migration(conn)
+    finally:
+        conn.close()
+
+# ============================================================================
+# PUNTO DE ENTRADA
+# ============================================================================
+
+if __name__ == '__main__':
+    success = run_migration()
+
+    if success:
+        print("\n[OK] MIGRACION COMPLETADA EXITOSAMENTE")
+        exit(0)
+    else:
+        print("\n[ERROR] MIGRACION FALLIDA")
+        exit(1)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Migración: Reconstruye los contadores de ventas por producto
+(product_sales_stats y product_sales_monthly) desde el historial de
+facturas en una sola pasada.
+
+Los contadores se mantienen incrementalmente en cada escritura de factura
+(utils/sales_stats.py); este script sirve para inicializarlos en bases
+existentes o corregirlos tras modificaciones con SQL directo.
+
+Ejecución:
+    # Desde raíz del proyecto (RECOMENDADO):
+    python migrations/rebuild_product_sales_stats.py
+
+    # Solo algunos productos:
+    python migrations/rebuild_product_sales_stats.py 12 57 98
+
+Notas:
+    - Este script usa Path(__file__).parent para resolver rutas
+    - El CWD (current working directory) NO afecta la ejecución
+    - Siempre crea backup automático antes de migrar
+    - Las tablas se crean automáticamente (db.create_all) al importar app
+"""
+
+import sys
+import shutil
+from pathlib import Path
+from datetime import datetime
+
+# ============================================================================
+# RESOLUCIÓN DE PATHS (NUNCA usar rutas relativas simples)
+# ============================================================================
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+DB_PATH = PROJECT_ROOT / 'instance' / 'app.db'
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# ============================================================================
+# FUNCIONES AUXILIARES
+# ============================================================================
+
+def create_backup():
+    """Crea backup de la base de datos antes de migrar.
+
+    Returns:
+        Path: Ruta del backup creado, o None si falla
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    backup_path = PROJECT_ROOT / 'instance' / f'app_backup_{timestamp}.db'
+
+    if not DB_PATH.exists():
+        print(f"[ERROR] Base de datos no encontrada: {DB_PATH}")
+        return None
+
+    try:
+        shutil.copy2(DB_PATH, backup_path)
+        print(f"[OK] Backup creado: {backup_path}")
+        return backup_path
+    except Exception as e:
+        print(f"[ERROR] No se pudo crear backup: {e}")
+        return None
+
+# ============================================================================
+# MIGRACIÓN PRINCIPAL
+# ============================================================================
+
+def run_migration(product_ids=None):
+    """Reconstruye los contadores de ventas.
+
+    Args:
+        product_ids: Lista de IDs a recalcular o None para todos
+
+    Returns:
+        bool: True si exitosa, False si falla
+    """
+    print("\n" + "="*60)
+    print("RECONSTRUCCIÓN DE CONTADORES DE VENTAS")
+    print("="*60)
+    print(f"[INFO] Base de datos: {DB_PATH}")
+
+    if not create_backup():
+        return False
+
+    from app import app
+    from extensions import db
+    from utils.sales_stats import rebuild_sales_stats
+
+    with app.app_context():
+        try:
+            scope = f"{len(product_ids)} productos" if product_ids else "todos los productos"
+            print(f"[INFO] Recalculando {scope}...")
+
+            rows = rebuild_sales_stats(product_ids)
+            db.session.commit()
+
+            print(f"[OK] Contadores reconstruidos: {rows} productos con ventas")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Error reconstruyendo contadores: {e}")
+            return False
+
+# ============================================================================
+# PUNTO DE ENTRADA
+# ============================================================================
+
+if __name__ == '__main__':
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    success = run_migration(ids)
+
+    if success:
+        print("\n[OK] RECONSTRUCCIÓN COMPLETADA EXITOSAMENTE")
+        exit(0)
+    else:
+        print("\n[ERROR] RECONSTRUCCIÓN FALLIDA")
+        exit(1)
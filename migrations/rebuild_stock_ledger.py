@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Migración: Reconstruye el libro de movimientos de stock (stock_ledger)
+desde product_stock_log y las ventas (invoice_item).
+
+El libro se mantiene en cada escritura de stock (utils/stock_ledger.py);
+este script sirve para inicializarlo en bases existentes o corregirlo tras
+modificaciones con SQL directo (ej: consolidación desde consola con
+migrations/merge_products.py).
+
+Ejecución:
+    # Desde raíz del proyecto (RECOMENDADO):
+    python migrations/rebuild_stock_ledger.py
+
+    # Solo algunos productos:
+    python migrations/rebuild_stock_ledger.py 12 57 98
+
+Notas:
+    - Este script usa Path(__file__).parent para resolver rutas
+    - El CWD (current working directory) NO afecta la ejecución
+    - Siempre crea backup automático antes de migrar
+    - Las tablas se crean automáticamente (db.create_all) al importar app
+    - El stock de las ventas se calcula hacia atrás desde el stock actual;
+      los logs conservan el stock registrado al momento del movimiento
+"""
+
+import sys
+from pathlib import Path
+
+# ============================================================================
+# RESOLUCIÓN DE PATHS (NUNCA usar rutas relativas simples)
+# ============================================================================
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+DB_PATH = PROJECT_ROOT / 'instance' / 'app.db'
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# ============================================================================
+# FUNCIONES AUXILIARES
+# ============================================================================
+
+def create_backup():
+    """Crea backup de la base de datos antes de migrar (instance/backups/).
+
+    Returns:
+        str: Nombre del backup creado, o None si falla
+    """
+    if not DB_PATH.exists():
+        print(f"[ERROR] Base de datos no encontrada: {DB_PATH}")
+        return None
+
+    from config import Config
+    from utils.backup import make_store
+
+    try:
+        backup = make_store(Config, str(DB_PATH.parent)).snapshot(
+            str(DB_PATH), label='rebuild_stock_ledger'
+        )
+        print(f"[OK] Backup creado: {backup['name']}")
+        return backup['name']
+    except Exception as e:
+        print(f"[ERROR] No se pudo crear backup: {e}")
+        return None
+
+# ============================================================================
+# MIGRACIÓN PRINCIPAL
+# ============================================================================
+
+def run_migration(product_ids=None):
+    """Reconstruye el libro de stock.
+
+    Args:
+        product_ids: Lista de IDs a reconstruir o None para todos
+
+    Returns:
+        bool: True si exitosa, False si falla
+    """
+    print("\n" + "="*60)
+    print("RECONSTRUCCIÓN DEL LIBRO DE STOCK")
+    print("="*60)
+    print(f"[INFO] Base de datos: {DB_PATH}")
+
+    if not create_backup():
+        return False
+
+    from app import app
+    from extensions import db
+    from utils.stock_ledger import rebuild_stock_ledger
+
+    with app.app_context():
+        try:
+            scope = f"{len(product_ids)} productos" if product_ids else "todos los productos"
+            print(f"[INFO] Reconstruyendo {scope}...")
+
+            rows = rebuild_stock_ledger(product_ids)
+            db.session.commit()
+
+            print(f"[OK] Libro reconstruido: {rows} movimientos")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Error reconstruyendo libro: {e}")
+            return False
+
+# ============================================================================
+# PUNTO DE ENTRADA
+# ============================================================================
+
+if __name__ == '__main__':
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    success = run_migration(ids)
+
+    if success:
+        print("\n[OK] RECONSTRUCCIÓN COMPLETADA EXITOSAMENTE")
+        exit(0)
+    else:
+        print("\n[ERROR] RECONSTRUCCIÓN FALLIDA")
+        exit(1)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Reconciliación: Saldos de notas de crédito y saldo a favor de clientes
+
+Recalcula desde credit_note_application:
+    - invoice.remaining_balance de cada NC = total - SUM(aplicaciones)
+    - customer.credit_balance = SUM(remaining_balance) de sus NC
+
+Los saldos se mantienen en cada venta/NC (utils/credit_notes.py); este
+script detecta (y con --fix corrige) descuadres causados por SQL directo,
+restauraciones parciales o versiones anteriores.
+
+Ejecución:
+    # Desde raíz del proyecto (RECOMENDADO):
+    python migrations/reconcile_credit_notes.py          # solo reporta
+    python migrations/reconcile_credit_notes.py --fix    # backup + corrige
+
+Notas:
+    - Este script usa Path(__file__).parent para resolver rutas
+    - El CWD (current working directory) NO afecta la ejecución
+    - Con --fix siempre crea backup automático antes de corregir
+    - Código de salida 1 si hay descuadres sin corregir
+"""
+
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+from datetime import datetime
+
+# ============================================================================
+# RESOLUCIÓN DE PATHS (NUNCA usar rutas relativas simples)
+# ============================================================================
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+DB_PATH = PROJECT_ROOT / 'instance' / 'app.db'
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# ============================================================================
+# FUNCIONES AUXILIARES
+# ============================================================================
+
+def create_backup():
+    """Crea backup de la base de datos antes de corregir.
+
+    Usa la API de backup de SQLite: copia consistente aunque la app esté
+    escribiendo (modo WAL).
+
+    Returns:
+        Path: Ruta del backup creado, o None si falla
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    backup_path = PROJECT_ROOT / 'instance' / f'app_backup_{timestamp}.db'
+
+    if not DB_PATH.exists():
+        print(f"[ERROR] Base de datos no encontrada: {DB_PATH}")
+        return None
+
+    try:
+        source = sqlite3.connect(DB_PATH, timeout=30)
+        target = sqlite3.connect(backup_path)
+        with target:
+            source.backup(target)
+        target.close()
+        source.close()
+        print(f"[OK] Backup creado: {backup_path}")
+        return backup_path
+    except Exception as e:
+        print(f"[ERROR] No se pudo crear backup: {e}")
+        return None
+
+
+def _money(value):
+    return 'NULL' if value is None else f"${value:,.0f}"
+
+# ============================================================================
+# RECONCILIACIÓN PRINCIPAL
+# ============================================================================
+
+def run_reconciliation(fix=False):
+    """Reporta (y opcionalmente corrige) saldos descuadrados.
+
+    Args:
+        fix: Corrige los saldos tras crear backup
+
+    Returns:
+        bool: True si no quedan descuadres
+    """
+    print("\n" + "="*60)
+    print("RECONCILIACIÓN DE SALDOS DE NOTAS DE CRÉDITO")
+    print("="*60)
+    print(f"[INFO] Base de datos: {DB_PATH}")
+
+    if fix and not create_backup():
+        return False
+
+    from app import app
+    from extensions import db
+    from utils.credit_notes import reconcile_credit_notes
+
+    with app.app_context():
+        try:
+            result = reconcile_credit_notes(fix=fix)
+
+            for number, stored, expected in result['credit_notes']:
+                print(f"[WARNING] NC {number}: saldo {_money(stored)}, esperado {_money(expected)}")
+            for customer_id, name, stored, expected in result['customers']:
+                print(f"[WARNING] Cliente {customer_id} ({name}): saldo a favor "
+                      f"{_money(stored)}, esperado {_money(expected)}")
+
+            mismatches = len(result['credit_notes']) + len(result['customers'])
+            if not mismatches:
+                print("[OK] Todos los saldos cuadran")
+                return True
+
+            if not fix:
+                print(f"[INFO] {mismatches} descuadres. Ejecute con --fix para corregir")
+                return False
+
+            db.session.commit()
+            print(f"[OK] {mismatches} saldos corregidos")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Error en reconciliación: {e}")
+            return False
+
+# ============================================================================
+# PUNTO DE ENTRADA
+# ============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconcilia saldos de notas de crédito')
+    parser.add_argument('--fix', action='store_true', help='Corrige los saldos descuadrados (con backup)')
+    args = parser.parse_args()
+
+    success = run_reconciliation(fix=args.fix)
+
+    if success:
+        print("\n[OK] RECONCILIACIÓN COMPLETADA")
+        exit(0)
+    else:
+        print("\n[ERROR] HAY SALDOS DESCUADRADOS")
+        exit(1)
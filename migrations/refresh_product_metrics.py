@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Comando: Recalcula las métricas de inventario de todo el catálogo
+(product_metrics: velocidad de ventas, días hasta agotarse, rotación,
+promedio mensual, meses con ventas, última venta).
+
+La aplicación las recalcula sola una vez por día local en segundo plano
+(utils/product_metrics.py, PRODUCT_METRICS_NIGHTLY); este script sirve para
+forzar el cálculo o programarlo externamente (cron / Programador de tareas
+de Windows) con PRODUCT_METRICS_NIGHTLY = False.
+
+Ejecución:
+    # Desde raíz del proyecto (RECOMENDADO):
+    python migrations/refresh_product_metrics.py
+
+    # Mostrar además los productos que se agotan en N días o menos:
+    python migrations/refresh_product_metrics.py --stockout 15
+
+Notas:
+    - Este script usa Path(__file__).parent para resolver rutas
+    - El CWD (current working directory) NO afecta la ejecución
+    - Solo reescribe product_metrics (datos derivados): no crea backup
+    - Las tablas se crean automáticamente (db.create_all) al importar app
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# ============================================================================
+# RESOLUCIÓN DE PATHS (NUNCA usar rutas relativas simples)
+# ============================================================================
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+DB_PATH = PROJECT_ROOT / 'instance' / 'app.db'
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# ============================================================================
+# COMANDO PRINCIPAL
+# ============================================================================
+
+def run_refresh(stockout_days=None):
+    """Recalcula product_metrics y opcionalmente lista los próximos agotados.
+
+    Args:
+        stockout_days: Mostrar productos que se agotan en estos días o menos
+
+    Returns:
+        bool: True si exitoso, False si falla
+    """
+    print("\n" + "="*60)
+    print("MÉTRICAS DE INVENTARIO POR PRODUCTO")
+    print("="*60)
+    print(f"[INFO] Base de datos: {DB_PATH}")
+
+    if not DB_PATH.exists():
+        print(f"[ERROR] Base de datos no encontrada: {DB_PATH}")
+        return False
+
+    from datetime import datetime
+
+    from app import app
+    from extensions import db
+    from models.models import Product, ProductMetrics
+    from utils.product_metrics import refresh_product_metrics
+
+    with app.app_context():
+        try:
+            started = datetime.utcnow()
+            count = refresh_product_metrics(started)
+            db.session.commit()
+            elapsed = (datetime.utcnow() - started).total_seconds()
+            print(f"[OK] Métricas calculadas: {count} productos ({elapsed:.2f}s)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Error calculando métricas: {e}")
+            return False
+
+        if stockout_days is not None:
+            rows = db.session.query(Product.code, Product.name, ProductMetrics)\
+                .join(ProductMetrics, Product.id == ProductMetrics.product_id)\
+                .filter(ProductMetrics.days_until_stockout <= stockout_days)\
+                .order_by(ProductMetrics.days_until_stockout.asc()).all()
+
+            print(f"\n[INFO] Se agotan en {stockout_days} días o menos: {len(rows)} productos")
+            if rows:
+                print(f"\n{'Código':<15} {'Producto':<40} {'Stock':>6} {'Und/día':>8} {'Días':>6}")
+                print("-" * 80)
+                for code, name, metrics in rows:
+                    print(f"{code:<15} {name[:40]:<40} {metrics.stock:>6} "
+                          f"{metrics.sales_velocity:>8.2f} {metrics.days_until_stockout:>6.1f}")
+
+    return True
+
+# ============================================================================
+# PUNTO DE ENTRADA
+# ============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recalcula product_metrics de Green-POS')
+    parser.add_argument('--stockout', type=int, metavar='DIAS',
+                        help='Lista los productos que se agotan en DIAS o menos')
+    args = parser.parse_args()
+
+    success = run_refresh(args.stockout)
+
+    if success:
+        print("\n[OK] CÁLCULO COMPLETADO EXITOSAMENTE")
+        exit(0)
+    else:
+        print("\n[ERROR] CÁLCULO FALLIDO")
+        exit(1)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Backups: listar, verificar, podar y restaurar la cadena de instance/backups/
+
+Los backups son completos comprimidos + incrementales por página
+(utils/backup_store.py). Restaurar un incremental reconstruye la imagen
+desde su completo aplicando cada incremental de la cadena.
+
+Ejecución:
+    # Desde raíz del proyecto (RECOMENDADO):
+    python migrations/restore_backup.py list
+    python migrations/restore_backup.py verify [NOMBRE | --all]
+    python migrations/restore_backup.py prune
+    python migrations/restore_backup.py restore NOMBRE [--to RUTA] [--yes]
+
+Notas:
+    - Este script usa Path(__file__).parent para resolver rutas
+    - El CWD (current working directory) NO afecta la ejecución
+    - restore sin --to reemplaza instance/app.db: DETENER la aplicación antes
+    - Antes de reemplazar app.db se crea un backup de la base actual
+    - La imagen restaurada se verifica (sha256 + PRAGMA integrity_check)
+      antes de reemplazar la base
+    - Código de salida 1 si algo falla
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+# ============================================================================
+# RESOLUCIÓN DE PATHS (NUNCA usar rutas relativas simples)
+# ============================================================================
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+DB_PATH = PROJECT_ROOT / 'instance' / 'app.db'
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config import Config
+from utils.backup import make_store
+from utils.backup_store import BackupError
+
+# ============================================================================
+# FUNCIONES AUXILIARES
+# ============================================================================
+
+def _store():
+    return make_store(Config, str(DB_PATH.parent))
+
+
+def _size(num_bytes):
+    return f"{num_bytes / (1024 * 1024):.1f} MB" if num_bytes >= 1024 * 1024 else f"{num_bytes / 1024:.0f} KB"
+
+
+def _integrity_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        rows = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+    return rows == ['ok'], '; '.join(rows[:5])
+
+# ============================================================================
+# COMANDOS
+# ============================================================================
+
+def list_backups():
+    """Lista los backups con su tipo, padre y tamaño."""
+    store = _store()
+    entries = store.entries()
+    print(f"[INFO] Directorio: {store.directory}")
+    if not entries:
+        print("[INFO] No hay backups")
+        return True
+
+    print(f"\n{'Nombre':<28} {'Tipo':<5} {'Fecha':<20} {'Páginas':>15} {'Tamaño':>10}  Motivo")
+    print("-" * 100)
+    stored_total = 0
+    for entry in entries:
+        stored_total += entry['stored_size']
+        pages = f"{entry['pages_written']}/{entry['page_count']}"
+        print(f"{entry['name']:<28} {entry['kind']:<5} {entry['created_at']:<20} "
+              f"{pages:>15} {_size(entry['stored_size']):>10}  {entry.get('label') or ''}")
+    print("-" * 100)
+    print(f"[INFO] {len(entries)} backups, {_size(stored_total)} en disco "
+          f"(base actual: {_size(entries[-1]['image_size'])})")
+    return True
+
+
+def verify_backups(name=None, verify_all=False):
+    """Restaura en temporal y ejecuta integrity_check (último, uno o todos)."""
+    store = _store()
+    entries = store.entries()
+    if not entries:
+        print("[ERROR] No hay backups")
+        return False
+
+    if verify_all:
+        names = [entry['name'] for entry in entries]
+    else:
+        names = [name or entries[-1]['name']]
+
+    success = True
+    for backup_name in names:
+        ok, message = store.verify(backup_name)
+        if ok:
+            print(f"[OK] {backup_name}: integrity_check ok")
+        else:
+            print(f"[ERROR] {backup_name}: {message}")
+            success = False
+    return success
+
+
+def prune_backups():
+    """Aplica la política de retención diaria/semanal/mensual."""
+    store = _store()
+    removed = store.prune()
+    for name in removed:
+        print(f"[INFO] Eliminado: {name}")
+    print(f"[OK] {len(removed)} backups eliminados, {len(store.entries())} conservados")
+    return True
+
+
+def restore(name, target=None, assume_yes=False):
+    """Restaura un backup en `target` o reemplaza instance/app.db.
+
+    Args:
+        name: Nombre del backup (ver list)
+        target: Ruta destino; None reemplaza la base de la aplicación
+        assume_yes: No pedir confirmación
+
+    Returns:
+        bool: True si la restauración terminó
+    """
+    store = _store()
+    target_path = Path(target) if target else DB_PATH
+    replacing_live = target_path.resolve() == DB_PATH.resolve()
+
+    try:
+        chain = store.chain(name)
+    except BackupError as e:
+        print(f"[ERROR] {e}")
+        return False
+
+    print(f"[INFO] Backup: {name} ({chain[-1]['created_at']})")
+    print(f"[INFO] Cadena: {' -> '.join(entry['name'] for entry in chain)}")
+    print(f"[INFO] Destino: {target_path}")
+
+    if replacing_live and not assume_yes:
+        print("[WARNING] Se reemplazará la base de datos de la aplicación (debe estar detenida)")
+        respuesta = input("¿Continuar? (si/NO): ").strip().lower()
+        if respuesta != 'si':
+            print("[INFO] Restauración cancelada")
+            return False
+
+    # Paso 1: Reconstruir en un temporal junto al destino y verificar
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target_path.with_name(f'.{target_path.name}.restoring')
+    try:
+        store.restore(name, str(temp_path))
+        ok, message = _integrity_check(str(temp_path))
+        if not ok:
+            raise BackupError(f"integrity_check falló: {message}")
+        print("[OK] Imagen reconstruida y verificada")
+
+        # Paso 2: Backup de la base actual antes de reemplazarla
+        if replacing_live and DB_PATH.exists():
+            current = store.snapshot(str(DB_PATH), label=f'antes de restaurar {name}')
+            print(f"[OK] Base actual respaldada: {current['name']}")
+
+        # Paso 3: Reemplazar (el WAL/SHM viejos no corresponden a la imagen nueva)
+        for suffix in ('-wal', '-shm'):
+            stale = Path(str(target_path) + suffix)
+            if stale.exists():
+                stale.unlink()
+        os.replace(temp_path, target_path)
+        print(f"[OK] Restaurado en {target_path}")
+        return True
+    except (BackupError, OSError, EOFError, sqlite3.Error) as e:
+        print(f"[ERROR] Restauración fallida: {e}")
+        return False
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            leftover = Path(str(temp_path) + suffix)
+            if leftover.exists():
+                leftover.unlink()
+
+# ============================================================================
+# PUNTO DE ENTRADA
+# ============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backups comprimidos/incrementales de Green-POS')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('list', help='Lista los backups')
+
+    verify_parser = commands.add_parser('verify', help='Verifica backups con integrity_check')
+    verify_parser.add_argument('name', nargs='?', help='Backup a verificar (default: el último)')
+    verify_parser.add_argument('--all', action='store_true', help='Verifica todos los backups')
+
+    commands.add_parser('prune', help='Elimina backups fuera de la retención')
+
+    restore_parser = commands.add_parser('restore', help='Restaura un backup')
+    restore_parser.add_argument('name', help='Backup a restaurar (ver list)')
+    restore_parser.add_argument('--to', help='Ruta destino (default: instance/app.db)')
+    restore_parser.add_argument('--yes', action='store_true', help='No pedir confirmación')
+
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        success = list_backups()
+    elif args.command == 'verify':
+        success = verify_backups(args.name, args.all)
+    elif args.command == 'prune':
+        success = prune_backups()
+    else:
+        success = restore(args.name, args.to, args.yes)
+
+    exit(0 if success else 1)
@@ -90,7 +90,7 @@ class Product(db.Model):
     stock = db.Column(db.Integer, default=0)
     stock_min = db.Column(db.Integer, nullable=True, default=None)
     stock_warning = db.Column(db.Integer, nullable=True, default=None)
-    category = db.Column(db.String(50))
+    category = db.Column(db.String(50), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -110,42 +110,35 @@ class Product(db.Model):
         return f"<Product {self.name}>"
     
     def get_all_codes(self):
-        """Retorna lista de todos los códigos del producto (principal + alternativos)."""
-        codes = [{'code': self.code, 'type': 'principal', 'is_primary': True}]
+        """Retorna lista de todos los códigos del producto (principal + alternativos).
         
-        # Agregar códigos alternativos
-        for alt_code in self.alternative_codes.all():
-            codes.append({
-                'code': alt_code.code,
-                'type': alt_code.code_type,
-                'is_primary': False,
-                'notes': alt_code.notes
-            })
+        Para varios productos usar utils.product_codes.assemble_all_codes, que
+        carga los códigos de todos en una sola consulta.
+        """
+        from utils.product_codes import assemble_all_codes
         
-        return codes
+        return assemble_all_codes([self])[self.id]
     
     @staticmethod
     def search_by_any_code(code_query):
         """Busca producto por código principal o alternativo.
         
+        Usa el índice de códigos en memoria (utils/code_index.py), el mismo
+        que consume el lector de código de barras del POS.
+        
         Args:
             code_query: Código a buscar
             
         Returns:
             Product o None si no se encuentra
         """
-        # Buscar por código principal
-        product = Product.query.filter_by(code=code_query).first()
-        if product:
-            return product
+        from utils.code_index import CODE_INDEX
         
-        # Buscar en códigos alternativos
-        from models.models import ProductCode
-        alt_code = ProductCode.query.filter_by(code=code_query).first()
-        if alt_code:
-            return alt_code.product
+        product_id = CODE_INDEX.lookup(code_query)
+        if product_id is None:
+            return None
         
-        return None
+        return db.session.get(Product, product_id)
 
 class Customer(db.Model):
     __tablename__ = 'customer'
@@ -170,7 +163,7 @@ class Pet(db.Model):
     __tablename__ = 'pet'
     
     id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False, index=True)
     name = db.Column(db.String(80), nullable=False)
     species = db.Column(db.String(40), default='Perro')
     breed = db.Column(db.String(80))
@@ -200,22 +193,30 @@ class Invoice(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     number = db.Column(db.String(30), unique=True, nullable=False)
     document_type = db.Column(db.String(20), default='invoice', nullable=False, index=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    date = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    date = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
     subtotal = db.Column(db.Float, default=0.0)
     tax = db.Column(db.Float, default=0.0)
     discount = db.Column(db.Float, default=0.0)
     total = db.Column(db.Float, default=0.0)
-    status = db.Column(db.String(20), default='pending')
+    status = db.Column(db.String(20), default='pending', index=True)
     payment_method = db.Column(db.String(50), default='cash')
     notes = db.Column(db.Text)
     reference_invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=True)
     credit_reason = db.Column(db.Text, nullable=True)
     stock_restored = db.Column(db.Boolean, default=False)
+    # Saldo sin aplicar de una NC (NULL en facturas); ver utils/credit_notes.py
+    remaining_balance = db.Column(db.Float, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Índice parcial: solo NC con saldo, en orden FIFO por cliente
+        db.Index('ix_invoice_credit_note_open', 'customer_id', 'date',
+                 sqlite_where=db.text("document_type = 'credit_note' AND remaining_balance > 0")),
+    )
+    
     items = db.relationship('InvoiceItem', backref='invoice', lazy=True, cascade="all, delete-orphan")
     user = db.relationship('User')
     reference_invoice = db.relationship('Invoice', 
@@ -243,8 +244,11 @@ class Invoice(db.Model):
             return self.total - nc_total
         return self.total
 
-    def calculate_totals(self):
-        self.subtotal = sum(item.quantity * item.price for item in self.items)
+    def calculate_totals(self, items=None):
+        """Calcula subtotal, IVA y total (items: por defecto self.items)."""
+        if items is None:
+            items = self.items
+        self.subtotal = sum(item.quantity * item.price for item in items)
         setting = Setting.query.first()
         rate = 0.0
         if setting and setting.iva_responsable:
@@ -309,9 +313,9 @@ class Appointment(db.Model):
     consent_text = db.Column(db.Text)
     consent_signed = db.Column(db.Boolean, default=False)
     consent_signed_at = db.Column(db.DateTime)
-    status = db.Column(db.String(20), default='pending')
+    status = db.Column(db.String(20), default='pending', index=True)
     total_price = db.Column(db.Float, default=0.0)
-    scheduled_at = db.Column(db.DateTime)
+    scheduled_at = db.Column(db.DateTime, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -331,8 +335,8 @@ class InvoiceItem(db.Model):
     __tablename__ = 'invoice_item'
     
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False, default=1)
     price = db.Column(db.Float, nullable=False)
     discount = db.Column(db.Float, default=0.0)
@@ -349,7 +353,7 @@ class PetService(db.Model):
     pet_id = db.Column(db.Integer, db.ForeignKey('pet.id'), nullable=False)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'))
-    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'))
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'), index=True)
     service_type = db.Column(db.String(30), default='bath')
     description = db.Column(db.Text)
     price = db.Column(db.Float, default=0.0)
@@ -473,6 +477,11 @@ class User(UserMixin, db.Model):
 class ProductStockLog(db.Model):
     """Registro de movimientos de inventario (ingresos, egresos y conteos físicos)"""
     __tablename__ = 'product_stock_log'
+    __table_args__ = (
+        # Historial de stock por producto y conteos de inventario por fecha
+        db.Index('ix_product_stock_log_product_id_created_at', 'product_id', 'created_at'),
+        db.Index('ix_product_stock_log_is_inventory_created_at', 'is_inventory', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -492,6 +501,56 @@ class ProductStockLog(db.Model):
         return f"<ProductStockLog {self.id} product={self.product_id} qty={self.quantity}>"
 
 
+class StockLedger(db.Model):
+    """Libro de movimientos de stock por producto (solo inserción).
+
+    Cada fila guarda el stock resultante (balance) leído en la misma
+    transacción que lo modificó y los contadores acumulados del producto
+    hasta ese movimiento: las estadísticas del historial son una lectura de
+    la última fila (ver utils/stock_ledger.py).
+
+    Movimientos (movement):
+    - 'sale': venta (quantity negativo)
+    - 'sale_deleted': eliminación de venta (stock devuelto)
+    - 'credit_note': devolución por nota de crédito
+    - 'adjustment': ajuste manual desde el formulario de producto
+    - 'inventory': conteo físico (quantity = diferencia, puede ser 0)
+    - 'merge': consolidación de productos
+    - 'initial': stock inicial al crear el producto
+    """
+    __tablename__ = 'stock_ledger'
+    __table_args__ = (
+        # Orden del libro por producto: (created_at, id)
+        db.Index('ix_stock_ledger_product_id_created_at', 'product_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    movement = db.Column(db.String(20), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)  # Con signo: + entra, - sale
+    balance = db.Column(db.Integer, nullable=False)   # Stock después del movimiento
+    reference = db.Column(db.String(50))               # Número de documento (ventas/NC)
+    reason = db.Column(db.Text)
+
+    # Contadores acumulados del producto hasta este movimiento
+    units_purchased = db.Column(db.Integer, nullable=False, default=0)
+    units_sold = db.Column(db.Integer, nullable=False, default=0)
+    units_returned = db.Column(db.Integer, nullable=False, default=0)
+    units_lost = db.Column(db.Integer, nullable=False, default=0)
+    last_sale_at = db.Column(db.DateTime)
+
+    user = db.relationship('User')
+
+    @property
+    def previous_balance(self):
+        return self.balance - self.quantity
+
+    def __repr__(self):
+        return f"<StockLedger {self.id} product={self.product_id} {self.movement} {self.quantity:+d}>"
+
+
 class ProductCode(db.Model):
     """Códigos alternativos de productos para soportar consolidación.
     
@@ -558,3 +617,194 @@ class CreditNoteApplication(db.Model):
     def __repr__(self):
         return f'<CreditNoteApplication NC={self.credit_note_id} Invoice={self.invoice_id} ${self.amount_applied}>'
 
+
+
+class ProductSalesStats(db.Model):
+    """Contadores de ventas acumulados por producto.
+    
+    Mantenidos incrementalmente en la misma transacción que las escrituras de
+    facturas (ver utils/sales_stats.py). Reconstruibles desde el historial con
+    migrations/rebuild_product_sales_stats.py.
+    
+    Reglas:
+    - Facturas (document_type='invoice') no canceladas suman
+    - Notas de crédito (document_type='credit_note') no canceladas restan
+    - last_sale_at: fecha (UTC) de la última factura no cancelada con el producto
+    """
+    __tablename__ = 'product_sales_stats'
+    
+    product_id = db.Column(db.Integer, 
+                          db.ForeignKey('product.id', ondelete='CASCADE'), 
+                          primary_key=True)
+    units_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    last_sale_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    product = db.relationship('Product', 
+                             backref=db.backref('sales_stats', uselist=False, 
+                                              cascade='all, delete-orphan'))
+    
+    def __repr__(self):
+        return f'<ProductSalesStats product={self.product_id} units={self.units_sold}>'
+
+
+class ProductSalesMonthly(db.Model):
+    """Ventas por producto y mes (mes calendario en hora de Colombia, 'YYYY-MM')."""
+    __tablename__ = 'product_sales_monthly'
+    
+    product_id = db.Column(db.Integer, 
+                          db.ForeignKey('product.id', ondelete='CASCADE'), 
+                          primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)
+    units_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    
+    product = db.relationship('Product', 
+                             backref=db.backref('sales_monthly', lazy='dynamic', 
+                                              cascade='all, delete-orphan'))
+    
+    def __repr__(self):
+        return f'<ProductSalesMonthly product={self.product_id} {self.month} units={self.units_sold}>'
+
+
+class ProductMetrics(db.Model):
+    """Métricas de inventario por producto precalculadas en lote.
+
+    Calculadas para todo el catálogo por utils/product_metrics.py (tarea
+    nocturna en segundo plano o migrations/refresh_product_metrics.py).
+    Mismas fórmulas que el historial de stock del producto.
+
+    - sales_velocity: unidades vendidas por día en los últimos 30 días
+    - days_until_stockout: stock / velocidad al momento del cálculo
+      (NULL si no hubo ventas en la ventana)
+    - inventory_turnover: vendido neto / stock (NULL si stock <= 0)
+    """
+    __tablename__ = 'product_metrics'
+
+    product_id = db.Column(db.Integer,
+                          db.ForeignKey('product.id', ondelete='CASCADE'),
+                          primary_key=True)
+    stock = db.Column(db.Integer, nullable=False, default=0)
+    sales_velocity = db.Column(db.Float, nullable=False, default=0.0)
+    days_until_stockout = db.Column(db.Float, nullable=True, index=True)
+    inventory_turnover = db.Column(db.Float, nullable=True)
+    net_sold = db.Column(db.Integer, nullable=False, default=0)
+    avg_monthly_sales = db.Column(db.Float, nullable=False, default=0.0)
+    months_with_sales = db.Column(db.Integer, nullable=False, default=0)
+    last_sale_at = db.Column(db.DateTime, nullable=True)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    product = db.relationship('Product',
+                             backref=db.backref('metrics', uselist=False,
+                                              cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<ProductMetrics product={self.product_id} velocity={self.sales_velocity:.2f}>'
+
+
+class SalesRollupHourly(db.Model):
+    """Ventas agregadas por hora local de Colombia (day='YYYY-MM-DD', hour=0-23).
+    
+    Mantenidas incrementalmente en cada escritura de facturas (ver
+    utils/sales_rollups.py). Reconstruibles con migrations/backfill_sales_rollups.py.
+    
+    - invoice_*: facturas no canceladas
+    - credit_note_*: notas de crédito no canceladas (se restan en reportes)
+    - profit: utilidad neta de items (facturas - NC) con precio de compra al momento de escribir
+    """
+    __tablename__ = 'sales_rollup_hourly'
+    
+    day = db.Column(db.String(10), primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True)
+    invoice_count = db.Column(db.Integer, nullable=False, default=0)
+    invoice_total = db.Column(db.Float, nullable=False, default=0.0)
+    credit_note_count = db.Column(db.Integer, nullable=False, default=0)
+    credit_note_total = db.Column(db.Float, nullable=False, default=0.0)
+    profit = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<SalesRollupHourly {self.day} {self.hour:02d}h>'
+
+
+class SalesRollupDaily(db.Model):
+    """Ventas agregadas por día local de Colombia (mismas métricas que SalesRollupHourly)."""
+    __tablename__ = 'sales_rollup_daily'
+    
+    day = db.Column(db.String(10), primary_key=True)
+    invoice_count = db.Column(db.Integer, nullable=False, default=0)
+    invoice_total = db.Column(db.Float, nullable=False, default=0.0)
+    credit_note_count = db.Column(db.Integer, nullable=False, default=0)
+    credit_note_total = db.Column(db.Float, nullable=False, default=0.0)
+    profit = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<SalesRollupDaily {self.day}>'
+
+
+class SalesRollupPayment(db.Model):
+    """Documentos y total neto por día local y método de pago (NC restan)."""
+    __tablename__ = 'sales_rollup_payment'
+    
+    day = db.Column(db.String(10), primary_key=True)
+    payment_method = db.Column(db.String(50), primary_key=True)
+    document_count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<SalesRollupPayment {self.day} {self.payment_method}>'
+
+
+class SalesRollupProduct(db.Model):
+    """Unidades, ingresos y utilidad netos por día local y producto."""
+    __tablename__ = 'sales_rollup_product'
+    
+    day = db.Column(db.String(10), primary_key=True)
+    product_id = db.Column(db.Integer, 
+                          db.ForeignKey('product.id', ondelete='CASCADE'), 
+                          primary_key=True, 
+                          index=True)
+    units_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    profit = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<SalesRollupProduct {self.day} product={self.product_id}>'
+
+
+class DocumentSequence(db.Model):
+    """Consecutivo de documentos con asignación atómica (ver utils/numbering.py).
+    
+    - name: 'invoice' (facturas y notas de crédito comparten numeración)
+    - next_value: próximo número a asignar; se incrementa con
+      UPDATE ... RETURNING dentro de la transacción del documento
+    
+    Reemplaza a Setting.next_invoice_number, que solo se usa como valor
+    inicial al crear la secuencia en bases existentes.
+    """
+    __tablename__ = 'document_sequence'
+    
+    name = db.Column(db.String(30), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DocumentSequence {self.name} next={self.next_value}>'
+
+
+class DocumentNumberBlock(db.Model):
+    """Bloque de números pre-reservado por una terminal (opcional).
+    
+    Con INVOICE_NUMBER_BLOCK_SIZE > 1 cada terminal (TERMINAL_ID) toma números
+    de su propio bloque [next_value, last_value] y solo toca document_sequence
+    al agotarlo.
+    """
+    __tablename__ = 'document_number_block'
+    
+    terminal = db.Column(db.String(50), primary_key=True)
+    sequence = db.Column(db.String(30), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+    last_value = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<DocumentNumberBlock {self.terminal} {self.sequence} {self.next_value}-{self.last_value}>'
@@ -5,16 +5,23 @@ DEBUG MODE: Activado para investigación de issues de búsqueda.
 """
 
 from flask import Blueprint, jsonify, request, current_app
-from flask_login import login_required
+from flask_login import login_required, current_user
 from sqlalchemy import or_
 
 from extensions import db
 from models.models import Product, Pet, ProductCode, Customer, Invoice
 from utils.decorators import role_required
+from utils.product_search import search_product_ids
+from utils.code_index import CODE_INDEX
+from utils.product_codes import product_search_payload
+from utils.checkout import CheckoutError, parse_lines, create_sale
 
 # Crear Blueprint
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+# Máximo de productos por petición a /api/products/batch
+BATCH_LIMIT = 200
+
 
 # ==================== PRICING SUGGESTION HELPERS ====================
 
@@ -56,12 +63,106 @@ def product_details(id):
     return jsonify(result)
 
 
+@api_bp.route('/products/batch', methods=['GET', 'POST'])
+@login_required
+def products_batch():
+    """Resuelve varios productos por ID y/o código en un solo round-trip.
+    
+    Usado por el formulario de ventas para cargar/rehidratar líneas sin una
+    petición por producto. Los códigos se resuelven con el mismo índice en
+    memoria que usa el lector de código de barras (CODE_INDEX) y los
+    productos se cargan con una sola consulta (solo columnas necesarias).
+    
+    Query params (GET) o JSON body (POST):
+        ids: IDs separados por coma (GET) o lista (POST)
+        codes: Códigos separados por coma (GET) o lista (POST)
+        
+    Returns:
+        JSON:
+        {
+            "products": [
+                {"id": 123, "name": "CHURU CAT X4", "code": "855958006662",
+                 "alternative_codes": ["123ABC"], "sale_price": 12700.0, "stock": 50}
+            ],
+            "codes": {"123ABC": 123},          // código solicitado → product_id
+            "missing": {"ids": [999], "codes": ["NOEXISTE"]}
+        }
+        
+    Performance:
+    - Máximo BATCH_LIMIT ids + códigos por petición
+    - ETag por contenido: si precio/stock no cambiaron responde 304
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        raw_ids = data.get('ids') or []
+        codes = [str(c).strip() for c in (data.get('codes') or []) if str(c).strip()]
+    else:
+        raw_ids = request.args.get('ids', '').split(',')
+        codes = [c.strip() for c in request.args.get('codes', '').split(',') if c.strip()]
+    
+    ids = []
+    for raw_id in raw_ids:
+        try:
+            ids.append(int(raw_id))
+        except (TypeError, ValueError):
+            continue
+    
+    if len(ids) + len(codes) > BATCH_LIMIT:
+        return jsonify({
+            'success': False,
+            'message': f'Máximo {BATCH_LIMIT} productos por petición'
+        }), 400
+    
+    # Resolver códigos contra el índice en memoria (sin consultas)
+    resolved_codes = {}
+    missing_codes = []
+    for code in codes:
+        product_id = CODE_INDEX.lookup(code)
+        if product_id is None:
+            missing_codes.append(code)
+        else:
+            resolved_codes[code] = product_id
+    
+    wanted_ids = set(ids) | set(resolved_codes.values())
+    rows = []
+    if wanted_ids:
+        rows = db.session.execute(
+            db.select(Product.id, Product.name, Product.code, Product.sale_price, Product.stock)
+            .where(Product.id.in_(wanted_ids))
+            .order_by(Product.id)
+        ).all()
+    
+    alternative_codes = CODE_INDEX.alternative_codes_by_product()
+    found_ids = {row.id for row in rows}
+    
+    response = jsonify({
+        'products': [{
+            'id': row.id,
+            'name': row.name,
+            'code': row.code,
+            'alternative_codes': alternative_codes.get(row.id, []),
+            'sale_price': float(row.sale_price or 0),
+            'stock': row.stock
+        } for row in rows],
+        'codes': {code: pid for code, pid in resolved_codes.items() if pid in found_ids},
+        'missing': {
+            'ids': sorted(set(ids) - found_ids),
+            'codes': missing_codes + [c for c, pid in resolved_codes.items() if pid not in found_ids]
+        }
+    })
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'  # Stock cambia: revalidar siempre
+    return response.make_conditional(request)
+
+
 @api_bp.route('/products/search')
 @login_required
 def products_search():
     """Búsqueda de productos por nombre o cualquier código.
     
     NUEVO: Soporta búsqueda multi-código (código principal + códigos alternativos)
+    Usa el índice FTS5 (utils/product_search.py) con coincidencia por prefijo
+    y ranking; la búsqueda LIKE queda como fallback.
     
     Query params:
         q: Texto de búsqueda (required)
@@ -95,32 +196,37 @@ def products_search():
     if limit > 50:
         limit = 50  # Máximo 50 resultados para evitar sobrecarga
     
-    # Búsqueda multi-código con DISTINCT
+    # Búsqueda FTS5 por prefijo ordenada por relevancia (nombre + códigos)
     current_app.logger.debug('[API DEBUG]   Ejecutando query SQL...')
     
-    results = db.session.query(Product)\
-        .outerjoin(ProductCode)\
-        .filter(
-            or_(
-                Product.name.ilike(f'%{query}%'),
-                Product.code.ilike(f'%{query}%'),
-                ProductCode.code.ilike(f'%{query}%')
-            )
-        )\
-        .distinct()\
-        .limit(limit)\
-        .all()
+    ranked_ids = search_product_ids(query, limit=limit)
+    
+    if ranked_ids == []:
+        results = []
+    elif ranked_ids is not None:
+        products_by_id = {
+            p.id: p for p in Product.query.filter(Product.id.in_(ranked_ids)).all()
+        }
+        results = [products_by_id[pid] for pid in ranked_ids if pid in products_by_id]
+    else:
+        # Fallback LIKE: sin FTS5, o sin índice trigram y sin coincidencias por prefijo
+        results = db.session.query(Product)\
+            .outerjoin(ProductCode)\
+            .filter(
+                or_(
+                    Product.name.ilike(f'%{query}%'),
+                    Product.code.ilike(f'%{query}%'),
+                    ProductCode.code.ilike(f'%{query}%')
+                )
+            )\
+            .distinct()\
+            .limit(limit)\
+            .all()
     
     current_app.logger.debug(f'[API DEBUG]   Resultados encontrados: {len(results)}')
     
-    response_data = [{
-        'id': p.id,
-        'name': p.name,
-        'code': p.code,
-        'alternative_codes': [ac.code for ac in p.alternative_codes.all()],
-        'sale_price': float(p.sale_price or 0),
-        'stock': p.stock
-    } for p in results]
+    # Códigos alternativos de toda la página en una sola consulta IN
+    response_data = product_search_payload(results)
     
     if response_data:
         current_app.logger.debug(f'[API DEBUG]   Primer resultado: ID={response_data[0]["id"]}, name={response_data[0]["name"]}')
@@ -201,41 +307,57 @@ def customer_details(customer_id):
 @api_bp.route('/products/code-index')
 @login_required
 def products_code_index():
-    """Genera índice de mapeo código → product_id para búsqueda rápida.
+    """Índice de mapeo código → product_id para búsqueda rápida.
     
     Incluye:
     - Código principal de cada producto
     - Todos los códigos alternativos (ProductCode)
     
+    Se sirve desde el índice en memoria (utils/code_index.py), versionado e
+    invalidado por escrituras de Product/ProductCode.
+    
+    Query params:
+        since: Versión que ya tiene el cliente (opcional). Si el historial la
+               cubre, retorna solo los cambios; si no, el índice completo.
+    
     Returns:
-        JSON object con estructura:
+        JSON completo:
         {
-            "7707205153052": 123,  // code → product_id
-            "LEGACY_CODE_1": 123,
-            "EAN_CODE": 456,
-            ...
+            "version": 1731000000123,
+            "full": true,
+            "codes": {"7707205153052": 123, "LEGACY_CODE_1": 123, ...}
+        }
+        
+        JSON delta (?since=<version>):
+        {
+            "version": 1731000000125,
+            "full": false,
+            "added": {"NEW_CODE": 456},
+            "changed": {"MOVED_CODE": 789},
+            "removed": ["OLD_CODE"]
         }
         
     Performance:
-    - Payload: ~30-50KB para 500 productos con 2-3 códigos cada uno
-    - Cache-Control: max-age=300 (5 minutos)
+    - ETag por versión: revalidaciones sin cambios responden 304 sin cuerpo
+    - El payload completo se serializa una sola vez por versión
     """
-    # Construir índice de códigos
-    code_index = {}
-    
-    # 1. Agregar códigos principales de productos
-    products = Product.query.all()
-    for product in products:
-        code_index[product.code] = product.id
-    
-    # 2. Agregar códigos alternativos
-    alt_codes = ProductCode.query.all()
-    for alt_code in alt_codes:
-        code_index[alt_code.code] = alt_code.product_id
-    
-    # 3. Retornar con cache headers
-    response = jsonify(code_index)
-    response.headers['Cache-Control'] = 'public, max-age=300'  # 5 minutos
+    since = request.args.get('since', type=int)
+    version = CODE_INDEX.version
+    
+    delta = CODE_INDEX.changes_since(since) if since is not None else None
+    etag = f'{version}-{since}' if delta is not None else str(version)
+    
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    elif delta is not None:
+        response = jsonify({'version': version, 'full': False, **delta})
+    else:
+        response = current_app.response_class(
+            CODE_INDEX.full_json(), mimetype='application/json'
+        )
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'  # Revalidar siempre (304 si no cambió)
     return response
 
 
@@ -333,6 +455,75 @@ def pricing_suggest():
 
 # ==================== INVOICE ENDPOINTS ====================
 
+@api_bp.route('/invoices', methods=['POST'])
+@login_required
+def create_invoice():
+    """Registra una venta desde JSON (mismo servicio que el formulario de ventas).
+    
+    JSON body:
+        {
+            "customer_id": 1,
+            "payment_method": "cash",
+            "notes": "opcional",
+            "items": [{"product_id": 123, "quantity": 2, "price": 12700}]
+        }
+    
+    Los pagos con nota de crédito ('credit_note', 'mixed') requieren el
+    formulario de ventas, que aplica los saldos a favor del cliente.
+        
+    Returns:
+        JSON con:
+        {
+            "success": true,
+            "invoice": {"id": 45, "number": "INV-000045", "total": 25400.0, "status": "pending"},
+            "warnings": ["CHURU quedará con stock negativo (-1)"]
+        }
+        
+    Códigos de estado:
+        201: Venta creada
+        400: Datos inválidos (cliente, método de pago o items)
+        500: Error interno del servidor
+    """
+    data = request.get_json(silent=True) or {}
+    payment_method = data.get('payment_method') or 'cash'
+    if payment_method in ('credit_note', 'mixed'):
+        return jsonify({
+            'success': False,
+            'message': 'Pagos con nota de crédito solo desde el formulario de ventas'
+        }), 400
+    
+    customer_id = data.get('customer_id')
+    if not customer_id or db.session.get(Customer, customer_id) is None:
+        return jsonify({'success': False, 'message': 'Cliente no encontrado'}), 400
+    
+    try:
+        lines = parse_lines(data.get('items'))
+        invoice, warnings = create_sale(customer_id, payment_method, lines, current_user.id,
+                                        data.get('notes', ''))
+        db.session.commit()
+    except CheckoutError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error creating invoice via API: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Error al crear venta: {str(e)}'
+        }), 500
+    
+    return jsonify({
+        'success': True,
+        'invoice': {
+            'id': invoice.id,
+            'number': invoice.number,
+            'total': invoice.total,
+            'status': invoice.status
+        },
+        'warnings': warnings
+    }), 201
+
+
 @api_bp.route('/invoices/validate/<int:id>', methods=['POST'])
 @role_required('admin')
 def validate_invoice(id):
@@ -10,7 +10,8 @@ from calendar import monthrange
 from zoneinfo import ZoneInfo
 
 from extensions import db
-from models.models import Product, Customer, Invoice, InvoiceItem, Appointment, ProductStockLog
+from models.models import Product, Customer, Invoice, Appointment, ProductStockLog, ProductSalesStats
+from utils.time_buckets import sales_buckets, day_range
 
 # Crear Blueprint
 dashboard_bp = Blueprint('dashboard', __name__)
@@ -32,17 +33,18 @@ def index():
     # Excluye productos con stock_min = 0 (productos a necesidad)
     # Ordenados por: 1) Stock ascendente (menos stock primero)
     #                2) Ventas descendentes (más vendidos primero en empate)
+    sales_count = func.coalesce(ProductSalesStats.units_sold, 0)
     low_stock_query = db.session.query(
         Product,
-        func.coalesce(func.sum(InvoiceItem.quantity), 0).label('sales_count')
-    ).outerjoin(InvoiceItem, Product.id == InvoiceItem.product_id).filter(
+        sales_count.label('sales_count')
+    ).outerjoin(ProductSalesStats, Product.id == ProductSalesStats.product_id).filter(
         Product.stock_min != None,
         Product.stock_min > 0,
         Product.stock <= Product.stock_min,
         Product.category != 'Servicios'
-    ).group_by(Product.id).order_by(
+    ).order_by(
         Product.stock.asc(),
-        func.coalesce(func.sum(InvoiceItem.quantity), 0).desc()
+        sales_count.desc()
     ).limit(20)
     
     # Transformar resultados
@@ -68,13 +70,18 @@ def index():
     # Productos inventariados en el mes
     inventoried_product_ids = db.session.query(ProductStockLog.product_id).filter(
         ProductStockLog.is_inventory == True,
-        db.func.date(ProductStockLog.created_at) >= first_day_of_month
+        day_range(ProductStockLog.created_at, first_day_of_month)
     ).distinct().all()
     inventoried_count = len(inventoried_product_ids)
     
     # Pendientes del mes
     pending_inventory_count = total_products - inventoried_count
     
+    # Ventas del día local (agrupadas en SQL, netas de notas de crédito)
+    today_sales = sales_buckets('day', today, today)
+    today_sales_count = today_sales[0]['count'] if today_sales else 0
+    today_sales_total = today_sales[0]['total'] if today_sales else 0.0
+    
     return render_template(
         'index.html',
         product_count=product_count,
@@ -83,5 +90,7 @@ def index():
         recent_invoices=recent_invoices,
         low_stock_products=low_stock_products,
         upcoming_appointments=upcoming_appointments,
-        pending_inventory_count=pending_inventory_count
+        pending_inventory_count=pending_inventory_count,
+        today_sales_count=today_sales_count,
+        today_sales_total=today_sales_total
     )
@@ -0,0 +1,71 @@
+# routes/exports.py
+"""Blueprint para exportación de ventas e inventario (CSV/XLSX en streaming)."""
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from flask import Blueprint, Response, request, abort, flash, redirect, url_for, stream_with_context
+from flask_login import login_required
+from utils.decorators import role_required
+from utils.exports import EXPORTS, XLSX_AVAILABLE, iter_rows, csv_chunks, xlsx_chunks
+
+exports_bp = Blueprint('exports', __name__, url_prefix='/exports')
+
+# Timezone de Colombia
+CO_TZ = ZoneInfo("America/Bogota")
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+@exports_bp.route('/<dataset>.<fmt>')
+@login_required
+@role_required('admin')
+def download(dataset, fmt):
+    """Descarga un dataset del rango de fechas como CSV o XLSX.
+    
+    Datasets: invoices, items, credit_notes, stock_logs
+    
+    Parámetros URL opcionales:
+        start_date: Fecha inicio formato YYYY-MM-DD (default: hace 30 días)
+        end_date: Fecha fin formato YYYY-MM-DD (default: hoy)
+    
+    Returns:
+        Respuesta en streaming (la descarga inicia con el primer lote de filas)
+    """
+    if dataset not in EXPORTS or fmt not in ('csv', 'xlsx'):
+        abort(404)
+    
+    today = datetime.now(CO_TZ).date()
+    try:
+        start_date = datetime.strptime(request.args.get('start_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start_date = today - timedelta(days=30)
+    try:
+        end_date = datetime.strptime(request.args.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        end_date = today
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+    
+    if fmt == 'xlsx' and not XLSX_AVAILABLE:
+        flash('Exportación XLSX no disponible: instale openpyxl. Use CSV.', 'warning')
+        return redirect(url_for('reports.index', start_date=start_date.isoformat(),
+                                end_date=end_date.isoformat()))
+    
+    name, headers, _ = EXPORTS[dataset]
+    filename = f"{name}_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{fmt}"
+    rows = iter_rows(dataset, start_date, end_date)
+    
+    if fmt == 'csv':
+        chunks = csv_chunks(headers, rows)
+        mimetype = 'text/csv; charset=utf-8'
+    else:
+        chunks = xlsx_chunks(name, headers, rows)
+        mimetype = XLSX_MIMETYPE
+    
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store'
+        }
+    )
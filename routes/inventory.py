@@ -7,11 +7,14 @@ from flask_login import login_required, current_user
 from datetime import datetime
 from calendar import monthrange
 from zoneinfo import ZoneInfo
-from sqlalchemy import or_, and_
 
 from extensions import db
 from models.models import Product, ProductStockLog
 from utils.backup import auto_backup
+from utils.product_search import filter_by_search
+from utils.context_cache import invalidate_inventory_status
+from utils.time_buckets import day_range
+from utils.stock_ledger import MOVEMENT_INVENTORY, record_movement
 
 # Crear Blueprint
 inventory_bp = Blueprint('inventory', __name__, url_prefix='/inventory')
@@ -43,29 +46,9 @@ def pending():
     # Query base con filtro de categoría
     base_query = Product.query.filter(Product.category != 'Servicios')
     
-    # Aplicar búsqueda si existe
+    # Aplicar búsqueda si existe (índice FTS5, fallback LIKE multi-palabra)
     if query_text:
-        search_terms = query_text.strip().split()
-        
-        if len(search_terms) == 1:
-            term = search_terms[0]
-            base_query = base_query.filter(
-                or_(
-                    Product.name.ilike(f'%{term}%'),
-                    Product.code.ilike(f'%{term}%')
-                )
-            )
-        else:
-            # Búsqueda multi-palabra con AND lógico
-            filters = []
-            for term in search_terms:
-                filters.append(
-                    or_(
-                        Product.name.ilike(f'%{term}%'),
-                        Product.code.ilike(f'%{term}%')
-                    )
-                )
-            base_query = base_query.filter(and_(*filters))
+        base_query, _ = filter_by_search(base_query, query_text, [Product.name, Product.code])
     
     # Aplicar ordenamiento dinámico
     if sort_order == 'asc':
@@ -78,7 +61,7 @@ def pending():
     # Obtener IDs de productos ya inventariados en el mes
     inventoried_product_ids = db.session.query(ProductStockLog.product_id).filter(
         ProductStockLog.is_inventory == True,  # Solo conteos físicos
-        db.func.date(ProductStockLog.created_at) >= first_day_of_month
+        day_range(ProductStockLog.created_at, first_day_of_month)
     ).distinct().all()
     inventoried_ids = [pid[0] for pid in inventoried_product_ids]
     
@@ -92,7 +75,7 @@ def pending():
     # Inventariados hoy
     inventoried_today = ProductStockLog.query.filter(
         ProductStockLog.is_inventory == True,
-        db.func.date(ProductStockLog.created_at) == today
+        day_range(ProductStockLog.created_at, today, today)
     ).count()
     
     return render_template('inventory/pending.html',
@@ -120,7 +103,7 @@ def count(product_id):
     existing_inventory = ProductStockLog.query.filter(
         ProductStockLog.product_id == product_id,
         ProductStockLog.is_inventory == True,
-        db.func.date(ProductStockLog.created_at) == today
+        day_range(ProductStockLog.created_at, today, today)
     ).first()
     
     if existing_inventory and request.method == 'GET':
@@ -168,8 +151,10 @@ def count(product_id):
             # Si hay diferencia, actualizar stock del producto
             if difference != 0:
                 product.stock = counted_quantity
+            record_movement(product.id, difference, MOVEMENT_INVENTORY, reason, user_id=current_user.id)
             
             db.session.commit()
+            invalidate_inventory_status()
             
             if difference == 0:
                 flash(f'Inventario de "{product.name}" verificado correctamente. Sin diferencias.', 'success')
@@ -204,11 +189,11 @@ def history():
     # Aplicar filtros
     if start_date_str:
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-        query = query.filter(db.func.date(ProductStockLog.created_at) >= start_date)
+        query = query.filter(day_range(ProductStockLog.created_at, start_day=start_date))
     
     if end_date_str:
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-        query = query.filter(db.func.date(ProductStockLog.created_at) <= end_date)
+        query = query.filter(day_range(ProductStockLog.created_at, end_day=end_date))
     
     if product_id:
         query = query.filter(ProductStockLog.product_id == int(product_id))
@@ -3,16 +3,25 @@
 import json
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from flask_login import login_required, current_user
-from sqlalchemy import func, desc, or_
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager, joinedload
 from extensions import db
 from models.models import (
-    Invoice, InvoiceItem, Customer, Product, Setting, ProductStockLog,
-    CreditNoteApplication
+    Invoice, InvoiceItem, Customer, Product, ProductStockLog,
+    CreditNoteApplication, ProductSalesStats
 )
 from utils.decorators import role_required
 from utils.backup import auto_backup
+from utils.pagination import encode_cursor, decode_cursor, keyset_filter
+from utils.context_cache import setting_snapshot
+from utils.checkout import CheckoutError, parse_lines, create_sale
+from utils.numbering import next_document_number
+from utils.credit_notes import apply_credit_notes, register_credit_note, release_credit_note_applications
+from utils.stock_ledger import (
+    MOVEMENT_CREDIT_NOTE, MOVEMENT_SALE_DELETED, StockMovement, record_movements
+)
 
 invoices_bp = Blueprint('invoices', __name__, url_prefix='/invoices')
 
@@ -20,55 +29,166 @@ invoices_bp = Blueprint('invoices', __name__, url_prefix='/invoices')
 CO_TZ = ZoneInfo("America/Bogota")
 
 
-@invoices_bp.route('/')
-@login_required
-def list():
-    """Lista facturas y notas de crédito agrupadas por fecha con filtrado."""
-    query = request.args.get('query', '')
-    document_type_filter = request.args.get('type', '')  # '' = todos, 'invoice' = facturas, 'credit_note' = NC
-    
-    # Base query
-    base_query = Invoice.query
-    
-    # Filtrar por tipo de documento si se especifica
+# Documentos por página del listado (se completa el último día para no partirlo)
+INVOICES_PAGE_SIZE = 100
+
+
+def _local_day_start_utc(value):
+    """Inicio (UTC naive) del día local de Colombia que contiene `value` (UTC)."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    local_day = value.astimezone(CO_TZ).date()
+    local_start = datetime(local_day.year, local_day.month, local_day.day, tzinfo=CO_TZ)
+    return local_start.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _filter_invoices(base_query, query, document_type_filter):
+    """Aplica filtros de tipo y búsqueda (requiere join con Customer)."""
     if document_type_filter:
         base_query = base_query.filter(Invoice.document_type == document_type_filter)
-    
-    # Filtrar por búsqueda de texto
     if query:
-        invoices = base_query.join(Customer).filter(
+        base_query = base_query.filter(
             Invoice.number.contains(query) | 
             Customer.name.contains(query) | 
             Customer.document.contains(query)
-        ).order_by(Invoice.date.desc()).all()
-    else:
-        invoices = base_query.order_by(Invoice.date.desc()).all()
+        )
+    return base_query
+
+
+def _invoice_page(query, document_type_filter, cursor):
+    """Carga una página del listado por cursor (date, id), agrupada por día local.
     
-    # Agrupar facturas por fecha local (Colombia)
-    invoices_by_date = {}
+    La página toma INVOICES_PAGE_SIZE documentos y luego completa el día local
+    del último, para que los totales por día del encabezado sean correctos.
+    
+    Args:
+        query: Texto de búsqueda (número, nombre o documento del cliente)
+        document_type_filter: '' = todos, 'invoice' o 'credit_note'
+        cursor: Posición decodificada (date, id) o None para la primera página
+        
+    Returns:
+        tuple: (invoices_by_date, next_cursor) - next_cursor es None en la última página
+    """
+    items_count = db.select(func.count(InvoiceItem.id))\
+        .where(InvoiceItem.invoice_id == Invoice.id)\
+        .correlate(Invoice)\
+        .scalar_subquery()
+    
+    # Cliente y factura de referencia (NC) en la misma consulta: sin lazy loads por fila
+    page_query = _filter_invoices(
+        db.session.query(Invoice, items_count.label('items_count'))
+          .join(Customer, Invoice.customer_id == Customer.id)
+          .options(contains_eager(Invoice.customer), joinedload(Invoice.reference_invoice)),
+        query, document_type_filter
+    )
+    
+    def ordered_after(position):
+        return keyset_filter(page_query, Invoice.date, Invoice.id, position)\
+            .order_by(Invoice.date.desc(), Invoice.id.desc())
     
-    for invoice in invoices:
+    rows = ordered_after(cursor).limit(INVOICES_PAGE_SIZE).all()
+    
+    next_cursor = None
+    if len(rows) == INVOICES_PAGE_SIZE:
+        # Completar el día local del último documento
+        last = rows[-1][0]
+        rows += ordered_after((last.date, last.id))\
+            .filter(Invoice.date >= _local_day_start_utc(last.date))\
+            .all()
+        
+        last = rows[-1][0]
+        remaining = keyset_filter(
+            _filter_invoices(
+                db.session.query(Invoice.id).join(Customer, Invoice.customer_id == Customer.id),
+                query, document_type_filter
+            ),
+            Invoice.date, Invoice.id, (last.date, last.id)
+        )
+        if remaining.first() is not None:
+            next_cursor = encode_cursor(last.date, last.id)
+    
+    # Agrupar por fecha local (Colombia); las filas ya vienen en orden descendente
+    invoices_by_date = {}
+    for invoice, count in rows:
+        invoice.items_count = count
+        
         # Asegurarse de que la fecha sea aware si no lo es
         invoice_date = invoice.date
         if invoice_date.tzinfo is None:
             invoice_date = invoice_date.replace(tzinfo=timezone.utc)
-            
-        # Convertir la fecha UTC a hora local de Colombia
-        local_date = invoice_date.astimezone(CO_TZ)
-        date_str = local_date.strftime('%Y-%m-%d')
-        if date_str not in invoices_by_date:
-            invoices_by_date[date_str] = []
-        invoices_by_date[date_str].append(invoice)
+        
+        date_str = invoice_date.astimezone(CO_TZ).strftime('%Y-%m-%d')
+        invoices_by_date.setdefault(date_str, []).append(invoice)
+    
+    return invoices_by_date, next_cursor
+
+
+@invoices_bp.route('/')
+@login_required
+def list():
+    """Lista facturas y notas de crédito agrupadas por fecha con filtrado.
+    
+    Primera página server-side; las siguientes se cargan con scroll infinito
+    desde invoices.page (o con el enlace "Cargar más" si no hay JavaScript).
+    """
+    query = request.args.get('query', '')
+    document_type_filter = request.args.get('type', '')  # '' = todos, 'invoice' = facturas, 'credit_note' = NC
     
-    # Ordenar el diccionario por fecha de manera descendente
-    invoices_by_date = dict(sorted(invoices_by_date.items(), reverse=True))
+    try:
+        cursor = decode_cursor(request.args.get('cursor'))
+    except ValueError:
+        cursor = None
+    
+    invoices_by_date, next_cursor = _invoice_page(query, document_type_filter, cursor)
         
     return render_template('invoices/list.html', 
                          invoices_by_date=invoices_by_date, 
+                         next_cursor=next_cursor,
+                         first_page=cursor is None,
                          query=query,
                          document_type_filter=document_type_filter)
 
 
+@invoices_bp.route('/page')
+@login_required
+def page():
+    """Siguiente página del listado para scroll infinito (JSON).
+    
+    Query params:
+        cursor: Cursor devuelto por la página anterior
+        query, type: Mismos filtros que invoices.list
+        
+    Returns:
+        JSON:
+        {
+            "html": "<div class=\"card mb-4\">...",   // grupos por día renderizados
+            "next_cursor": "MjAyNS0wMS0wMVQxMjowMDowMHwxMjM0" | null,
+            "days": [{"date": "2025-01-01", "count": 12}],
+            "count": 12
+        }
+    """
+    query = request.args.get('query', '')
+    document_type_filter = request.args.get('type', '')
+    
+    try:
+        cursor = decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    invoices_by_date, next_cursor = _invoice_page(query, document_type_filter, cursor)
+    
+    html = render_template('partials/invoice_day_groups.html',
+                           invoices_by_date=invoices_by_date,
+                           first_page=False)
+    
+    return jsonify({
+        'html': html,
+        'next_cursor': next_cursor,
+        'days': [{'date': day, 'count': len(invoices)} for day, invoices in invoices_by_date.items()],
+        'count': sum(len(invoices) for invoices in invoices_by_date.values())
+    })
+
+
 @invoices_bp.route('/new', methods=['GET', 'POST'])
 @login_required
 @auto_backup()  # Backup antes de crear factura
@@ -106,68 +226,9 @@ def new():
                     notes += f"Transferencia: ${amount_transfer:,.0f}\n"
                 notes += f"Total: ${mixed_payment_details['total']:,.0f}"
             
-            setting = Setting.get()
-            number = f"{setting.invoice_prefix}-{setting.next_invoice_number:06d}"
-            setting.next_invoice_number += 1
-            
-            # Crear la factura usando la hora actual de Colombia convertida a UTC
-            local_now = datetime.now(CO_TZ)
-            utc_now = local_now.astimezone(timezone.utc)
-            
-            invoice = Invoice(
-                number=number, 
-                customer_id=customer_id, 
-                payment_method=payment_method, 
-                notes=notes, 
-                status='pending', 
-                user_id=current_user.id, 
-                date=utc_now
-            )
-            db.session.add(invoice)
-            db.session.flush()
-            
-            # Procesar items
-            items_json = request.form['items_json']
-            items_data = json.loads(items_json)
-            
-            # NOTA: Se permite inventario negativo para casos especiales
-            # (preventa, pedidos pendientes, ajustes posteriores)
-            # Solo se genera advertencia si el stock queda negativo
-            warnings = []
-            for item_data in items_data:
-                product = db.session.get(Product, item_data['product_id'])
-                quantity = int(item_data['quantity'])
-                if product and product.stock < quantity:
-                    new_stock = product.stock - quantity
-                    warnings.append(f'{product.name} quedará con stock negativo ({new_stock})')
-            
-            if warnings:
-                current_app.logger.warning(f'Venta con stock negativo: {"; ".join(warnings)}')
-
-            for item_data in items_data:
-                product_id = item_data['product_id']
-                quantity = int(item_data['quantity'])
-                price = float(item_data['price'])
-                invoice_item = InvoiceItem(
-                    invoice_id=invoice.id, 
-                    product_id=product_id, 
-                    quantity=quantity, 
-                    price=price
-                )
-                db.session.add(invoice_item)
-                
-                # Descontar stock
-                product = db.session.get(Product, product_id)
-                if product:
-                    # Advertencia si queda por debajo de stock_min (incluye negativos)
-                    new_stock = product.stock - quantity
-                    stock_min = product.effective_stock_min
-                    if new_stock < stock_min:
-                        current_app.logger.warning(f'Venta deja producto {product.name} con stock={new_stock} (min={stock_min})')
-                    
-                    product.stock -= quantity
-            
-            invoice.calculate_totals()
+            # Factura, items y descuento de stock en un número fijo de consultas
+            lines = parse_lines(json.loads(request.form['items_json']))
+            invoice, _warnings = create_sale(customer_id, payment_method, lines, current_user.id, notes)
             
             # Aplicar pago con Nota de Crédito si corresponde
             if payment_method in ['credit_note', 'mixed']:
@@ -182,55 +243,12 @@ def new():
                         amount_to_apply_target = min(customer.credit_balance, invoice.total)
                     
                     if amount_to_apply_target > 0:
-                        # Buscar NC disponibles del cliente (con saldo sin aplicar)
-                        available_credit_notes = Invoice.query.filter(
-                            Invoice.customer_id == customer_id,
-                            Invoice.document_type == 'credit_note',
-                            Invoice.status == 'validated'
-                        ).order_by(Invoice.date.asc()).all()  # FIFO: más antiguas primero
+                        # NC con saldo (FIFO) en una sola lectura del índice parcial
+                        applied = apply_credit_notes(invoice, customer, amount_to_apply_target, current_user.id)
                         
-                        # Calcular saldo disponible de cada NC
-                        nc_with_balance = []
-                        for nc in available_credit_notes:
-                            # Calcular cuánto ya se ha aplicado de esta NC
-                            applied_sum = db.session.query(func.sum(CreditNoteApplication.amount_applied))\
-                                .filter(CreditNoteApplication.credit_note_id == nc.id)\
-                                .scalar() or 0
-                            
-                            available_balance = nc.total - applied_sum
-                            if available_balance > 0:
-                                nc_with_balance.append({
-                                    'nc': nc,
-                                    'available': available_balance
-                                })
-                        
-                        if nc_with_balance:
-                            # Aplicar NC hasta el monto especificado
-                            remaining_to_apply = amount_to_apply_target
-                            total_nc_applied = 0
-                            
-                            for nc_info in nc_with_balance:
-                                if remaining_to_apply <= 0:
-                                    break
-                                
-                                # Aplicar lo que se pueda de esta NC
-                                amount_to_apply = min(nc_info['available'], remaining_to_apply)
-                                
-                                # Crear registro de aplicación
-                                application = CreditNoteApplication(
-                                    credit_note_id=nc_info['nc'].id,
-                                    invoice_id=invoice.id,
-                                    amount_applied=amount_to_apply,
-                                    applied_by=current_user.id
-                                )
-                                db.session.add(application)
-                                
-                                # Actualizar contadores
-                                remaining_to_apply -= amount_to_apply
-                                total_nc_applied += amount_to_apply
-                                
-                                # Descontar del saldo del cliente
-                                customer.credit_balance -= amount_to_apply
+                        if applied:
+                            total_nc_applied = sum(amount for _nc, amount, _available in applied)
+                            remaining_to_apply = amount_to_apply_target - total_nc_applied
                             
                             # Verificar si quedó NC sin aplicar por falta de saldo
                             if remaining_to_apply > 0:
@@ -269,6 +287,10 @@ def new():
                 flash('Venta registrada exitosamente', 'success')
             
             return redirect(url_for('invoices.view', id=invoice.id))
+        except CheckoutError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return redirect(url_for('invoices.new'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error al crear venta: {str(e)}', 'error')
@@ -278,24 +300,17 @@ def new():
     
     # Optimización: Pre-cargar solo top 50 productos más vendidos para mejor performance
     # La búsqueda AJAX cargará el resto dinámicamente
-    top_products = db.session.query(
-        Product,
-        func.coalesce(func.sum(InvoiceItem.quantity), 0).label('sales_count')
-    ).outerjoin(InvoiceItem, Product.id == InvoiceItem.product_id)\
-     .outerjoin(Invoice, InvoiceItem.invoice_id == Invoice.id)\
-     .filter(or_(Invoice.status != 'cancelled', Invoice.id == None))\
-     .group_by(Product.id)\
-     .order_by(desc('sales_count'))\
-     .limit(50)\
-     .all()
-    
-    # Extraer solo los objetos Product de la tupla (Product, sales_count)
-    products = [item[0] for item in top_products]
+    # (contadores precalculados en product_sales_stats, sin recorrer el historial)
+    products = Product.query\
+        .outerjoin(ProductSalesStats, Product.id == ProductSalesStats.product_id)\
+        .order_by(func.coalesce(ProductSalesStats.units_sold, 0).desc())\
+        .limit(50)\
+        .all()
     
     # Feature flag para habilitar precarga de índice de códigos
     enable_code_index_preload = True  # Feature flag para A/B testing
     
-    setting = Setting.get()
+    setting = setting_snapshot()
     return render_template('invoices/form.html', customers=customers, products=products, 
                          setting=setting, enable_code_index_preload=enable_code_index_preload)
 
@@ -305,7 +320,7 @@ def new():
 def view(id):
     """Muestra detalle de una factura."""
     invoice = Invoice.query.get_or_404(id)
-    setting = Setting.get()
+    setting = setting_snapshot()
     return render_template('invoices/view.html', invoice=invoice, setting=setting, colombia_tz=CO_TZ)
 
 
@@ -368,9 +383,7 @@ def create_credit_note(id):
                 return redirect(url_for('invoices.view', id=id))
         
         # Crear la Nota de Crédito con numeración unificada
-        setting = Setting.get()
-        number = f"{setting.invoice_prefix}-{setting.next_invoice_number:06d}"
-        setting.next_invoice_number += 1
+        number = next_document_number(setting_snapshot().invoice_prefix)
         
         # Usar la hora actual de Colombia convertida a UTC
         local_now = datetime.now(CO_TZ)
@@ -410,12 +423,14 @@ def create_credit_note(id):
         credit_note.calculate_totals()
         
         # Restaurar stock de productos devueltos
+        returned = {}
         for item in credit_note.items:
             product = item.product
             if product:
                 old_stock = product.stock
                 product.stock += item.quantity
                 new_stock = product.stock
+                returned[product.id] = returned.get(product.id, 0) + item.quantity
                 
                 # Crear log de movimiento de inventario
                 log = ProductStockLog(
@@ -429,13 +444,18 @@ def create_credit_note(id):
                 )
                 db.session.add(log)
         
+        record_movements([
+            StockMovement(product_id, quantity, MOVEMENT_CREDIT_NOTE,
+                          f'Devolución por Nota de Crédito {credit_note.number} (Ref: {invoice.number})',
+                          credit_note.number)
+            for product_id, quantity in returned.items()
+        ], user_id=current_user.id)
+        
         # Marcar stock como restaurado
         credit_note.stock_restored = True
         
-        # Actualizar saldo a favor del cliente
-        customer = db.session.get(Customer, invoice.customer_id)
-        if customer:
-            customer.credit_balance = (customer.credit_balance or 0) + credit_note.total
+        # Saldo de la NC y saldo a favor del cliente
+        register_credit_note(credit_note, db.session.get(Customer, invoice.customer_id))
         
         db.session.commit()
         
@@ -528,7 +548,6 @@ def edit(id):
         # Bloquear cambio de método mixto con NC aplicadas a otro método
         if invoice.payment_method == 'mixed' and new_payment_method != 'mixed':
             # Verificar si tiene NC aplicadas
-            from models.models import CreditNoteApplication
             applied_ncs = CreditNoteApplication.query.filter_by(invoice_id=invoice.id).count()
             
             if applied_ncs > 0:
@@ -571,49 +590,19 @@ def edit(id):
         
         # Aplicar NC si método es mixto y amount_nc > 0
         if new_payment_method == 'mixed' and amount_nc > 0:
-            from models.models import CreditNoteApplication, Invoice as InvoiceModel
-            
-            # Buscar NC disponibles del cliente (FIFO - más antiguas primero)
-            available_credit_notes = InvoiceModel.query.filter(
-                InvoiceModel.customer_id == invoice.customer_id,
-                InvoiceModel.document_type == 'credit_note'
-            ).order_by(InvoiceModel.date.asc()).all()
-            
-            amount_remaining = amount_nc
-            
-            for nc in available_credit_notes:
-                if amount_remaining <= 0:
-                    break
-                
-                # Calcular saldo disponible de esta NC
-                applied = sum(app.amount_applied for app in nc.applications)
-                available = nc.total - applied
-                
-                if available > 0:
-                    amount_to_apply = min(amount_remaining, available)
-                    
-                    # Crear registro de aplicación
-                    application = CreditNoteApplication(
-                        credit_note_id=nc.id,
-                        invoice_id=invoice.id,
-                        amount_applied=amount_to_apply,
-                        applied_by=current_user.id
-                    )
-                    db.session.add(application)
-                    
-                    amount_remaining -= amount_to_apply
-                    
-                    log_messages.append(
-                        f"NC {nc.number} aplicada: ${amount_to_apply:,.0f} "
-                        f"(disponible: ${available:,.0f})"
-                    )
-            
-            # Reducir saldo del cliente
+            # NC con saldo (FIFO) en una sola lectura; descuenta NC y cliente
             customer = invoice.customer
-            customer.credit_balance -= amount_nc
+            applied = apply_credit_notes(invoice, customer, amount_nc, current_user.id)
             
+            for nc, amount_to_apply, available in applied:
+                log_messages.append(
+                    f"NC {nc.number} aplicada: ${amount_to_apply:,.0f} "
+                    f"(disponible: ${available:,.0f})"
+                )
+            
+            total_nc_applied = sum(amount for _nc, amount, _available in applied)
             log_messages.append(
-                f"Saldo NC del cliente reducido en ${amount_nc:,.0f} "
+                f"Saldo NC del cliente reducido en ${total_nc_applied:,.0f} "
                 f"(nuevo saldo: ${customer.credit_balance:,.0f})"
             )
         
@@ -702,6 +691,9 @@ def delete(id):
                     'new_stock': new_stock
                 })
         
+        # Devolver a sus NC lo aplicado como pago (saldo del cliente incluido)
+        release_credit_note_applications(invoice)
+        
         # Eliminar la factura (cascade eliminará InvoiceItems)
         db.session.delete(invoice)
         db.session.flush()  # Flush antes de crear logs
@@ -719,6 +711,15 @@ def delete(id):
             )
             db.session.add(log)
         
+        restored = {}
+        for info in items_info:
+            restored[info['product'].id] = restored.get(info['product'].id, 0) + info['quantity']
+        record_movements([
+            StockMovement(product_id, quantity, MOVEMENT_SALE_DELETED,
+                          f'Devolución por eliminación de venta {invoice_number}', invoice_number)
+            for product_id, quantity in restored.items()
+        ], user_id=current_user.id)
+        
         db.session.commit()
         flash(f'Venta {invoice_number} eliminada exitosamente. Stock restaurado.', 'success')
     except Exception as e:
@@ -0,0 +1,25 @@
+# routes/metrics.py
+"""Blueprint para exponer métricas de latencia en formato Prometheus."""
+from flask import Blueprint, Response, request, abort
+from flask_login import current_user
+from utils.metrics import METRICS
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Scrapers locales (Prometheus/agente en el mismo equipo) no inician sesión
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """Histogramas de latencia, contadores por estado y requests en curso.
+    
+    Acceso: solicitudes desde localhost o usuario admin autenticado.
+    
+    Returns:
+        Texto plano en formato de exposición de Prometheus 0.0.4
+    """
+    is_admin = current_user.is_authenticated and current_user.role == 'admin'
+    if request.remote_addr not in LOCAL_ADDRESSES and not is_admin:
+        abort(403)
+    return Response(METRICS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -4,14 +4,30 @@ Blueprint para CRUD de productos e historial de stock.
 
 from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app
 from flask_login import login_required, current_user
-from sqlalchemy import func, or_, and_, extract
+from sqlalchemy import func
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
 from extensions import db
-from models.models import Product, InvoiceItem, Supplier, ProductStockLog, Invoice, ProductCode, User
+from models.models import (
+    Product, InvoiceItem, Supplier, ProductStockLog, ProductCode,
+    ProductSalesStats, ProductMetrics
+)
 from utils.decorators import role_required
 from utils.backup import auto_backup
+from utils.product_search import filter_by_search
+from utils.code_index import CODE_INDEX
+from utils.product_codes import load_alternative_codes, assemble_all_codes
+from utils.sales_stats import rebuild_sales_stats
+from utils.sales_rollups import rebuild_sales_rollups
+from utils.report_cache import REPORT_CACHE
+from utils.time_buckets import product_units_buckets
+from utils.stock_ledger import (
+    MOVEMENT_ADJUSTMENT, MOVEMENT_INITIAL, ledger_page, ledger_stats, rebuild_stock_ledger,
+    record_movement
+)
+from utils.pagination import decode_cursor
+from utils.product_metrics import derive_metrics, last_refresh, stockout_days_expression
 
 # Timezone de Colombia
 CO_TZ = ZoneInfo("America/Bogota")
@@ -28,6 +44,7 @@ def list():
     sort_by = request.args.get('sort_by', 'name')
     sort_order = request.args.get('sort_order', 'asc')
     supplier_id = request.args.get('supplier_id', '')
+    stockout_days = request.args.get('stockout_days', '')
     
     sort_columns = {
         'code': Product.code,
@@ -36,19 +53,20 @@ def list():
         'purchase_price': Product.purchase_price,
         'sale_price': Product.sale_price,
         'stock': Product.stock,
-        'sales_count': 'sales_count'
+        'sales_count': 'sales_count',
+        'days_until_stockout': 'days_until_stockout'
     }
     
-    # CRÍTICO: Contar solo ventas de facturas NO canceladas
-    # Se hace join con Invoice para filtrar por estado
-    # NUEVO: Agregar outerjoin a ProductCode para búsqueda multi-código
+    # Ventas desde contadores precalculados (facturas no canceladas - NC)
+    sales_count = func.coalesce(ProductSalesStats.units_sold, 0)
+    # Días hasta agotarse: stock actual / velocidad de la tarea nocturna (product_metrics)
+    days_until_stockout = stockout_days_expression()
     base_query = db.session.query(
         Product,
-        func.coalesce(func.sum(InvoiceItem.quantity), 0).label('sales_count')
-    ).outerjoin(InvoiceItem, Product.id == InvoiceItem.product_id)\
-     .outerjoin(Invoice, InvoiceItem.invoice_id == Invoice.id)\
-     .outerjoin(ProductCode, Product.id == ProductCode.product_id)\
-     .filter(or_(Invoice.status != 'cancelled', Invoice.id == None))
+        sales_count.label('sales_count'),
+        days_until_stockout.label('days_until_stockout')
+    ).outerjoin(ProductSalesStats, Product.id == ProductSalesStats.product_id)\
+     .outerjoin(ProductMetrics, Product.id == ProductMetrics.product_id)
     
     # Filtro por proveedor
     if supplier_id:
@@ -60,43 +78,38 @@ def list():
             else:
                 base_query = base_query.filter(Product.id == -1)
     
+    # Filtro por días hasta agotarse (productos sin ventas recientes no aplican)
+    if stockout_days.isdigit():
+        base_query = base_query.filter(days_until_stockout <= int(stockout_days))
+    else:
+        stockout_days = ''
+    
     if query:
-        # Búsqueda mejorada: divide el query en palabras individuales
-        # NUEVO: Busca también en códigos alternativos (ProductCode)
-        search_terms = query.strip().split()
-        
-        if len(search_terms) == 1:
-            term = search_terms[0]
-            base_query = base_query.filter(
-                or_(
-                    Product.name.ilike(f'%{term}%'),
-                    Product.code.ilike(f'%{term}%'),
-                    ProductCode.code.ilike(f'%{term}%')  # Búsqueda en códigos alternativos
-                )
-            )
-        else:
-            filters = []
-            for term in search_terms:
-                filters.append(
-                    or_(
-                        Product.name.ilike(f'%{term}%'),
-                        Product.code.ilike(f'%{term}%'),
-                        ProductCode.code.ilike(f'%{term}%')  # Búsqueda en códigos alternativos
-                    )
-                )
-            base_query = base_query.filter(and_(*filters))
-    
-    # Agrupar por producto
-    base_query = base_query.group_by(Product.id)
+        # Búsqueda por palabras (AND lógico) en nombre, código y códigos alternativos
+        # Usa índice FTS5; el fallback LIKE requiere el outerjoin a ProductCode
+        base_query, used_fts = filter_by_search(
+            base_query, query,
+            [Product.name, Product.code, ProductCode.code]
+        )
+        if not used_fts:
+            # Agrupar por producto: varios códigos alternativos duplican filas
+            base_query = base_query.outerjoin(ProductCode, Product.id == ProductCode.product_id)\
+                                   .group_by(Product.id)
     
     # Aplicar ordenamiento
     if sort_by in sort_columns:
         if sort_by == 'sales_count':
             # Ordenar por el conteo de ventas (ya filtrado por estado de factura)
             if sort_order == 'desc':
-                base_query = base_query.order_by(func.coalesce(func.sum(InvoiceItem.quantity), 0).desc())
+                base_query = base_query.order_by(sales_count.desc())
             else:
-                base_query = base_query.order_by(func.coalesce(func.sum(InvoiceItem.quantity), 0).asc())
+                base_query = base_query.order_by(sales_count.asc())
+        elif sort_by == 'days_until_stockout':
+            # Sin ventas recientes (NULL) = nunca se agota: al final en orden ascendente
+            if sort_order == 'desc':
+                base_query = base_query.order_by(days_until_stockout.desc().nulls_first())
+            else:
+                base_query = base_query.order_by(days_until_stockout.asc().nulls_last())
         else:
             order_column = sort_columns[sort_by]
             if sort_order == 'desc':
@@ -108,8 +121,9 @@ def list():
     
     # Transformar resultados para que el template pueda acceder a sales_count
     products_with_sales = []
-    for product, sales_count in products:
+    for product, sales_count, days_left in products:
         product.sales_count = sales_count
+        product.days_until_stockout = days_left
         products_with_sales.append(product)
     
     # Obtener todos los proveedores para el filtro
@@ -121,7 +135,9 @@ def list():
                          sort_by=sort_by,
                          sort_order=sort_order,
                          suppliers=suppliers,
-                         supplier_id=supplier_id)
+                         supplier_id=supplier_id,
+                         stockout_days=stockout_days,
+                         metrics_computed_at=last_refresh())
 
 
 @products_bp.route('/new', methods=['GET', 'POST'])
@@ -187,6 +203,9 @@ def new():
         db.session.add(product)
         db.session.flush()  # Para obtener el ID del producto
         
+        if stock:
+            record_movement(product.id, stock, MOVEMENT_INITIAL, 'Stock inicial', user_id=current_user.id)
+        
         # Asociar proveedores seleccionados
         supplier_ids = request.form.getlist('supplier_ids')
         if supplier_ids:
@@ -313,6 +332,10 @@ def edit(id):
                 if supplier:
                     product.suppliers.append(supplier)
         
+        if new_stock != old_stock:
+            record_movement(product.id, new_stock - old_stock, MOVEMENT_ADJUSTMENT, reason,
+                            user_id=current_user.id)
+        
         db.session.commit()
         
         flash('Producto actualizado exitosamente', 'success')
@@ -368,7 +391,11 @@ def delete(id):
 @products_bp.route('/<int:id>/stock-history')
 @login_required
 def stock_history(id):
-    """Ver historial consolidado de movimientos de inventario (logs + ventas) con estadísticas."""
+    """Ver historial de movimientos de inventario (stock_ledger) con estadísticas.
+
+    El historial se pagina por cursor; las estadísticas acumuladas salen de la
+    última fila del libro (ver utils/stock_ledger.py).
+    """
     product = Product.query.get_or_404(id)
     
     # Leer parámetros de navegación para preservar estado de filtros
@@ -377,195 +404,49 @@ def stock_history(id):
     sort_order = request.args.get('sort_order', 'asc')
     supplier_id = request.args.get('supplier_id', '')
     
-    # === PASO 1: Obtener todos los movimientos de ProductStockLog ===
-    stock_logs = ProductStockLog.query.filter_by(product_id=id)\
-        .order_by(ProductStockLog.created_at.asc())\
-        .all()
-    
-    # === PASO 2: Obtener todas las ventas desde InvoiceItem ===
-    # Solo ventas (document_type='invoice'), NC ya están en ProductStockLog
-    sales = db.session.query(
-        InvoiceItem, Invoice, User
-    ).select_from(InvoiceItem)\
-     .join(Invoice, InvoiceItem.invoice_id == Invoice.id)\
-     .outerjoin(User, Invoice.user_id == User.id)\
-     .filter(
-        InvoiceItem.product_id == id,
-        Invoice.document_type == 'invoice'
-    ).order_by(Invoice.date.asc())\
-     .all()
-    
-    # === PASO 3: Consolidar movimientos en una sola lista ===
-    movements = []
-    
-    # Agregar logs existentes
-    for log in stock_logs:
-        movements.append({
-            'date': log.created_at,
-            'user': log.user.username if log.user else 'Sistema',
-            'type': log.movement_type,
-            'quantity': log.quantity,
-            'previous_stock': log.previous_stock,
-            'new_stock': log.new_stock,
-            'reason': log.reason,
-            'is_inventory': log.is_inventory,
-            'source': 'log'
-        })
-    
-    # Agregar ventas
-    for sale_item, invoice, user in sales:
-        movements.append({
-            'date': invoice.date,
-            'user': user.username if user else 'Sistema',
-            'type': 'venta',
-            'quantity': sale_item.quantity,
-            'previous_stock': None,  # Se calculará
-            'new_stock': None,       # Se calculará
-            'reason': f'Venta en factura {invoice.number}',
-            'is_inventory': False,
-            'source': 'sale',
-            'invoice_number': invoice.number
-        })
-    
-    # === PASO 4: Ordenar cronológicamente (CRÍTICO) ===
-    movements.sort(key=lambda x: x['date'])
-    
-    # === PASO 5: Calcular stock anterior/nuevo retroactivamente ===
-    # Comenzar desde stock actual y retroceder
-    current_stock = product.stock
-    
-    # Iterar en reversa (de más reciente a más antiguo)
-    for movement in reversed(movements):
-        if movement['source'] == 'log':
-            # ProductStockLog ya tiene valores correctos
-            # No modificar, solo sincronizar current_stock para continuar retrocediendo
-            current_stock = movement['previous_stock']
-        else:
-            # Venta: calcular stocks retroactivamente
-            # Después de esta venta, el stock quedó en current_stock
-            movement['new_stock'] = current_stock
-            
-            # Antes de esta venta, el stock era current_stock + cantidad_vendida
-            movement['previous_stock'] = current_stock + movement['quantity']
-            
-            # Actualizar current_stock para la siguiente iteración (más antigua)
-            current_stock = movement['previous_stock']
-    
-    # Revertir orden para mostrar más recientes primero
-    movements.reverse()
-    
-    # === PASO 6: Calcular estadísticas ===
-    
-    # 6.1. Promedio ventas mensuales (últimos 6 meses desde sept 2025)
-    six_months_ago = datetime.now(CO_TZ) - timedelta(days=180)
-    monthly_sales_data = db.session.query(
-        extract('year', Invoice.date).label('year'),
-        extract('month', Invoice.date).label('month'),
-        func.sum(InvoiceItem.quantity).label('quantity')
-    ).join(Invoice).filter(
-        InvoiceItem.product_id == id,
-        Invoice.document_type == 'invoice',
-        Invoice.date >= six_months_ago
-    ).group_by(
-        extract('year', Invoice.date),
-        extract('month', Invoice.date)
-    ).all()
-    
-    total_monthly_quantity = sum(sale.quantity for sale in monthly_sales_data)
-    months_with_sales = len(monthly_sales_data) if monthly_sales_data else 6
-    avg_monthly_sales = total_monthly_quantity / months_with_sales if months_with_sales > 0 else 0
-    
-    # 6.2. Total ingresados (desde ProductStockLog con movement_type='addition')
-    total_purchased = db.session.query(
-        func.sum(ProductStockLog.quantity)
-    ).filter(
-        ProductStockLog.product_id == id,
-        ProductStockLog.movement_type == 'addition',
-        ProductStockLog.is_inventory == False  # Excluir sobrantes de inventario físico
-    ).scalar() or 0
-    
-    # 6.3. Total vendidos (cantidad desde InvoiceItem)
-    total_sold = db.session.query(
-        func.sum(InvoiceItem.quantity)
-    ).join(Invoice).filter(
-        InvoiceItem.product_id == id,
-        Invoice.document_type == 'invoice'
-    ).scalar() or 0
-    
-    # Restar devoluciones (NC)
-    total_returned = db.session.query(
-        func.sum(InvoiceItem.quantity)
-    ).join(Invoice).filter(
-        InvoiceItem.product_id == id,
-        Invoice.document_type == 'credit_note'
-    ).scalar() or 0
-    
-    net_sold = total_sold - total_returned
-    
-    # 6.4. Total perdidos (desde ProductStockLog con movement_type='subtraction')
-    total_lost = db.session.query(
-        func.sum(ProductStockLog.quantity)
-    ).filter(
-        ProductStockLog.product_id == id,
-        ProductStockLog.movement_type == 'subtraction',
-        ProductStockLog.is_inventory == False  # Excluir faltantes de inventario físico
-    ).scalar() or 0
-    
-    # 6.5. Velocidad de ventas (unidades/día en últimos 30 días)
-    thirty_days_ago = datetime.now(CO_TZ) - timedelta(days=30)
-    recent_sales = db.session.query(
-        func.sum(InvoiceItem.quantity)
-    ).join(Invoice).filter(
-        InvoiceItem.product_id == id,
-        Invoice.document_type == 'invoice',
-        Invoice.date >= thirty_days_ago
-    ).scalar() or 0
-    
-    sales_velocity = recent_sales / 30.0
-    
-    # 6.6. Proyección (días hasta agotarse)
-    if sales_velocity > 0:
-        days_until_stockout = product.stock / sales_velocity
-    else:
-        days_until_stockout = None  # Nunca se agota (sin ventas recientes)
+    try:
+        cursor = decode_cursor(request.args.get('cursor'))
+    except ValueError:
+        cursor = None
     
-    # 6.7. Rotación de inventario (total vendido / stock promedio)
-    # Aproximación: usar stock actual como referencia
-    if product.stock > 0:
-        inventory_turnover = net_sold / product.stock
-    else:
-        inventory_turnover = None
-    
-    # 6.8. Última venta (días atrás)
-    last_sale_date = db.session.query(
-        func.max(Invoice.date)
-    ).join(InvoiceItem).filter(
-        InvoiceItem.product_id == id,
-        Invoice.document_type == 'invoice'
-    ).scalar()
-    
-    if last_sale_date:
-        # Usar datetime naive para compatibilidad con fechas de BD
-        now = datetime.now()
-        # Si last_sale_date tiene timezone, quitarlo
-        if last_sale_date.tzinfo is not None:
-            last_sale_date = last_sale_date.replace(tzinfo=None)
-        days_since_last_sale = (now - last_sale_date).days
+    # === Movimientos (una página, más recientes primero) ===
+    movements, next_cursor = ledger_page(id, cursor)
+    
+    # === Estadísticas ===
+    stats = ledger_stats(id)
+    
+    # Promedio ventas mensuales (últimos 6 meses, agrupado por mes local en SQL)
+    six_months_ago = datetime.now(CO_TZ).date() - timedelta(days=180)
+    monthly_sales_data = product_units_buckets(id, 'month', six_months_ago)
+    
+    # Velocidad, días hasta agotarse, rotación y promedio mensual
+    # (mismas fórmulas que la tarea nocturna de product_metrics)
+    metrics = derive_metrics(product.stock, stats['sold_in_window'], stats['net_sold'],
+                             [sale['quantity'] for sale in monthly_sales_data])
+    
+    # Última venta (días atrás); last_sale_at es UTC naive
+    if stats['last_sale_at']:
+        days_since_last_sale = (datetime.utcnow() - stats['last_sale_at']).days
     else:
         days_since_last_sale = None
     
-    # === PASO 7: Pasar datos al template ===
+    # Códigos del producto (principal + alternativos) en una consulta
+    product_codes = assemble_all_codes([product])[product.id]
+    
     return render_template('products/stock_history.html',
                           product=product,
+                          product_codes=product_codes,
                           movements=movements,
+                          next_cursor=next_cursor,
+                          first_page=cursor is None,
                           # Estadísticas
-                          avg_monthly_sales=avg_monthly_sales,
-                          total_purchased=total_purchased,
-                          net_sold=net_sold,
-                          total_lost=total_lost,
-                          sales_velocity=sales_velocity,
-                          days_until_stockout=days_until_stockout,
-                          inventory_turnover=inventory_turnover,
+                          avg_monthly_sales=metrics['avg_monthly_sales'],
+                          total_purchased=stats['total_purchased'],
+                          net_sold=stats['net_sold'],
+                          total_lost=stats['total_lost'],
+                          sales_velocity=metrics['sales_velocity'],
+                          days_until_stockout=metrics['days_until_stockout'],
+                          inventory_turnover=metrics['inventory_turnover'],
                           days_since_last_sale=days_since_last_sale,
                           # Parámetros de navegación
                           query=query,
@@ -609,6 +490,16 @@ def merge():
                 flash('Consolidacion cancelada', 'warning')
                 return redirect(url_for('products.merge'))
             
+            # merge_products escribe con sqlite3 directo: invalidar índice de códigos
+            # y recalcular contadores/rollups de ventas, libro de stock (y la caché de reportes)
+            # de los productos involucrados
+            CODE_INDEX.invalidate()
+            rebuild_sales_stats([target_id] + source_ids)
+            rebuild_sales_rollups([target_id] + source_ids)
+            rebuild_stock_ledger([target_id] + source_ids)
+            db.session.commit()
+            REPORT_CACHE.clear()
+            
             flash(
                 f"Consolidacion exitosa: "
                 f"{stats['products_deleted']} productos unificados, "
@@ -625,12 +516,15 @@ def merge():
             return redirect(url_for('products.merge'))
     
     # GET - Mostrar formulario con productos como lista de diccionarios
+    # Códigos alternativos de todo el catálogo en una sola consulta
     products_query = Product.query.order_by(Product.name).all()
+    codes_by_product = load_alternative_codes()
     products_data = [{
         'id': p.id,
         'code': p.code,
         'name': p.name,
-        'stock': p.stock
+        'stock': p.stock,
+        'alternative_codes': [ac.code for ac in codes_by_product.get(p.id, [])]
     } for p in products_query]
     
     return render_template('products/merge.html', products=products_data)
@@ -1,12 +1,20 @@
 # routes/reports.py
 """Blueprint para reportes y análisis de ventas."""
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from flask import Blueprint, render_template, request, flash
+from flask import Blueprint, render_template, request, flash, jsonify
 from flask_login import login_required
-from sqlalchemy import func, or_, case
+from sqlalchemy import func, or_
+from sqlalchemy.orm import joinedload
 from extensions import db
-from models.models import Invoice, InvoiceItem, Product
+from models.models import Invoice, Product
+from utils.decorators import role_required
+from utils.report_cache import REPORT_CACHE
+from utils.time_buckets import day_range
+from utils.sales_rollups import (
+    sales_summary, sales_by_payment_method, sales_by_hour, top_products,
+    sales_by_day as daily_sales
+)
 
 reports_bp = Blueprint('reports', __name__, url_prefix='/reports')
 
@@ -47,133 +55,50 @@ def index():
         start_date = default_start
         end_date = today
     
-    # Convertir fechas a datetime en zona horaria local (CO_TZ)
-    start_datetime_local = datetime.combine(start_date, datetime.min.time()).replace(tzinfo=CO_TZ)
-    end_datetime_local = datetime.combine(end_date, datetime.max.time()).replace(tzinfo=CO_TZ)
+    # Métricas desde rollups pre-agregados por día/hora local (utils/sales_rollups.py):
+    # el costo depende de los días del rango, no de la cantidad de facturas.
+    # Cada sección se cachea por rango (utils/report_cache.py) y se invalida
+    # solo cuando una factura/NC toca un día del rango
+    def cached(section, compute):
+        return REPORT_CACHE.get_or_compute(section, start_date, end_date, compute)
     
-    # Convertir a UTC para queries en base de datos
-    start_datetime = start_datetime_local.astimezone(timezone.utc)
-    end_datetime = end_datetime_local.astimezone(timezone.utc)
-    
-    # Consultar facturas en el rango de fechas
-    invoices_query = Invoice.query.filter(
-        Invoice.date >= start_datetime,
-        Invoice.date <= end_datetime
-    )
-    total_invoices = invoices_query.count()
-    invoices = invoices_query.order_by(Invoice.date.desc()).all()
-    
-    # Calcular ingresos totales (facturas - NC)
-    total_revenue_query = db.session.query(
-        func.sum(
-            case(
-                (Invoice.document_type == 'credit_note', -Invoice.total),
-                else_=Invoice.total
-            )
-        )
-    ).filter(
-        Invoice.date >= start_datetime,
-        Invoice.date <= end_datetime
-    ).scalar()
-    
-    total_revenue = total_revenue_query or 0.0
-    
-    # Calcular utilidades (precio venta - precio compra)
-    # Para NC: restar la utilidad (multiplicar por -1)
-    profit_query = db.session.query(
-        func.sum(
-            case(
-                (Invoice.document_type == 'credit_note',
-                 -(InvoiceItem.price - Product.purchase_price) * InvoiceItem.quantity),
-                else_=(InvoiceItem.price - Product.purchase_price) * InvoiceItem.quantity
-            )
-        )
-    ).join(
-        Invoice, InvoiceItem.invoice_id == Invoice.id
-    ).join(
-        Product, InvoiceItem.product_id == Product.id
-    ).filter(
-        Invoice.date >= start_datetime,
-        Invoice.date <= end_datetime
-    ).scalar()
-    
-    total_profit = profit_query or 0.0
+    summary = cached('summary', lambda: sales_summary(start_date, end_date))
+    total_invoices = summary['document_count']
+    total_revenue = summary['revenue']
+    total_profit = summary['profit']
     
     # Métricas derivadas
     profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0.0
     avg_ticket = (total_revenue / total_invoices) if total_invoices > 0 else 0.0
     
     # Análisis por método de pago
-    payment_methods_data = db.session.query(
-        Invoice.payment_method,
-        func.count(Invoice.id).label('count'),
-        func.sum(Invoice.total).label('total')
-    ).filter(
-        Invoice.date >= start_datetime,
-        Invoice.date <= end_datetime
-    ).group_by(Invoice.payment_method).all()
-    
     payment_methods = [
         {
-            'method': pm.payment_method,
-            'count': pm.count,
-            'total': pm.total or 0.0,
-            'percentage': (pm.total or 0.0) / total_revenue * 100 if total_revenue > 0 else 0
+            'method': pm['method'],
+            'count': pm['count'],
+            'total': pm['total'],
+            'percentage': pm['total'] / total_revenue * 100 if total_revenue > 0 else 0
         }
-        for pm in payment_methods_data
+        for pm in cached('payment_methods', lambda: sales_by_payment_method(start_date, end_date))
     ]
     
     # Análisis de ventas por hora del día
-    invoices_with_hours = []
-    for invoice in invoices:
-        if invoice.date:
-            if invoice.date.tzinfo is None:
-                local_time = invoice.date.replace(tzinfo=timezone.utc).astimezone(CO_TZ)
-            else:
-                local_time = invoice.date.astimezone(CO_TZ)
-            
-            invoices_with_hours.append({
-                'hour': local_time.hour,
-                'total': invoice.total
-            })
-    
-    hours_data = {}
-    for inv in invoices_with_hours:
-        hour = inv['hour']
-        if hour not in hours_data:
-            hours_data[hour] = {'count': 0, 'total': 0.0}
-        hours_data[hour]['count'] += 1
-        hours_data[hour]['total'] += inv['total']
-    
     peak_hours = [
         {
-            'hour': f"{hour:02d}:00",
+            'hour': f"{data['hour']:02d}:00",
             'count': data['count'],
             'total': data['total'],
             'avg': data['total'] / data['count'] if data['count'] > 0 else 0
         }
-        for hour, data in sorted(hours_data.items())
+        for data in cached('peak_hours', lambda: sales_by_hour(start_date, end_date))
     ]
     
     # Distribución de ventas por día
-    invoices_by_day = {}
-    for invoice in invoices:
-        if invoice.date:
-            if invoice.date.tzinfo is None:
-                local_time = invoice.date.replace(tzinfo=timezone.utc).astimezone(CO_TZ)
-            else:
-                local_time = invoice.date.astimezone(CO_TZ)
-            
-            day_key = local_time.date()
-            
-            if day_key not in invoices_by_day:
-                invoices_by_day[day_key] = {'count': 0, 'total': 0.0}
-            invoices_by_day[day_key]['count'] += 1
-            invoices_by_day[day_key]['total'] += invoice.total
-    
-    sales_by_day = [
-        {
-            'date': day.strftime('%Y-%m-%d'),
+    sales_by_day = []
+    for data in cached('sales_by_day', lambda: daily_sales(start_date, end_date)):
+        day = datetime.strptime(data['day'], '%Y-%m-%d').date()
+        sales_by_day.append({
+            'date': data['day'],
             'date_formatted': day.strftime('%d/%m/%Y'),
             'day_name': day.strftime('%A'),  # Nombre del día (Monday, Tuesday, etc.)
             'weekday': day.weekday(),  # 0=Monday, 6=Sunday
@@ -181,9 +106,7 @@ def index():
             'count': data['count'],
             'total': data['total'],
             'avg': data['total'] / data['count'] if data['count'] > 0 else 0
-        }
-        for day, data in sorted(invoices_by_day.items())
-    ]
+        })
     
     # Calcular promedio móvil de 7 días
     moving_avg_7days = []
@@ -208,25 +131,6 @@ def index():
     }
     
     # Top productos más vendidos
-    top_products = db.session.query(
-        Product.name,
-        Product.code,
-        func.sum(InvoiceItem.quantity).label('quantity_sold'),
-        func.sum(InvoiceItem.quantity * InvoiceItem.price).label('revenue')
-    ).join(
-        InvoiceItem, Product.id == InvoiceItem.product_id
-    ).join(
-        Invoice, InvoiceItem.invoice_id == Invoice.id
-    ).filter(
-        Invoice.date >= start_datetime,
-        Invoice.date <= end_datetime,
-        ~Product.code.like('SERV-%')
-    ).group_by(
-        Product.id
-    ).order_by(
-        func.sum(InvoiceItem.quantity).desc()
-    ).limit(20).all()
-    
     top_products_list = [
         {
             'name': prod.name,
@@ -234,31 +138,10 @@ def index():
             'quantity': prod.quantity_sold,
             'revenue': prod.revenue
         }
-        for prod in top_products
+        for prod in cached('top_units', lambda: top_products(start_date, end_date, order_by='units'))
     ]
     
     # Productos más rentables por margen
-    most_profitable_products = db.session.query(
-        Product.name,
-        Product.code,
-        Product.sale_price,
-        Product.purchase_price,
-        func.sum(InvoiceItem.quantity).label('quantity_sold'),
-        func.sum((InvoiceItem.price - Product.purchase_price) * InvoiceItem.quantity).label('total_profit')
-    ).join(
-        InvoiceItem, Product.id == InvoiceItem.product_id
-    ).join(
-        Invoice, InvoiceItem.invoice_id == Invoice.id
-    ).filter(
-        Invoice.date >= start_datetime,
-        Invoice.date <= end_datetime,
-        ~Product.code.like('SERV-%')
-    ).group_by(
-        Product.id
-    ).order_by(
-        func.sum((InvoiceItem.price - Product.purchase_price) * InvoiceItem.quantity).desc()
-    ).limit(20).all()
-    
     most_profitable_list = [
         {
             'name': prod.name,
@@ -269,9 +152,14 @@ def index():
             'total_profit': prod.total_profit,
             'profit_margin': ((prod.sale_price - prod.purchase_price) / prod.sale_price * 100) if prod.sale_price > 0 else 0
         }
-        for prod in most_profitable_products
+        for prod in cached('top_profit', lambda: top_products(start_date, end_date, order_by='profit'))
     ]
     
+    # Últimas ventas del rango (días locales como rango UTC [inicio, fin))
+    recent_invoices = Invoice.query.options(joinedload(Invoice.customer)).filter(
+        day_range(Invoice.date, start_date, end_date)
+    ).order_by(Invoice.date.desc()).limit(20).all()
+    
     # Estado actual de inventario (excluye productos a necesidad: stock_min = 0)
     low_stock_products = Product.query.filter(
         Product.stock <= func.coalesce(Product.stock_warning, Product.stock_min + 2, 3),
@@ -305,6 +193,18 @@ def index():
         low_stock_products=low_stock_products,
         inventory_value=inventory_value,
         inventory_potential=inventory_potential,
-        invoices=invoices[:20],
+        invoices=recent_invoices,
         CO_TZ=CO_TZ
     )
+
+
+@reports_bp.route('/cache-stats')
+@login_required
+@role_required('admin')
+def cache_stats():
+    """Contadores de la caché de reportes (hits, misses, evictions, invalidations).
+    
+    Returns:
+        JSON con las estadísticas de REPORT_CACHE
+    """
+    return jsonify(REPORT_CACHE.stats())
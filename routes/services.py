@@ -21,6 +21,9 @@ from models.models import (
 )
 from utils.decorators import role_required
 from utils.backup import auto_backup
+from utils.time_buckets import day_range
+from utils.numbering import next_document_number
+from utils.context_cache import setting_snapshot
 
 # Crear blueprint
 services_bp = Blueprint('services', __name__, url_prefix='/services')
@@ -691,9 +694,7 @@ def appointment_finish(id):
     
     # Generar la factura al finalizar la cita
     try:
-        setting = Setting.get()
-        number = f"{setting.invoice_prefix}-{setting.next_invoice_number:06d}"
-        setting.next_invoice_number += 1
+        number = next_document_number(setting_snapshot().invoice_prefix)
         
         # Preparar notas de la factura
         if appointment.scheduled_at:
@@ -827,9 +828,9 @@ def appointment_whatsapp_summary():
             'error': 'Formato de fecha inválido. Use YYYY-MM-DD'
         }), 400
     
-    # Obtener citas del día ordenadas por hora
+    # Obtener citas del día ordenadas por hora (scheduled_at se guarda en hora local)
     appointments = Appointment.query.filter(
-        db.func.date(Appointment.scheduled_at) == target_date
+        day_range(Appointment.scheduled_at, target_date, target_date, stored_utc=False)
     ).order_by(Appointment.scheduled_at).all()
     
     if not appointments:
@@ -6,6 +6,10 @@ from flask_login import login_required
 from extensions import db
 from models.models import Setting, Technician
 from utils.decorators import role_required
+from utils.context_cache import invalidate_setting
+from utils.numbering import peek_next_number, set_next_number
+from utils.sql_profiler import SQL_PROFILES
+from utils.slow_queries import slow_query_log
 
 settings_bp = Blueprint('settings', __name__, url_prefix='/settings')
 
@@ -23,7 +27,12 @@ def index():
             setting.phone = request.form.get('phone', setting.phone)
             setting.email = request.form.get('email', setting.email)
             setting.invoice_prefix = request.form.get('invoice_prefix', setting.invoice_prefix)
-            setting.next_invoice_number = int(request.form.get('next_invoice_number', setting.next_invoice_number))
+            # Solo si el admin cambió el número mostrado: las ventas hechas
+            # mientras el formulario estaba abierto no deben rebobinarse
+            next_invoice_number = request.form.get('next_invoice_number', type=int)
+            if next_invoice_number and next_invoice_number != request.form.get('next_invoice_number_shown', type=int):
+                set_next_number(next_invoice_number)
+                setting.next_invoice_number = next_invoice_number
             setting.iva_responsable = True if request.form.get('iva_responsable') == 'on' else False
             setting.document_type = request.form.get('document_type', setting.document_type)
             tax_rate_input = request.form.get('tax_rate', '')
@@ -48,6 +57,7 @@ def index():
                     flash('Formato de imagen no soportado', 'danger')
             
             db.session.commit()
+            invalidate_setting()
             flash('Configuración guardada exitosamente', 'success')
             return redirect(url_for('settings.index'))
         except Exception as e:
@@ -55,7 +65,48 @@ def index():
             flash(f'Error al guardar configuración: {str(e)}', 'error')
     
     
-    return render_template('settings/form.html', setting=setting)
+    return render_template('settings/form.html', setting=setting,
+                           next_invoice_number=peek_next_number())
+
+
+# ==================== INSTRUMENTACIÓN SQL ====================
+
+@settings_bp.route('/sql-profile', methods=['GET', 'POST'])
+@role_required('admin')
+def sql_profile():
+    """Últimos requests medidos: tiempo total, tiempo de BD, consultas y N+1."""
+    if request.method == 'POST':
+        SQL_PROFILES.clear()
+        flash('Historial de instrumentación SQL limpiado', 'success')
+        return redirect(url_for('settings.sql_profile'))
+    
+    return render_template(
+        'settings/sql_profile.html',
+        enabled=current_app.config.get('SQL_PROFILING', False),
+        sample_rate=current_app.config.get('SQL_PROFILING_SAMPLE_RATE', 1.0),
+        threshold=current_app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 10),
+        endpoints=SQL_PROFILES.by_endpoint(),
+        profiles=SQL_PROFILES.entries()
+    )
+
+
+@settings_bp.route('/slow-queries', methods=['GET', 'POST'])
+@role_required('admin')
+def slow_queries():
+    """Consultas lentas agrupadas por sentencia, con su plan de ejecución."""
+    log = slow_query_log()
+    if request.method == 'POST':
+        if log is not None:
+            log.clear()
+        flash('Historial de consultas lentas limpiado', 'success')
+        return redirect(url_for('settings.slow_queries'))
+    
+    return render_template(
+        'settings/slow_queries.html',
+        threshold_ms=current_app.config.get('SLOW_QUERY_THRESHOLD_MS', 0),
+        log_file=current_app.config.get('SLOW_QUERY_LOG_FILE'),
+        groups=log.by_statement() if log is not None else []
+    )
 
 
 # ==================== RUTAS DE GESTIÓN DE TÉCNICOS ====================
@@ -8,7 +8,8 @@ from sqlalchemy import or_, func
 from datetime import datetime
 
 from extensions import db
-from models.models import Supplier, Product, product_supplier, InvoiceItem
+from models.models import Supplier, Product, product_supplier, ProductSalesStats
+from utils.reorder import FORECAST_METHODS, NUMPY_AVAILABLE, suggest_purchase_order
 
 # Crear Blueprint
 suppliers_bp = Blueprint('suppliers', __name__, url_prefix='/suppliers')
@@ -137,18 +138,15 @@ def products(id):
     if sort_by not in allowed_fields:
         sort_by = 'stock'
     
-    # Calcular ventas totales por producto (subquery)
-    sells_subquery = db.session.query(
-        InvoiceItem.product_id,
-        func.coalesce(func.sum(InvoiceItem.quantity), 0).label('total_sells')
-    ).group_by(InvoiceItem.product_id).subquery()
+    # Ventas totales por producto desde contadores precalculados
+    total_sells = func.coalesce(ProductSalesStats.units_sold, 0)
     
     # Obtener productos con ventas totales
     products_query = db.session.query(
         Product,
-        func.coalesce(sells_subquery.c.total_sells, 0).label('sells')
+        total_sells.label('sells')
     ).outerjoin(
-        sells_subquery, Product.id == sells_subquery.c.product_id
+        ProductSalesStats, Product.id == ProductSalesStats.product_id
     ).join(
         product_supplier
     ).filter(
@@ -159,9 +157,9 @@ def products(id):
     if sort_by == 'sells':
         # Ordenamiento especial para ventas
         if sort_order == 'desc':
-            products_result = products_query.order_by(func.coalesce(sells_subquery.c.total_sells, 0).desc()).all()
+            products_result = products_query.order_by(total_sells.desc()).all()
         else:
-            products_result = products_query.order_by(func.coalesce(sells_subquery.c.total_sells, 0).asc()).all()
+            products_result = products_query.order_by(total_sells.asc()).all()
     else:
         # Ordenamiento normal para otros campos
         if sort_order == 'desc':
@@ -180,3 +178,29 @@ def products(id):
                          products=products_list,
                          sort_by=sort_by,
                          sort_order=sort_order)
+
+
+@suppliers_bp.route('/reorder')
+@login_required
+def reorder():
+    """Pedido sugerido agrupado por proveedor (pronóstico de demanda por producto)."""
+    lead_time_days = request.args.get('lead_time_days', current_app.config['REORDER_LEAD_TIME_DAYS'], type=int)
+    review_days = request.args.get('review_days', current_app.config['REORDER_REVIEW_DAYS'], type=int)
+    method = request.args.get('method', current_app.config['REORDER_FORECAST_METHOD'])
+    
+    # Validar parámetros
+    lead_time_days = min(max(lead_time_days, 1), 60)
+    review_days = min(max(review_days, 1), 90)
+    if method not in FORECAST_METHODS:
+        method = 'ses'
+    
+    groups = suggest_purchase_order(lead_time_days, review_days, method)
+    
+    return render_template('suppliers/reorder.html',
+                         groups=groups,
+                         total_units=sum(group['total_units'] for group in groups),
+                         total_cost=sum(group['total_cost'] for group in groups),
+                         lead_time_days=lead_time_days,
+                         review_days=review_days,
+                         method=method,
+                         numpy_available=NUMPY_AVAILABLE)
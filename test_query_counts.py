@@ -0,0 +1,128 @@
+"""Pruebas de cantidad de consultas SQL (regresiones N+1).
+
+Verifica que estas rutas ejecutan una cantidad fija de consultas, sin importar
+cuántos productos, códigos alternativos o movimientos haya:
+1. /api/products/search con 50 resultados
+2. Product.get_all_codes
+3. /products/<id>/stock-history
+
+Ejecución:
+    python -m pytest test_query_counts.py -v
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app
+from extensions import db
+from models.models import Product, ProductCode, Setting, User
+from utils.context_cache import CONTEXT_CACHE
+from utils.query_counter import count_queries
+from utils.stock_ledger import MOVEMENT_ADJUSTMENT, MOVEMENT_SALE, StockMovement, record_movements
+
+# Consultas esperadas por operación (ver docstring de cada prueba)
+SEARCH_QUERIES = 4
+ALL_CODES_QUERIES = 1
+STOCK_HISTORY_QUERIES = 10
+
+
+@pytest.fixture(scope='module')
+def app():
+    return create_app('testing')
+
+
+@pytest.fixture(scope='module')
+def products(app):
+    """IDs de 60 productos 'churu', cada uno con 3 códigos alternativos.
+
+    Los requests se hacen fuera de este app context: cada uno usa su propia
+    sesión, como en producción (sin objetos ya cargados en memoria).
+    """
+    with app.app_context():
+        Setting.get()  # La configuración ya existe (el primer request no la crea)
+        items = [
+            Product(code=f'77070{i:04d}', name=f'Churu Cat {i}', sale_price=1000 + i,
+                    purchase_price=500, stock=100, category='Gatos')
+            for i in range(60)
+        ]
+        db.session.add_all(items)
+        db.session.flush()
+        db.session.add_all(
+            ProductCode(product_id=product.id, code=f'ALT{product.id}-{n}', code_type='alternative')
+            for product in items for n in range(3)
+        )
+        db.session.commit()
+        return [product.id for product in items]
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    return client
+
+
+def _add_movements(app, product_id, count):
+    """Registra `count` movimientos (ventas y ajustes) en el libro de stock."""
+    start = datetime.utcnow() - timedelta(days=count)
+    with app.app_context():
+        product = db.session.get(Product, product_id)
+        for n in range(count):
+            is_sale = n % 3
+            quantity = -1 if is_sale else 5
+            product.stock += quantity
+            record_movements([StockMovement(product_id, quantity,
+                                            MOVEMENT_SALE if is_sale else MOVEMENT_ADJUSTMENT)],
+                             created_at=start + timedelta(days=n))
+        db.session.commit()
+
+
+def test_products_search_fixed_queries(client, products):
+    """50 resultados: usuario, FTS, productos y códigos alternativos en un IN."""
+    with count_queries() as counter:
+        response = client.get('/api/products/search', query_string={'q': 'churu', 'limit': 50})
+
+    results = response.get_json()
+    assert len(results) == 50
+    assert all(len(result['alternative_codes']) == 3 for result in results)
+    assert counter.count == SEARCH_QUERIES, counter.statements
+
+
+def test_get_all_codes_fixed_queries(app, products):
+    """Un producto: una consulta de códigos alternativos."""
+    with app.app_context():
+        product = db.session.get(Product, products[0])
+        with count_queries() as counter:
+            codes = product.get_all_codes()
+
+    assert codes[0]['code'] == product.code
+    assert len(codes) == 4
+    assert counter.count == ALL_CODES_QUERIES, counter.statements
+
+
+def test_stock_history_fixed_queries(app, client, products):
+    """Misma cantidad de consultas con 10 que con 120 movimientos.
+
+    7 de la página (usuario, producto, página del libro, última fila y fila
+    previa a la ventana, ventas por mes, códigos) + 3 del layout, que se
+    cuentan siempre vaciando CONTEXT_CACHE.
+    """
+    counts = []
+    for product_id, movements in ((products[0], 10), (products[1], 120)):
+        _add_movements(app, product_id, movements)
+        CONTEXT_CACHE.invalidate()
+        with count_queries() as counter:
+            response = client.get(f'/products/{product_id}/stock-history')
+        assert response.status_code == 200
+        counts.append(counter.count)
+
+    assert counts == [STOCK_HISTORY_QUERIES, STOCK_HISTORY_QUERIES], counts
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
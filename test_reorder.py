@@ -0,0 +1,101 @@
+"""Pruebas del motor de pedido sugerido (utils/reorder.py).
+
+Verifica:
+1. Pronóstico en Python puro sobre una serie fija (valores esperados)
+2. El camino NumPy y el de Python puro dan el mismo resultado
+3. Punto de pedido y cantidad, incluido stock negativo (preventas)
+
+Ejecución:
+    python -m pytest test_reorder.py -v
+"""
+
+import random
+from collections import namedtuple
+from datetime import date, timedelta
+
+import pytest
+
+import utils.reorder as reorder
+
+START_DAY = date(2026, 8, 22)
+HORIZON_START = START_DAY + timedelta(days=reorder.HISTORY_DAYS)
+HORIZON_DAYS = 10
+
+_Product = namedtuple('_Product', 'stock stock_min stock_warning')
+
+
+def _fixed_sales():
+    """Serie fija: 200 productos con estacionalidad, sin ventas y devoluciones."""
+    rng = random.Random(20261017)
+    product_ids = list(range(1, 201))
+    rows = []
+    for product_id in product_ids:
+        base = rng.random() * 4
+        for offset in range(reorder.HISTORY_DAYS):
+            day = START_DAY + timedelta(days=offset)
+            if product_id % 5 and rng.random() < 0.6:
+                quantity = int(base * (2 if day.weekday() == 5 else 1) + rng.randint(0, 2))
+                if rng.random() < 0.03:
+                    quantity = -1  # Día con solo una devolución (NC)
+                rows.append((day.isoformat(), product_id, quantity))
+    return product_ids, rows
+
+
+def _forecast(monkeypatch, use_numpy, product_ids, rows, method):
+    monkeypatch.setattr(reorder, 'NUMPY_AVAILABLE', use_numpy)
+    return reorder.forecast_demand(product_ids, rows, START_DAY, reorder.HISTORY_DAYS,
+                                   HORIZON_START, HORIZON_DAYS, method)
+
+
+@pytest.mark.parametrize('method', reorder.FORECAST_METHODS)
+def test_python_forecast_fixed_series(monkeypatch, method):
+    """Demanda constante de 2/día: pronóstico 2/día sin desviación; sin ventas: 0."""
+    rows = [((START_DAY + timedelta(days=offset)).isoformat(), 1, 2)
+            for offset in range(reorder.HISTORY_DAYS)]
+    daily, sigmas = _forecast(monkeypatch, False, [1, 2], rows, method)
+
+    assert daily[0] == pytest.approx([2.0] * HORIZON_DAYS)
+    assert sigmas[0] == pytest.approx(0.0)
+    assert daily[1] == [0.0] * HORIZON_DAYS
+    assert sigmas[1] == 0.0
+
+
+@pytest.mark.parametrize('method', reorder.FORECAST_METHODS)
+def test_numpy_matches_python(monkeypatch, method):
+    """Ambos caminos del pronóstico dan el mismo resultado sobre la serie fija."""
+    pytest.importorskip('numpy')
+    product_ids, rows = _fixed_sales()
+
+    python_daily, python_sigmas = _forecast(monkeypatch, False, product_ids, rows, method)
+    numpy_daily, numpy_sigmas = _forecast(monkeypatch, True, product_ids, rows, method)
+
+    for expected, actual in zip(python_daily, numpy_daily):
+        assert actual == pytest.approx(expected, rel=1e-9, abs=1e-9)
+    assert numpy_sigmas == pytest.approx(python_sigmas, rel=1e-9, abs=1e-9)
+
+
+def test_reorder_line_thresholds():
+    """Sin demanda: punto de pedido = stock_warning; sobre él no se pide."""
+    line = reorder.reorder_line(_Product(2, 2, 5), [0.0] * HORIZON_DAYS, 0.0, 3)
+    assert line['reorder_point'] == 5
+    assert line['order_up_to'] == 5
+    assert line['quantity'] == 3
+
+    line = reorder.reorder_line(_Product(6, 2, 5), [0.0] * HORIZON_DAYS, 0.0, 3)
+    assert line['quantity'] == 0
+
+
+def test_reorder_line_negative_stock():
+    """Stock negativo (preventas): la cantidad cubre también lo adeudado."""
+    daily = [1.0] * HORIZON_DAYS
+    line = reorder.reorder_line(_Product(-5, 1, 3), daily, 0.0, 3)
+
+    # Punto de pedido: 3 (entrega) + 1 (stock_min); pedir hasta: + 7 (revisión)
+    assert line['reorder_point'] == 4
+    assert line['order_up_to'] == 11
+    assert line['quantity'] == 16
+    assert -5 + line['quantity'] == line['order_up_to']
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
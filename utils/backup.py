@@ -1,78 +1,253 @@
-"""Utilidades de backup automático para la base de datos SQLite."""
+"""Green-POS - Servicio de Backup de la Base de Datos
+Backups periódicos de app.db en un hilo en segundo plano, guardados como
+cadena de completos comprimidos + incrementales por página
+(utils/backup_store.py, en instance/backups/).
+
+- La fecha del último backup vive en memoria (BACKUP_SERVICE.last_backup):
+  se lee del disco una sola vez al iniciar, no en cada request
+- auto_backup() solo compara esa fecha; si toca backup lanza el hilo y el
+  request continúa sin esperar
+- La copia usa la API de backup en línea de SQLite por pasos con pausa
+  (BACKUP_PAGES_PER_STEP / BACKUP_STEP_SLEEP): la caja sigue escribiendo y
+  el resultado es una imagen consistente de la base
+- Tras cada backup: verificación opcional (restauración temporal +
+  PRAGMA integrity_check) y poda según la retención diaria/semanal/mensual
+- Si un backup falla (disco lleno, archivo bloqueado) no se reintenta hasta
+  pasados BACKUP_RETRY_MINUTES: los requests no lanzan una copia por vez
+
+Restauración: migrations/restore_backup.py
+"""
 
 import os
-import shutil
-import glob
+import threading
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import current_app
 
-DB_PATH = 'instance/app.db'
-BACKUP_DIR = 'instance'
-BACKUP_PATTERN = 'app_backup_*.db'
-BACKUP_INTERVAL_DAYS = 7
+from extensions import db
+from utils.backup_store import (
+    BackupError, BackupStore, DEFAULT_FULL_EVERY, DEFAULT_KEEP_DAILY, DEFAULT_KEEP_MONTHLY,
+    DEFAULT_KEEP_WEEKLY, DEFAULT_PAGES_PER_STEP, DEFAULT_STEP_SLEEP
+)
+
+BACKUP_INTERVAL_DAYS = 1
+BACKUP_RETRY_MINUTES = 30
+BACKUP_SUBDIR = 'backups'
+
+
+class BackupService:
+    """Programa y ejecuta backups en línea de la base SQLite (uno a la vez)."""
+
+    def __init__(self):
+        self.db_path = None
+        self.store = None
+        self.interval = timedelta(days=BACKUP_INTERVAL_DAYS)
+        self.retry_delay = timedelta(minutes=BACKUP_RETRY_MINUTES)
+        self.pages_per_step = DEFAULT_PAGES_PER_STEP
+        self.step_sleep = DEFAULT_STEP_SLEEP
+        self.verify = True
+        self.last_backup = None
+        self.last_error = None
+        self.last_failure = None
+        self.force_full = False     # Tras una verificación fallida: no encadenar
+        self.logger = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return bool(self.db_path and self.store and self.interval)
+
+    @property
+    def running(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def configure(self, app):
+        """Toma rutas, throttling y retención de la app y lee el último backup.
+
+        Debe llamarse dentro de un app context (requiere db.engine). Las bases
+        en memoria (testing) dejan el servicio desactivado.
+
+        Args:
+            app: Instancia de Flask
+        """
+        database = db.engine.url.database
+        if not database or database == ':memory:':
+            self.db_path = None
+            return
+
+        self.db_path = os.path.abspath(database)
+        self.store = make_store(app.config, os.path.dirname(self.db_path))
+        self.interval = timedelta(days=app.config.get('BACKUP_INTERVAL_DAYS', BACKUP_INTERVAL_DAYS))
+        self.pages_per_step = app.config.get('BACKUP_PAGES_PER_STEP', DEFAULT_PAGES_PER_STEP)
+        self.step_sleep = app.config.get('BACKUP_STEP_SLEEP', DEFAULT_STEP_SLEEP)
+        self.verify = app.config.get('BACKUP_VERIFY', True)
+        self.retry_delay = timedelta(minutes=app.config.get('BACKUP_RETRY_MINUTES', BACKUP_RETRY_MINUTES))
+        self.logger = app.logger
+        latest = self.store.latest()
+        self.last_backup = datetime.fromisoformat(latest['created_at']) if latest else None
+
+    def is_due(self, now=None):
+        """True si nunca hubo backup o el último supera el intervalo (sin tocar disco).
+
+        Tras un fallo espera retry_delay antes de volver a intentarlo.
+        """
+        if not self.enabled:
+            return False
+        now = now or datetime.now()
+        if self.last_failure is not None and now - self.last_failure < self.retry_delay:
+            return False
+        if self.last_backup is None:
+            return True
+        return now - self.last_backup >= self.interval
+
+    def schedule(self, reason=''):
+        """Lanza un backup en segundo plano si toca y no hay otro en curso.
+
+        Args:
+            reason: Texto para el log (ej: nombre de la vista)
+
+        Returns:
+            bool: True si se lanzó el hilo
+        """
+        if not self.is_due():
+            return False
+        with self._lock:
+            if self.running or not self.is_due():
+                return False
+            self._thread = threading.Thread(
+                target=self._run_in_background, args=(reason,),
+                name='greenpos-backup', daemon=True
+            )
+            self._thread.start()
+        return True
+
+    def _run_in_background(self, reason):
+        path = self.run_backup(reason)
+        if path and reason:
+            self._log('info', f"Backup automático creado ({reason}): {path}")
+
+    def run_backup(self, label=None):
+        """Crea un backup, lo verifica y poda los antiguos (bloquea al llamador).
+
+        Args:
+            label: Motivo guardado en el manifiesto
+
+        Returns:
+            str|None: Ruta del archivo de backup o None si falló
+        """
+        if not self.enabled:
+            return None
+        if not os.path.exists(self.db_path):
+            self.last_failure = datetime.now()
+            self._log('error', f"Base de datos no encontrada: {self.db_path}")
+            return None
 
+        started = datetime.now()
+        try:
+            entry = self.store.snapshot(self.db_path, label=label,
+                                        pages_per_step=self.pages_per_step,
+                                        step_sleep=self.step_sleep,
+                                        force_full=self.force_full)
+            if self.verify:
+                ok, message = self.store.verify(entry['name'])
+                if not ok:
+                    # La cadena puede estar dañada: descartar y empezar con un completo
+                    self.store.discard(entry['name'])
+                    self.force_full = True
+                    raise BackupError(f"Backup {entry['name']} no pasó la verificación "
+                                      f"(descartado): {message}")
+            self.force_full = False
+            removed = self.store.prune()
+        except Exception as e:
+            self.last_error = str(e)
+            self.last_failure = datetime.now()
+            self._log('error', f"Error creando backup (reintento en {self.retry_delay}): {e}")
+            return None
+
+        self.last_backup = started
+        self.last_error = None
+        self.last_failure = None
+        elapsed = (datetime.now() - started).total_seconds()
+        self._log('info', (
+            f"Backup {entry['kind']} creado: {entry['file']} "
+            f"({entry['pages_written']}/{entry['page_count']} páginas, "
+            f"{entry['stored_size'] / 1024:.0f} KB, {elapsed:.1f}s"
+            f"{f', {len(removed)} antiguos eliminados' if removed else ''})"
+        ))
+        return self.store.data_path(entry)
+
+    def wait(self, timeout=None):
+        """Espera el backup en curso (scripts y pruebas)."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _log(self, level, message):
+        if self.logger is not None:
+            getattr(self.logger, level)(message)
+
+
+# Instancia compartida del proceso
+BACKUP_SERVICE = BackupService()
+
+
+def make_store(config, instance_dir):
+    """BackupStore configurado desde app.config (o config.Config en scripts).
+
+    Args:
+        config: Mapeo u objeto con las claves BACKUP_*
+        instance_dir: Carpeta de app.db (los backups van en backups/)
 
-def get_latest_backup():
-    """Obtiene la fecha del último backup.
-    
     Returns:
-        datetime|None: Fecha del último backup o None si no existe
+        BackupStore
     """
-    backups = glob.glob(os.path.join(BACKUP_DIR, BACKUP_PATTERN))
-    if not backups:
-        return None
-    
-    # Obtener el más reciente por fecha de modificación
-    latest = max(backups, key=os.path.getmtime)
-    return datetime.fromtimestamp(os.path.getmtime(latest))
+    get = config.get if hasattr(config, 'get') else lambda key, default=None: getattr(config, key, default)
+    return BackupStore(
+        get('BACKUP_DIR') or os.path.join(instance_dir, BACKUP_SUBDIR),
+        compression=get('BACKUP_COMPRESSION'),
+        full_every=get('BACKUP_FULL_EVERY', DEFAULT_FULL_EVERY),
+        keep_daily=get('BACKUP_KEEP_DAILY', DEFAULT_KEEP_DAILY),
+        keep_weekly=get('BACKUP_KEEP_WEEKLY', DEFAULT_KEEP_WEEKLY),
+        keep_monthly=get('BACKUP_KEEP_MONTHLY', DEFAULT_KEEP_MONTHLY),
+    )
 
 
 def should_backup():
-    """Verifica si debe ejecutarse un backup basado en antigüedad.
-    
+    """Verifica si debe ejecutarse un backup (fecha en memoria).
+
     Returns:
         bool: True si han pasado más de BACKUP_INTERVAL_DAYS días
     """
-    latest = get_latest_backup()
-    
-    if latest is None:
-        return True  # No hay backups previos
-    
-    days_since = (datetime.now() - latest).days
-    return days_since >= BACKUP_INTERVAL_DAYS
-
-
-def create_backup():
-    """Crea backup de la base de datos SQLite.
-    
+    return BACKUP_SERVICE.is_due()
+
+
+def create_backup(label=None):
+    """Crea un backup de la base de datos de inmediato (síncrono).
+
     Returns:
         str|None: Ruta del backup creado o None si falló
     """
-    if not os.path.exists(DB_PATH):
-        current_app.logger.error(f"Base de datos no encontrada: {DB_PATH}")
-        return None
-    
-    backup_path = os.path.join(
-        BACKUP_DIR,
-        f'app_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
-    )
-    
-    try:
-        shutil.copy2(DB_PATH, backup_path)
-        current_app.logger.info(f"Backup creado exitosamente: {backup_path}")
-        return backup_path
-    except Exception as e:
-        current_app.logger.error(f"Error creando backup: {e}")
-        return None
+    return BACKUP_SERVICE.run_backup(label)
+
+
+def init_backup_service(app):
+    """Configura BACKUP_SERVICE desde app.config.
+
+    Debe llamarse dentro de un app context (requiere db.engine).
+
+    Args:
+        app: Instancia de Flask
+    """
+    BACKUP_SERVICE.configure(app)
 
 
 def auto_backup():
-    """Decorador para crear backup automático antes de operaciones críticas.
-    
-    Verifica la antigüedad del último backup y solo crea uno nuevo si han
-    pasado más de BACKUP_INTERVAL_DAYS días.
-    
+    """Decorador que programa un backup en segundo plano para operaciones críticas.
+
+    El request solo compara la fecha del último backup en memoria; si han
+    pasado más de BACKUP_INTERVAL_DAYS días la copia se hace en otro hilo.
+
     Example:
         @app.route('/invoices/new', methods=['POST'])
         @login_required
@@ -84,15 +259,7 @@ def auto_backup():
     def decorator(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
-            # Verificar si necesita backup
-            if should_backup():
-                backup_path = create_backup()
-                if backup_path:
-                    current_app.logger.info(
-                        f"Backup automático creado antes de {f.__name__}: {backup_path}"
-                    )
-            
-            # Ejecutar función original
+            BACKUP_SERVICE.schedule(f.__name__)
             return f(*args, **kwargs)
         return wrapped
     return decorator
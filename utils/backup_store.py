@@ -0,0 +1,495 @@
+"""Green-POS - Almacén de Backups Comprimidos e Incrementales
+Cadena de backups de app.db en instance/backups/:
+
+- Completo (full): imagen de la base comprimida en streaming (gzip, o zstd
+  si el módulo zstandard está instalado). Se restaura incluso a mano con
+  gunzip / zstd -d
+- Incremental (incr): solo las páginas que cambiaron respecto al backup
+  anterior de la cadena (registros página + contenido, comprimidos)
+- Manifiesto <nombre>.json por backup: tipo, padre, tamaño/cantidad de
+  páginas, sha256 de la imagen completa y hash corto de cada página (para
+  calcular el siguiente incremental sin descomprimir nada). Se escribe al
+  final: un backup sin manifiesto está incompleto y se ignora
+
+Cada backup parte de una copia consistente hecha con la API de backup en
+línea de SQLite (por pasos con pausa, la caja sigue escribiendo).
+
+Retención (prune): se conserva el último backup, el más reciente de cada
+uno de los últimos N días, N semanas y N meses, más los backups de los que
+dependen (su cadena hasta el completo). El resto se elimina.
+
+Verificación (verify): reconstruye la imagen en un archivo temporal,
+compara su sha256 con el manifiesto y ejecuta PRAGMA integrity_check. Un
+backup que no pasa la verificación se elimina con discard() para que ningún
+incremental se encadene a él.
+
+Solo usa la biblioteca estándar (sin Flask): lo usan utils/backup.py,
+migrations/merge_products.py y migrations/restore_backup.py.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import struct
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # Opcional: gzip es suficiente
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Compresión por defecto según disponibilidad
+DEFAULT_COMPRESSION = 'zst' if zstandard is not None else 'gz'
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Copia consistente: páginas por paso y pausa entre pasos
+DEFAULT_PAGES_PER_STEP = 256
+DEFAULT_STEP_SLEEP = 0.01
+# Si otra conexión escribe durante la copia SQLite la reinicia; tras N
+# reinicios se termina en un solo paso (en WAL no bloquea a los escritores)
+MAX_COPY_RESTARTS = 3
+
+# Cadena: un completo cada N incrementales, o si cambió gran parte de la base
+DEFAULT_FULL_EVERY = 7
+FULL_IF_CHANGED_RATIO = 0.5
+
+# Retención por defecto
+DEFAULT_KEEP_DAILY = 7
+DEFAULT_KEEP_WEEKLY = 4
+DEFAULT_KEEP_MONTHLY = 6
+
+PAGE_HASH_SIZE = 8
+_PAGE_RECORD = struct.Struct('>I')      # número de página (desde 1)
+_READ_CHUNK = 1024 * 1024
+
+
+class BackupError(Exception):
+    """Backup inexistente, incompleto o que no pasa la verificación."""
+
+
+class _CopyRestarted(Exception):
+    """La copia por pasos se reinició demasiadas veces."""
+
+
+# ==================== COPIA CONSISTENTE ====================
+
+def copy_database(source_path, target_path, pages_per_step=DEFAULT_PAGES_PER_STEP,
+                  step_sleep=DEFAULT_STEP_SLEEP):
+    """Copia la base con sqlite3.Connection.backup por pasos con pausa.
+
+    Args:
+        source_path: Base de origen (puede estar en uso)
+        target_path: Archivo destino (se sobreescribe)
+        pages_per_step: Páginas por paso (-1 = todo en un paso)
+        step_sleep: Segundos de pausa entre pasos
+    """
+    restarts = [0]
+    last_remaining = [None]
+
+    def throttle(status, remaining, total):
+        if last_remaining[0] is not None and remaining > last_remaining[0]:
+            restarts[0] += 1
+            if restarts[0] > MAX_COPY_RESTARTS:
+                raise _CopyRestarted()
+        last_remaining[0] = remaining
+        if remaining and step_sleep:
+            time.sleep(step_sleep)
+
+    source = sqlite3.connect(source_path, timeout=30)
+    try:
+        target = sqlite3.connect(target_path)
+        try:
+            try:
+                source.backup(target, pages=pages_per_step, progress=throttle)
+            except _CopyRestarted:
+                logger.warning("Backup reiniciado por escrituras concurrentes; "
+                               "se completa en un solo paso")
+                source.backup(target, pages=-1)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def _page_size(path):
+    """Tamaño de página leído del encabezado del archivo SQLite."""
+    with open(path, 'rb') as f:
+        header = f.read(100)
+    if len(header) < 100 or not header.startswith(b'SQLite format 3\x00'):
+        raise BackupError(f"No es una base SQLite: {path}")
+    size = struct.unpack('>H', header[16:18])[0]
+    return 65536 if size == 1 else size
+
+
+def _iter_pages(path, page_size):
+    with open(path, 'rb') as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                return
+            yield page
+
+
+# ==================== COMPRESIÓN ====================
+
+def _extension(compression, kind):
+    return f"{'db' if kind == 'full' else 'delta'}.{compression}"
+
+
+def _open_writer(path, compression):
+    if compression == 'gz':
+        return gzip.open(path, 'wb', compresslevel=GZIP_LEVEL)
+    if compression == 'zst':
+        if zstandard is None:
+            raise BackupError("Compresión zstd no disponible (instale zstandard)")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, 'wb'), closefd=True)
+    raise BackupError(f"Compresión desconocida: {compression}")
+
+
+def _open_reader(path, compression):
+    if compression == 'gz':
+        return gzip.open(path, 'rb')
+    if compression == 'zst':
+        if zstandard is None:
+            raise BackupError("Compresión zstd no disponible (instale zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    raise BackupError(f"Compresión desconocida: {compression}")
+
+
+def _read_exact(stream, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return bytes(data)
+
+
+# ==================== ALMACÉN ====================
+
+class BackupStore:
+    """Backups completos/incrementales de una base SQLite en un directorio."""
+
+    def __init__(self, directory, compression=None, full_every=DEFAULT_FULL_EVERY,
+                 keep_daily=DEFAULT_KEEP_DAILY, keep_weekly=DEFAULT_KEEP_WEEKLY,
+                 keep_monthly=DEFAULT_KEEP_MONTHLY):
+        self.directory = str(directory)
+        self.compression = compression or DEFAULT_COMPRESSION
+        self.full_every = full_every
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        self.keep_monthly = keep_monthly
+
+    # ---------- manifiestos ----------
+
+    def _manifest_path(self, name):
+        return os.path.join(self.directory, f'{name}.json')
+
+    def data_path(self, entry):
+        return os.path.join(self.directory, entry['file'])
+
+    def entries(self):
+        """Backups completos (con manifiesto), del más antiguo al más reciente (seq).
+
+        Returns:
+            list[dict]: Manifiestos (sin los hashes de página)
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            entry.pop('page_hashes', None)
+            entries.append(entry)
+        return sorted(entries, key=lambda entry: entry['seq'])
+
+    def get(self, name):
+        """Manifiesto completo de un backup (incluye los hashes de página)."""
+        try:
+            with open(self._manifest_path(name), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise BackupError(f"Backup no encontrado: {name}")
+
+    def latest(self):
+        entries = self.entries()
+        return entries[-1] if entries else None
+
+    def chain(self, name):
+        """Backups necesarios para restaurar `name`, del completo al pedido."""
+        by_name = {entry['name']: entry for entry in self.entries()}
+        chain = []
+        current = name
+        while current is not None:
+            entry = by_name.get(current)
+            if entry is None:
+                raise BackupError(f"Cadena incompleta: falta {current} (para {name})")
+            chain.append(entry)
+            current = entry.get('parent')
+        return list(reversed(chain))
+
+    # ---------- creación ----------
+
+    def snapshot(self, source_path, label=None, pages_per_step=DEFAULT_PAGES_PER_STEP,
+                 step_sleep=DEFAULT_STEP_SLEEP, force_full=False):
+        """Crea un backup (incremental si hay una cadena reciente compatible).
+
+        Args:
+            source_path: Base a respaldar (puede estar en uso)
+            label: Motivo opcional (ej: 'merge_products')
+            pages_per_step: Throttling de la copia consistente
+            step_sleep: Pausa entre pasos de la copia
+            force_full: Ignora la cadena y crea un completo
+
+        Returns:
+            dict: Manifiesto del backup creado (sin los hashes de página)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        created = datetime.now()
+        stamp = created.strftime('%Y%m%d_%H%M%S')
+        staging = os.path.join(self.directory, f'.staging-{stamp}-{os.getpid()}.db')
+        try:
+            copy_database(source_path, staging, pages_per_step, step_sleep)
+            return self._write_snapshot(staging, created, label, force_full)
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+
+    def _parent_for(self, latest, page_size, force_full):
+        """Manifiesto del que parte el incremental, o None para un completo."""
+        if force_full or not self.full_every or latest is None:
+            return None
+        if latest['page_size'] != page_size:
+            return None
+        if latest['compression'] != self.compression:
+            return None
+        if latest.get('chain_length', 0) >= self.full_every:
+            return None
+        return self.get(latest['name'])
+
+    def _write_snapshot(self, image_path, created, label, force_full):
+        page_size = _page_size(image_path)
+        latest = self.latest()
+        seq = latest['seq'] + 1 if latest else 1
+        parent = self._parent_for(latest, page_size, force_full)
+        parent_hashes = base64.b64decode(parent['page_hashes']) if parent else b''
+        kind = 'incr' if parent else 'full'
+
+        name = f"{created.strftime('%Y%m%d_%H%M%S')}_{kind}"
+        suffix = 1
+        while os.path.exists(self._manifest_path(name)):
+            suffix += 1
+            name = f"{created.strftime('%Y%m%d_%H%M%S')}_{suffix}_{kind}"
+        data_file = f'{name}.{_extension(self.compression, kind)}'
+        data_path = os.path.join(self.directory, data_file)
+
+        image_hash = hashlib.sha256()
+        page_hashes = bytearray()
+        page_count = 0
+        changed = 0
+        try:
+            with _open_writer(data_path, self.compression) as out:
+                for page_count, page in enumerate(_iter_pages(image_path, page_size), start=1):
+                    image_hash.update(page)
+                    digest = hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+                    page_hashes += digest
+                    if parent is None:
+                        out.write(page)
+                        continue
+                    offset = (page_count - 1) * PAGE_HASH_SIZE
+                    if parent_hashes[offset:offset + PAGE_HASH_SIZE] != digest:
+                        out.write(_PAGE_RECORD.pack(page_count))
+                        out.write(page)
+                        changed += 1
+        except Exception:
+            if os.path.exists(data_path):
+                os.remove(data_path)
+            raise
+
+        if parent is not None and page_count and changed / page_count > FULL_IF_CHANGED_RATIO:
+            # El incremental no ahorra: se guarda como completo
+            os.remove(data_path)
+            return self._write_snapshot(image_path, created, label, force_full=True)
+
+        manifest = {
+            'seq': seq,
+            'name': name,
+            'kind': kind,
+            'file': data_file,
+            'parent': parent['name'] if parent else None,
+            'chain_length': parent.get('chain_length', 0) + 1 if parent else 0,
+            'created_at': created.isoformat(timespec='seconds'),
+            'label': label,
+            'compression': self.compression,
+            'page_size': page_size,
+            'page_count': page_count,
+            'pages_written': changed if parent else page_count,
+            'image_size': page_count * page_size,
+            'stored_size': os.path.getsize(data_path),
+            'sha256': image_hash.hexdigest(),
+            'page_hashes': base64.b64encode(bytes(page_hashes)).decode('ascii'),
+        }
+        manifest_path = self._manifest_path(name)
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+        manifest.pop('page_hashes')
+        return manifest
+
+    # ---------- restauración ----------
+
+    def restore(self, name, target_path):
+        """Reconstruye la imagen de la base de un backup en target_path.
+
+        Args:
+            name: Nombre del backup
+            target_path: Archivo destino (se sobreescribe)
+
+        Returns:
+            dict: Manifiesto del backup restaurado
+
+        Raises:
+            BackupError: Si falta un eslabón o el sha256 no coincide
+        """
+        chain = self.chain(name)
+        entry = chain[-1]
+        page_size = entry['page_size']
+
+        with open(target_path, 'wb') as target:
+            for link in chain:
+                with _open_reader(self.data_path(link), link['compression']) as stream:
+                    if link['kind'] == 'full':
+                        target.seek(0)
+                        target.truncate()
+                        while True:
+                            chunk = stream.read(_READ_CHUNK)
+                            if not chunk:
+                                break
+                            target.write(chunk)
+                        continue
+                    while True:
+                        record = _read_exact(stream, _PAGE_RECORD.size)
+                        if not record:
+                            break
+                        page = _read_exact(stream, page_size)
+                        if len(record) != _PAGE_RECORD.size or len(page) != page_size:
+                            raise BackupError(f"Incremental truncado: {link['name']}")
+                        (page_number,) = _PAGE_RECORD.unpack(record)
+                        target.seek((page_number - 1) * page_size)
+                        target.write(page)
+            target.truncate(entry['page_count'] * page_size)
+
+        image_hash = hashlib.sha256()
+        with open(target_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_READ_CHUNK), b''):
+                image_hash.update(chunk)
+        if image_hash.hexdigest() != entry['sha256']:
+            raise BackupError(f"sha256 no coincide al restaurar {name}")
+        return entry
+
+    def verify(self, name):
+        """Restaura en un temporal y ejecuta PRAGMA integrity_check.
+
+        Returns:
+            tuple: (ok, mensaje)
+        """
+        fd, temp_path = tempfile.mkstemp(suffix='.db', prefix='greenpos-verify-')
+        os.close(fd)
+        try:
+            self.restore(name, temp_path)
+            conn = sqlite3.connect(temp_path)
+            try:
+                rows = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+            finally:
+                conn.close()
+            if rows == ['ok']:
+                return True, 'ok'
+            return False, '; '.join(rows[:5])
+        except (BackupError, OSError, EOFError, sqlite3.Error) as e:
+            return False, str(e)
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(temp_path + suffix):
+                    os.remove(temp_path + suffix)
+
+    def discard(self, name):
+        """Elimina un backup que no debe usarse (ej: falló la verificación).
+
+        Args:
+            name: Nombre del backup
+
+        Raises:
+            BackupError: Si otro backup depende de él
+        """
+        entry = self.get(name)
+        dependents = [other['name'] for other in self.entries() if other.get('parent') == name]
+        if dependents:
+            raise BackupError(f"No se puede eliminar {name}: {', '.join(dependents)} depende(n) de él")
+        # Primero el manifiesto: sin él el backup se ignora aunque queden datos
+        os.remove(self._manifest_path(name))
+        if os.path.exists(self.data_path(entry)):
+            os.remove(self.data_path(entry))
+
+    # ---------- retención ----------
+
+    def _retained(self, entries):
+        """Nombres a conservar según la política diaria/semanal/mensual."""
+        keep = {entries[-1]['name']}
+        policies = (
+            (self.keep_daily, lambda created: created.date()),
+            (self.keep_weekly, lambda created: created.isocalendar()[:2]),
+            (self.keep_monthly, lambda created: (created.year, created.month)),
+        )
+        for count, period_of in policies:
+            newest_by_period = {}
+            for entry in entries:
+                newest_by_period[period_of(datetime.fromisoformat(entry['created_at']))] = entry['name']
+            for period in sorted(newest_by_period, reverse=True)[:count]:
+                keep.add(newest_by_period[period])
+
+        # Cada backup conservado necesita su cadena hasta el completo
+        by_name = {entry['name']: entry for entry in entries}
+        for name in list(keep):
+            parent = by_name[name].get('parent')
+            while parent is not None and parent in by_name and parent not in keep:
+                keep.add(parent)
+                parent = by_name[parent].get('parent')
+        return keep
+
+    def prune(self):
+        """Elimina los backups fuera de la política de retención.
+
+        Returns:
+            list[str]: Nombres eliminados
+        """
+        entries = self.entries()
+        if not entries:
+            return []
+        keep = self._retained(entries)
+        removed = []
+        for entry in entries:
+            if entry['name'] in keep:
+                continue
+            # Primero el manifiesto: un corte a mitad deja solo datos huérfanos
+            os.remove(self._manifest_path(entry['name']))
+            if os.path.exists(self.data_path(entry)):
+                os.remove(self.data_path(entry))
+            removed.append(entry['name'])
+        return removed
@@ -0,0 +1,183 @@
+"""Green-POS - Servicio de Checkout
+Crea una venta (factura + items + descuento de stock) con un número fijo de
+consultas sin importar cuántas líneas tenga la canasta. Lo usan el
+formulario de ventas (invoices.new) y la API JSON (POST /api/invoices).
+
+Flujo:
+1. Una consulta IN carga id/nombre/stock/stock_min de todos los productos
+2. La factura se inserta por ORM (flush) y los items con un INSERT en
+   bloque (executemany); los items se publican al despachador de cambios
+   (utils/invoice_changes.py) para que contadores, rollups y caché de
+   reportes se actualicen en la misma transacción
+3. El stock se descuenta en la BD con UPDATE product SET stock = stock - ?
+   en un executemany: dos cajeros vendiendo el mismo producto no pierden
+   actualizaciones (el valor leído en Python nunca se escribe de vuelta)
+4. Los movimientos se agregan a stock_ledger (utils/stock_ledger.py) en
+   otro executemany, con el stock resultante leído de la BD
+
+El servicio NO hace commit: el llamador decide (ej: aplicar notas de crédito
+antes de confirmar).
+"""
+
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import bindparam, insert, select, update
+
+from extensions import db
+from models.models import Invoice, InvoiceItem, Product
+from utils.context_cache import setting_snapshot
+from utils.invoice_changes import ItemChange, document_sign, publish_changes, to_utc_naive
+from utils.numbering import next_document_number
+from utils.stock_ledger import MOVEMENT_SALE, StockMovement, record_movements
+
+# Línea de la canasta ya validada
+CheckoutLine = namedtuple('CheckoutLine', 'product_id quantity price')
+
+# Resultado: factura agregada a la sesión (con id) y advertencias de stock
+CheckoutResult = namedtuple('CheckoutResult', 'invoice warnings')
+
+_product_table = Product.__table__
+
+# INSERT Core: sin RETURNING, un solo executemany para todas las líneas
+_INSERT_ITEMS = insert(InvoiceItem.__table__)
+
+# Descuento atómico en la BD; executemany con un set de parámetros por producto
+_DECREMENT_STOCK = (
+    update(_product_table)
+    .where(_product_table.c.id == bindparam('sold_product_id'))
+    .values(stock=_product_table.c.stock - bindparam('sold_quantity'))
+)
+
+
+class CheckoutError(ValueError):
+    """Canasta inválida (sin items, cantidades o productos inexistentes)."""
+
+
+def parse_lines(items_data):
+    """Valida las líneas recibidas del formulario o de la API.
+
+    Args:
+        items_data: Lista de dicts con product_id, quantity y price
+
+    Returns:
+        list[CheckoutLine]
+
+    Raises:
+        CheckoutError: Si la canasta está vacía o alguna línea es inválida
+    """
+    if not items_data:
+        raise CheckoutError('La venta no tiene productos')
+
+    lines = []
+    for index, item_data in enumerate(items_data, start=1):
+        try:
+            line = CheckoutLine(
+                int(item_data['product_id']),
+                int(item_data['quantity']),
+                float(item_data['price'])
+            )
+        except (KeyError, TypeError, ValueError):
+            raise CheckoutError(f'Línea {index}: producto, cantidad y precio son obligatorios')
+        if line.quantity <= 0:
+            raise CheckoutError(f'Línea {index}: la cantidad debe ser mayor a cero')
+        lines.append(line)
+    return lines
+
+
+def _stock_warnings(products, quantities):
+    """Advertencias de stock negativo/bajo mínimo según el stock leído."""
+    warnings = []
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        new_stock = product.stock - quantity
+        stock_min = product.stock_min if product.stock_min is not None else 1
+        if new_stock < 0:
+            warnings.append(f'{product.name} quedará con stock negativo ({new_stock})')
+        if new_stock < stock_min:
+            current_app.logger.warning(
+                f'Venta deja producto {product.name} con stock={new_stock} (min={stock_min})'
+            )
+    return warnings
+
+
+def create_sale(customer_id, payment_method, lines, user_id, notes=''):
+    """Crea la factura, sus items y descuenta el stock (sin commit).
+
+    NOTA: Se permite inventario negativo para casos especiales (preventa,
+    pedidos pendientes, ajustes posteriores); solo se generan advertencias.
+
+    Args:
+        customer_id: ID del cliente
+        payment_method: Método de pago ('cash', 'transfer', 'credit_note', 'mixed'...)
+        lines: list[CheckoutLine] (ver parse_lines)
+        user_id: ID del usuario que registra la venta
+        notes: Notas de la factura
+
+    Returns:
+        CheckoutResult: (invoice, warnings)
+
+    Raises:
+        CheckoutError: Si algún producto no existe
+    """
+    quantities = {}
+    for line in lines:
+        quantities[line.product_id] = quantities.get(line.product_id, 0) + line.quantity
+
+    # 1. Todos los productos de la canasta en una consulta
+    products = {
+        row.id: row for row in db.session.execute(
+            select(Product.id, Product.name, Product.stock, Product.stock_min)
+            .where(Product.id.in_(quantities))
+        )
+    }
+    missing = sorted(set(quantities) - set(products))
+    if missing:
+        raise CheckoutError(f'Productos no encontrados: {", ".join(str(pid) for pid in missing)}')
+
+    warnings = _stock_warnings(products, quantities)
+    if warnings:
+        current_app.logger.warning(f'Venta con stock negativo: {"; ".join(warnings)}')
+
+    number = next_document_number(setting_snapshot().invoice_prefix)
+
+    # 2. Factura (flush: obtiene id y publica su aporte) + items en bloque
+    invoice = Invoice(
+        number=number,
+        customer_id=customer_id,
+        payment_method=payment_method,
+        notes=notes,
+        status='pending',
+        user_id=user_id,
+        date=datetime.now(timezone.utc)
+    )
+    invoice.calculate_totals(lines)
+    db.session.add(invoice)
+    db.session.flush()
+
+    db.session.execute(_INSERT_ITEMS, [
+        {'invoice_id': invoice.id, 'product_id': line.product_id,
+         'quantity': line.quantity, 'price': line.price, 'discount': 0.0}
+        for line in lines
+    ])
+    sign = document_sign(invoice.document_type, invoice.status)
+    sold_at = to_utc_naive(invoice.date)
+    publish_changes(db.session.connection(), [
+        ItemChange(line.product_id, line.quantity, line.price, sign, sold_at, +1)
+        for line in lines
+    ])
+
+    # 3. Descuento atómico de stock
+    db.session.execute(_DECREMENT_STOCK, [
+        {'sold_product_id': product_id, 'sold_quantity': quantity}
+        for product_id, quantity in quantities.items()
+    ])
+
+    # 4. Libro de stock (balance después del descuento)
+    record_movements([
+        StockMovement(product_id, -quantity, MOVEMENT_SALE, f'Venta en factura {number}', number)
+        for product_id, quantity in quantities.items()
+    ], user_id=user_id, created_at=sold_at)
+
+    return CheckoutResult(invoice, warnings)
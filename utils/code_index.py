@@ -0,0 +1,247 @@
+"""Green-POS - Índice de Códigos en Memoria
+Mapa código → product_id (códigos principales + alternativos) mantenido en
+memoria del proceso con versión monotónica creciente.
+
+Estructura:
+- CODE_INDEX: instancia única compartida por todos los hilos de waitress
+- Escrituras ORM sobre Product.code / ProductCode invalidan el índice al
+  hacer commit (ver register_code_index_events)
+- La siguiente lectura recarga solo las columnas (code, id), calcula el delta
+  contra el mapa anterior y lo guarda en un historial corto para que los
+  clientes sincronicen con ?since=<version>
+
+Escrituras SQL directas (ej: migrations/merge_products.py) deben llamar a
+CODE_INDEX.invalidate() explícitamente.
+"""
+
+import json
+import time
+import threading
+from collections import deque
+
+from sqlalchemy import event, inspect, select
+
+from extensions import db
+from models.models import Product, ProductCode
+
+
+class CodeIndex:
+    """Índice código → product_id versionado con historial de cambios."""
+
+    def __init__(self, history_size=100):
+        self._lock = threading.Lock()
+        self._codes = None          # dict code -> product_id (se reemplaza, nunca se muta)
+        self._version = 0
+        self._stale = True
+        self._history = deque(maxlen=history_size)  # (version, {code: (old_id, new_id)})
+        self._full_json = None      # Payload serializado de la versión actual
+        self._by_product = None     # (version, dict product_id -> [codes alternativos])
+        self._primary_codes = frozenset()
+
+    # ==================== LECTURA ====================
+
+    @property
+    def version(self):
+        """Versión actual del índice (recarga si está invalidado)."""
+        self._ensure_fresh()
+        return self._version
+
+    def snapshot(self):
+        """Retorna (version, dict code → product_id). No modificar el dict."""
+        self._ensure_fresh()
+        return self._version, self._codes
+
+    def lookup(self, code):
+        """Busca un código exacto (principal o alternativo).
+
+        Args:
+            code: Código a buscar
+
+        Returns:
+            int|None: product_id o None si no existe
+        """
+        self._ensure_fresh()
+        return self._codes.get(code)
+
+    def alternative_codes_by_product(self):
+        """Mapa inverso product_id → códigos alternativos (calculado una vez por versión).
+
+        Returns:
+            dict: product_id -> list[str] (no incluye el código principal)
+        """
+        self._ensure_fresh()
+        with self._lock:
+            if self._by_product is None or self._by_product[0] != self._version:
+                primary = self._primary_codes
+                by_product = {}
+                for code, product_id in self._codes.items():
+                    if code not in primary:
+                        by_product.setdefault(product_id, []).append(code)
+                self._by_product = (self._version, by_product)
+            return self._by_product[1]
+
+    def full_json(self):
+        """Payload JSON completo de la versión actual (serializado una sola vez)."""
+        self._ensure_fresh()
+        with self._lock:
+            if self._full_json is None or self._full_json[0] != self._version:
+                payload = json.dumps({
+                    'version': self._version,
+                    'full': True,
+                    'codes': self._codes
+                })
+                self._full_json = (self._version, payload)
+            return self._full_json[1]
+
+    def changes_since(self, since):
+        """Calcula el delta entre la versión `since` y la actual.
+
+        Args:
+            since: Versión que tiene el cliente
+
+        Returns:
+            dict|None: {'added': {...}, 'changed': {...}, 'removed': [...]}
+            o None si el historial no cubre esa versión (el cliente debe
+            descargar el índice completo)
+        """
+        self._ensure_fresh()
+        with self._lock:
+            if since == self._version:
+                return {'added': {}, 'changed': {}, 'removed': []}
+            if since > self._version:
+                return None
+            if not self._history or since < self._history[0][0] - 1:
+                return None
+
+            merged = {}
+            for version, delta in self._history:
+                if version <= since:
+                    continue
+                for code, (old_id, new_id) in delta.items():
+                    first_old = merged[code][0] if code in merged else old_id
+                    merged[code] = (first_old, new_id)
+
+        added, changed, removed = {}, {}, []
+        for code, (old_id, new_id) in merged.items():
+            if old_id is None and new_id is not None:
+                added[code] = new_id
+            elif old_id is not None and new_id is None:
+                removed.append(code)
+            elif old_id != new_id:
+                changed[code] = new_id
+        return {'added': added, 'changed': changed, 'removed': removed}
+
+    # ==================== ESCRITURA ====================
+
+    def invalidate(self):
+        """Marca el índice para recarga en la próxima lectura."""
+        self._stale = True
+
+    def _ensure_fresh(self):
+        if not self._stale:
+            return
+        with self._lock:
+            if not self._stale:
+                return
+            # Limpiar antes de leer: una invalidación concurrente vuelve a marcarlo
+            self._stale = False
+            try:
+                new_codes, primary_codes = self._load_codes()
+            except Exception:
+                self._stale = True
+                raise
+
+            if primary_codes != self._primary_codes:
+                # Intercambio principal/alternativo: el mapa código → id puede no
+                # cambiar, pero el mapa inverso de alternativos sí
+                self._primary_codes = primary_codes
+                self._by_product = None
+
+            old_codes = self._codes
+            if old_codes is None:
+                # Base en milisegundos: mantiene la monotonía entre reinicios
+                self._version = max(self._version + 1, int(time.time() * 1000))
+            else:
+                delta = {}
+                for code, product_id in new_codes.items():
+                    old_id = old_codes.get(code)
+                    if old_id != product_id:
+                        delta[code] = (old_id, product_id)
+                for code, old_id in old_codes.items():
+                    if code not in new_codes:
+                        delta[code] = (old_id, None)
+                if not delta:
+                    return
+                self._version += 1
+                self._history.append((self._version, delta))
+            self._codes = new_codes
+
+    def _load_codes(self):
+        """Carga el mapa desde la BD (solo columnas, sin objetos ORM).
+
+        Usa una conexión propia: nunca ve cambios sin confirmar de la sesión
+        del request que provocó la recarga. Las bases en memoria (testing)
+        tienen una sola conexión compartida: ahí se lee con la sesión.
+
+        Returns:
+            tuple: (dict code -> product_id, frozenset de códigos principales)
+        """
+        if db.engine.url.database in (None, '', ':memory:'):
+            codes, alternative = self._read_codes(db.session)
+        else:
+            with db.engine.connect() as connection:
+                codes, alternative = self._read_codes(connection)
+        primary_codes = frozenset(code for code in codes if code not in alternative)
+        # Los códigos alternativos tienen prioridad (igual que el índice anterior)
+        codes.update(alternative)
+        return codes, primary_codes
+
+    @staticmethod
+    def _read_codes(connection):
+        codes = dict(connection.execute(select(Product.code, Product.id)).all())
+        alternative = dict(connection.execute(select(ProductCode.code, ProductCode.product_id)).all())
+        return codes, alternative
+
+
+# Instancia compartida del proceso
+CODE_INDEX = CodeIndex()
+
+_events_registered = False
+
+
+def _track_code_changes(session, flush_context, instances):
+    """before_flush: detecta cambios que afectan el mapa de códigos."""
+    if session.info.get('code_index_dirty'):
+        return
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, (Product, ProductCode)):
+            session.info['code_index_dirty'] = True
+            return
+    for obj in session.dirty:
+        if isinstance(obj, ProductCode):
+            session.info['code_index_dirty'] = True
+            return
+        # Cambios de stock/precio no afectan el índice
+        if isinstance(obj, Product) and inspect(obj).attrs.code.history.has_changes():
+            session.info['code_index_dirty'] = True
+            return
+
+
+def _invalidate_on_commit(session):
+    if session.info.pop('code_index_dirty', False):
+        CODE_INDEX.invalidate()
+
+
+def _discard_on_rollback(session, previous_transaction):
+    session.info.pop('code_index_dirty', None)
+
+
+def register_code_index_events():
+    """Registra los listeners de sesión que invalidan CODE_INDEX (idempotente)."""
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(db.session, 'before_flush', _track_code_changes)
+    event.listen(db.session, 'after_commit', _invalidate_on_commit)
+    event.listen(db.session, 'after_soft_rollback', _discard_on_rollback)
+    _events_registered = True
@@ -0,0 +1,163 @@
+"""Green-POS - Caché de Valores Globales de Templates
+Caché en memoria del proceso (con TTL e invalidación explícita) para los
+valores que los context processors inyectan en TODAS las plantillas, incluidas
+las páginas de error: configuración del negocio y estado de inventario del día.
+
+Estructura:
+- CONTEXT_CACHE: instancia única compartida por todos los hilos de waitress
+- setting_snapshot(): copia inmutable de Setting (los templates nunca tocan la BD)
+- inventory_status(): meta diaria y pendientes de inventario de hoy
+- invalidate_setting() / invalidate_inventory_status(): llamar después del
+  commit de configuración y de conteos de inventario respectivamente
+
+El TTL acota cualquier desactualización por escrituras que no invalidan
+(ej: productos nuevos cambian la meta diaria).
+"""
+
+import threading
+import time
+from calendar import monthrange
+from collections import namedtuple
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func, select
+
+from extensions import db
+from models.models import Setting, Product, ProductStockLog
+from utils.time_buckets import day_range
+
+CO_TZ = ZoneInfo("America/Bogota")
+
+# Segundos de vigencia de cada valor
+SETTING_TTL = 300
+INVENTORY_STATUS_TTL = 60
+
+
+class TTLCache:
+    """Mapa clave → valor con expiración por entrada e invalidación explícita."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}      # key -> (expires_at, value)
+        self._generation = 0    # Aumenta en cada invalidación
+
+    def get_or_compute(self, key, compute, ttl):
+        """Retorna el valor vigente o lo calcula y lo guarda por `ttl` segundos.
+
+        Args:
+            key: Clave del valor
+            compute: Callable sin argumentos que calcula el valor
+            ttl: Segundos de vigencia
+
+        Returns:
+            Valor cacheado (compartido entre hilos: no modificar)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            generation = self._generation
+
+        value = compute()
+        with self._lock:
+            # No guardar un valor calculado antes de una invalidación concurrente
+            if generation == self._generation:
+                self._entries[key] = (now + ttl, value)
+        return value
+
+    def invalidate(self, key=None):
+        """Descarta una clave (o todas si key es None)."""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+# Instancia compartida del proceso
+CONTEXT_CACHE = TTLCache()
+
+_SettingFields = namedtuple('_SettingFields', [column.name for column in Setting.__table__.columns])
+
+
+class SettingSnapshot(_SettingFields):
+    """Copia inmutable de Setting para templates.
+
+    next_invoice_number es solo el valor inicial de la secuencia: para numerar
+    documentos usar utils.numbering.next_document_number().
+    """
+    __slots__ = ()
+
+    @property
+    def document_label(self):
+        return 'Factura' if self.document_type == 'invoice' else 'Documento Equivalente POS'
+
+
+def _load_setting():
+    setting = Setting.get()
+    return SettingSnapshot(*(getattr(setting, field) for field in SettingSnapshot._fields))
+
+
+def setting_snapshot():
+    """Configuración del negocio como snapshot inmutable (cacheado).
+
+    Returns:
+        SettingSnapshot: Mismos atributos que Setting + document_label
+    """
+    return CONTEXT_CACHE.get_or_compute('setting', _load_setting, SETTING_TTL)
+
+
+def _load_inventory_status(today):
+    # Productos totales (excl. servicios)
+    total_products = db.session.execute(
+        select(func.count(Product.id)).where(Product.category != 'Servicios')
+    ).scalar()
+
+    # Meta diaria (productos / días del mes)
+    _, days_in_month = monthrange(today.year, today.month)
+    daily_target = max(1, total_products // days_in_month)
+
+    # Productos inventariados HOY (día local)
+    inventoried_today = db.session.execute(
+        select(func.count(ProductStockLog.id)).where(
+            ProductStockLog.is_inventory == True,
+            day_range(ProductStockLog.created_at, today, today)
+        )
+    ).scalar()
+
+    return {
+        'products_pending_inventory_today': max(0, daily_target - inventoried_today),
+        'daily_inventory_target': daily_target
+    }
+
+
+def inventory_status():
+    """Meta diaria de inventario y productos pendientes hoy (cacheado por día local).
+
+    Returns:
+        dict: products_pending_inventory_today, daily_inventory_target
+    """
+    today = datetime.now(CO_TZ).date()
+
+    def compute():
+        return today, _load_inventory_status(today)
+
+    cached_day, status = CONTEXT_CACHE.get_or_compute('inventory_status', compute, INVENTORY_STATUS_TTL)
+    if cached_day != today:
+        # Cambió el día local: la meta y los conteos de ayer ya no aplican
+        CONTEXT_CACHE.invalidate('inventory_status')
+        cached_day, status = CONTEXT_CACHE.get_or_compute('inventory_status', compute, INVENTORY_STATUS_TTL)
+    return status
+
+
+def invalidate_setting():
+    """Descarta el snapshot de configuración (llamar tras guardar Setting)."""
+    CONTEXT_CACHE.invalidate('setting')
+
+
+def invalidate_inventory_status():
+    """Descarta el estado de inventario (llamar tras registrar un conteo)."""
+    CONTEXT_CACHE.invalidate('inventory_status')
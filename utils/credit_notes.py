@@ -0,0 +1,220 @@
+"""Green-POS - Saldos de Notas de Crédito
+Cada NC guarda su saldo sin aplicar (Invoice.remaining_balance) para que
+pagar con NC sea una sola lectura ordenada en lugar de sumar
+CreditNoteApplication por cada nota (N+1).
+
+Invariantes (mantenidas en la misma transacción que cada escritura):
+- NC.remaining_balance = NC.total - SUM(aplicaciones de la NC)
+- Customer.credit_balance = SUM(remaining_balance) de sus NC validadas
+
+Las restas/sumas se escriben como expresiones SQL (saldo = saldo - x):
+dos cajeros aplicando NC del mismo cliente no pisan el valor del otro.
+
+El índice parcial ix_invoice_credit_note_open (solo NC con saldo, por
+cliente y fecha) convierte la aplicación FIFO en un rango del índice.
+
+Reconciliación: migrations/reconcile_credit_notes.py
+"""
+
+from sqlalchemy import func, literal_column, select, text
+
+from extensions import db
+from models.models import CreditNoteApplication, Customer, Invoice
+
+# Diferencias menores se consideran redondeo de floats
+BALANCE_TOLERANCE = 0.01
+
+# Literales (no parámetros): SQLite solo usa el índice parcial si la consulta
+# repite textualmente los términos de su WHERE
+_IS_CREDIT_NOTE = Invoice.document_type == literal_column("'credit_note'")
+_HAS_BALANCE = Invoice.remaining_balance > literal_column('0')
+
+
+def open_credit_notes(customer_id):
+    """NC validadas del cliente con saldo, más antiguas primero (FIFO).
+
+    Args:
+        customer_id: ID del cliente
+
+    Returns:
+        list[Invoice]
+    """
+    return Invoice.query.filter(
+        Invoice.customer_id == customer_id,
+        _IS_CREDIT_NOTE,
+        _HAS_BALANCE,
+        Invoice.status == 'validated'
+    ).order_by(Invoice.date.asc(), Invoice.id.asc()).all()
+
+
+def register_credit_note(credit_note, customer):
+    """Inicializa el saldo de una NC recién creada y lo suma al cliente.
+
+    Llamar después de calcular los totales de la NC.
+    """
+    credit_note.remaining_balance = credit_note.total
+    if customer:
+        customer.credit_balance = func.coalesce(Customer.credit_balance, 0) + credit_note.total
+        # Tras el flush el atributo se recarga con el valor calculado por la BD
+        db.session.flush()
+
+
+def apply_credit_notes(invoice, customer, amount, user_id):
+    """Aplica hasta `amount` de saldo de NC del cliente a una factura (FIFO).
+
+    Args:
+        invoice: Factura que se paga (con id)
+        customer: Cliente dueño de las NC
+        amount: Monto máximo a aplicar
+        user_id: Usuario que aplica
+
+    Returns:
+        list[tuple]: (nc, monto aplicado, saldo disponible antes) por NC usada
+    """
+    applied = []
+    remaining = amount
+    for credit_note in open_credit_notes(customer.id):
+        if remaining <= 0:
+            break
+        available = credit_note.remaining_balance
+        amount_to_apply = min(available, remaining)
+
+        db.session.add(CreditNoteApplication(
+            credit_note_id=credit_note.id,
+            invoice_id=invoice.id,
+            amount_applied=amount_to_apply,
+            applied_by=user_id
+        ))
+        credit_note.remaining_balance = Invoice.remaining_balance - amount_to_apply
+        remaining -= amount_to_apply
+        applied.append((credit_note, amount_to_apply, available))
+
+    total_applied = sum(amount_applied for _nc, amount_applied, _available in applied)
+    if total_applied:
+        customer.credit_balance = func.coalesce(Customer.credit_balance, 0) - total_applied
+        db.session.flush()
+    return applied
+
+
+def release_credit_note_applications(invoice):
+    """Devuelve a sus NC (y al cliente) lo aplicado a una factura que se elimina.
+
+    Returns:
+        float: Monto devuelto
+    """
+    applications = CreditNoteApplication.query.filter_by(invoice_id=invoice.id).all()
+    released = 0.0
+    for application in applications:
+        credit_note = db.session.get(Invoice, application.credit_note_id)
+        if credit_note is not None:
+            credit_note.remaining_balance = (
+                func.coalesce(Invoice.remaining_balance, 0) + application.amount_applied
+            )
+            customer = db.session.get(Customer, credit_note.customer_id)
+            if customer is not None:
+                customer.credit_balance = (
+                    func.coalesce(Customer.credit_balance, 0) + application.amount_applied
+                )
+        released += application.amount_applied
+        db.session.delete(application)
+    db.session.flush()
+    return released
+
+
+# ==================== RECONCILIACIÓN ====================
+
+def _expected_credit_note_balances():
+    """Saldo esperado de cada NC según sus aplicaciones.
+
+    Returns:
+        dict: nc_id -> (customer_id, number, saldo guardado, saldo esperado)
+    """
+    applied = (
+        select(CreditNoteApplication.credit_note_id,
+               func.sum(CreditNoteApplication.amount_applied).label('applied'))
+        .group_by(CreditNoteApplication.credit_note_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(Invoice.id, Invoice.customer_id, Invoice.number, Invoice.status,
+               Invoice.total, Invoice.remaining_balance,
+               func.coalesce(applied.c.applied, 0.0))
+        .outerjoin(applied, applied.c.credit_note_id == Invoice.id)
+        .where(Invoice.document_type == 'credit_note')
+    )
+    balances = {}
+    for nc_id, customer_id, number, status, total, stored, applied_sum in rows:
+        expected = 0.0 if status == 'cancelled' else max((total or 0.0) - applied_sum, 0.0)
+        balances[nc_id] = (customer_id, number, stored, expected)
+    return balances
+
+
+def reconcile_credit_notes(fix=False):
+    """Compara saldos guardados con los calculados desde las aplicaciones.
+
+    Args:
+        fix: Si True, corrige NC y clientes descuadrados (sin commit)
+
+    Returns:
+        dict: {
+            'credit_notes': [(number, guardado, esperado)],
+            'customers': [(customer_id, nombre, guardado, esperado)]
+        }
+    """
+    balances = _expected_credit_note_balances()
+
+    credit_notes = []
+    customer_expected = {}
+    for nc_id, (customer_id, number, stored, expected) in balances.items():
+        customer_expected[customer_id] = customer_expected.get(customer_id, 0.0) + expected
+        if stored is None or abs(stored - expected) > BALANCE_TOLERANCE:
+            credit_notes.append((number, stored, expected))
+            if fix:
+                db.session.execute(
+                    Invoice.__table__.update()
+                    .where(Invoice.__table__.c.id == nc_id)
+                    .values(remaining_balance=expected)
+                )
+
+    customers = []
+    for customer_id, name, stored in db.session.execute(
+        select(Customer.id, Customer.name, Customer.credit_balance)
+        .where((Customer.credit_balance != 0) | Customer.id.in_(customer_expected))
+    ).all():
+        expected = customer_expected.get(customer_id, 0.0)
+        if abs((stored or 0.0) - expected) > BALANCE_TOLERANCE:
+            customers.append((customer_id, name, stored, expected))
+            if fix:
+                db.session.execute(
+                    Customer.__table__.update()
+                    .where(Customer.__table__.c.id == customer_id)
+                    .values(credit_balance=expected)
+                )
+
+    return {'credit_notes': credit_notes, 'customers': customers}
+
+
+def setup_credit_note_balances():
+    """Agrega remaining_balance e índice parcial en bases existentes.
+
+    db.create_all() no altera tablas existentes: la primera vez se agrega la
+    columna y se calcula el saldo de cada NC desde sus aplicaciones. Debe
+    llamarse dentro de un app context después de db.create_all() y antes de
+    cualquier consulta ORM sobre Invoice.
+    """
+    columns = {row[1] for row in db.session.execute(text("PRAGMA table_info(invoice)"))}
+    if 'remaining_balance' not in columns:
+        db.session.execute(text("ALTER TABLE invoice ADD COLUMN remaining_balance REAL"))
+        db.session.execute(text("""
+            UPDATE invoice
+            SET remaining_balance = CASE WHEN status = 'cancelled' THEN 0 ELSE MAX(
+                total - COALESCE((SELECT SUM(a.amount_applied)
+                                  FROM credit_note_application a
+                                  WHERE a.credit_note_id = invoice.id), 0), 0) END
+            WHERE document_type = 'credit_note'
+        """))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_invoice_credit_note_open ON invoice (customer_id, date) "
+        "WHERE document_type = 'credit_note' AND remaining_balance > 0"
+    ))
+    db.session.commit()
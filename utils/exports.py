@@ -0,0 +1,232 @@
+"""Green-POS - Exportación de Datos en Streaming
+Exporta facturas, items, notas de crédito y movimientos de inventario de un
+rango de días locales como CSV (o XLSX opcional) sin cargar el rango completo
+en memoria.
+
+Estructura:
+- EXPORTS: definición de cada dataset (encabezados + consulta solo-columnas)
+- iter_rows(): ejecuta la consulta con yield_per (lotes de EXPORT_BATCH_SIZE
+  filas del cursor); la descarga comienza con el primer lote
+- csv_chunks(): serializa las filas a CSV UTF-8 con BOM (Excel) por lotes
+- xlsx_chunks(): escribe el libro fila por fila con openpyxl en modo
+  write_only a un archivo temporal y lo transmite por bloques
+
+XLSX requiere openpyxl (dependencia opcional, no está en requirements.txt):
+    pip install openpyxl
+"""
+
+import csv
+import io
+import tempfile
+
+from sqlalchemy import case, select
+from sqlalchemy.orm import aliased
+
+from extensions import db
+from models.models import Invoice, InvoiceItem, Customer, Product, ProductStockLog, User
+from utils.time_buckets import local_timestamp, utc_bounds
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+# Filas por lote del cursor (yield_per) y por bloque CSV enviado
+EXPORT_BATCH_SIZE = 1000
+
+# Tamaño de bloque al transmitir el XLSX generado
+XLSX_CHUNK_SIZE = 64 * 1024
+
+XLSX_AVAILABLE = Workbook is not None
+
+
+def _invoices_query(start, end):
+    return select(
+        Invoice.number,
+        local_timestamp(Invoice.date),
+        Customer.name,
+        Customer.document,
+        User.username,
+        Invoice.payment_method,
+        Invoice.status,
+        Invoice.subtotal,
+        Invoice.tax,
+        Invoice.discount,
+        Invoice.total,
+        Invoice.notes
+    ).join(Customer, Invoice.customer_id == Customer.id).outerjoin(
+        User, Invoice.user_id == User.id
+    ).where(
+        Invoice.document_type == 'invoice',
+        Invoice.date >= start,
+        Invoice.date < end
+    ).order_by(Invoice.date, Invoice.id)
+
+
+def _credit_notes_query(start, end):
+    reference = aliased(Invoice)
+    return select(
+        Invoice.number,
+        local_timestamp(Invoice.date),
+        reference.number,
+        Customer.name,
+        Customer.document,
+        Invoice.credit_reason,
+        Invoice.status,
+        Invoice.total,
+        case((Invoice.stock_restored == True, 'Sí'), else_='No')
+    ).join(Customer, Invoice.customer_id == Customer.id).outerjoin(
+        reference, Invoice.reference_invoice_id == reference.id
+    ).where(
+        Invoice.document_type == 'credit_note',
+        Invoice.date >= start,
+        Invoice.date < end
+    ).order_by(Invoice.date, Invoice.id)
+
+
+def _items_query(start, end):
+    return select(
+        Invoice.number,
+        Invoice.document_type,
+        local_timestamp(Invoice.date),
+        Invoice.status,
+        Product.code,
+        Product.name,
+        InvoiceItem.quantity,
+        InvoiceItem.price,
+        InvoiceItem.discount,
+        InvoiceItem.quantity * InvoiceItem.price
+    ).join(Invoice, InvoiceItem.invoice_id == Invoice.id).join(
+        Product, InvoiceItem.product_id == Product.id
+    ).where(
+        Invoice.date >= start,
+        Invoice.date < end
+    ).order_by(Invoice.date, Invoice.id, InvoiceItem.id)
+
+
+def _stock_logs_query(start, end):
+    return select(
+        local_timestamp(ProductStockLog.created_at),
+        Product.code,
+        Product.name,
+        ProductStockLog.movement_type,
+        ProductStockLog.quantity,
+        ProductStockLog.previous_stock,
+        ProductStockLog.new_stock,
+        case((ProductStockLog.is_inventory == True, 'Sí'), else_='No'),
+        ProductStockLog.reason,
+        User.username
+    ).join(Product, ProductStockLog.product_id == Product.id).outerjoin(
+        User, ProductStockLog.user_id == User.id
+    ).where(
+        ProductStockLog.created_at >= start,
+        ProductStockLog.created_at < end
+    ).order_by(ProductStockLog.created_at, ProductStockLog.id)
+
+
+# dataset -> (nombre de archivo, encabezados, constructor de consulta)
+EXPORTS = {
+    'invoices': ('facturas', [
+        'Número', 'Fecha', 'Cliente', 'Documento', 'Vendedor', 'Método de pago',
+        'Estado', 'Subtotal', 'Impuesto', 'Descuento', 'Total', 'Notas'
+    ], _invoices_query),
+    'credit_notes': ('notas_credito', [
+        'Número', 'Fecha', 'Factura referencia', 'Cliente', 'Documento', 'Motivo',
+        'Estado', 'Total', 'Stock restaurado'
+    ], _credit_notes_query),
+    'items': ('items_ventas', [
+        'Documento', 'Tipo', 'Fecha', 'Estado', 'Código', 'Producto',
+        'Cantidad', 'Precio', 'Descuento', 'Subtotal'
+    ], _items_query),
+    'stock_logs': ('movimientos_inventario', [
+        'Fecha', 'Código', 'Producto', 'Tipo', 'Cantidad', 'Stock anterior',
+        'Stock nuevo', 'Conteo inventario', 'Motivo', 'Usuario'
+    ], _stock_logs_query),
+}
+
+
+def iter_rows(dataset, start_date, end_date, batch_size=EXPORT_BATCH_SIZE):
+    """Itera las filas de un dataset en lotes del cursor (memoria constante).
+
+    Args:
+        dataset: Clave de EXPORTS
+        start_date, end_date: date locales (inclusive)
+        batch_size: Filas por lote (yield_per)
+
+    Yields:
+        tuple: Valores de la fila en el orden de los encabezados
+    """
+    start, end = utc_bounds(start_date, end_date)
+    stmt = EXPORTS[dataset][2](start, end)
+    result = db.session.execute(stmt, execution_options={'yield_per': batch_size})
+    try:
+        for row in result:
+            yield tuple(row)
+    finally:
+        result.close()
+
+
+def csv_chunks(headers, rows, batch_size=EXPORT_BATCH_SIZE):
+    """Serializa filas a CSV (UTF-8 con BOM) en bloques de batch_size filas.
+
+    Args:
+        headers: Lista de encabezados
+        rows: Iterable de tuplas
+
+    Yields:
+        bytes: Bloques del archivo CSV
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+
+    pending = 0
+    buffer.seek(0)
+    buffer.truncate()
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue().encode('utf-8')
+
+
+def xlsx_chunks(title, headers, rows):
+    """Escribe un XLSX fila por fila (openpyxl write_only) y lo transmite por bloques.
+
+    El libro se arma en un archivo temporal: el formato zip solo se puede
+    cerrar al final, pero la memoria se mantiene constante.
+
+    Args:
+        title: Nombre de la hoja
+        headers: Lista de encabezados
+        rows: Iterable de tuplas
+
+    Yields:
+        bytes: Bloques del archivo XLSX
+
+    Raises:
+        RuntimeError: Si openpyxl no está instalado
+    """
+    if not XLSX_AVAILABLE:
+        raise RuntimeError('Exportación XLSX requiere openpyxl (pip install openpyxl)')
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title[:31])
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(XLSX_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,222 @@
+"""Green-POS - Cambios de Facturas por Flush
+Punto único que detecta, en cada flush de la sesión, cómo cambió el aporte
+de facturas y notas de crédito a las ventas, y lo entrega a los consumidores
+registrados (contadores por producto, rollups de reportes, etc.) dentro de la
+MISMA transacción.
+
+Estructura:
+- Listener after_flush sobre db.session: en after_flush new/dirty/deleted y
+  el historial de atributos aún reflejan el estado previo al flush, y los IDs
+  generados ya están disponibles
+- Cada cambio se expresa como "revertir aporte anterior" (direction=-1) y
+  "sumar aporte nuevo" (direction=+1)
+- Consumidores: register_invoice_change_handler(fn) donde
+  fn(connection, item_changes, document_changes)
+- Escrituras Core que no pasan por el flush (ej: items insertados en bloque
+  por utils/checkout.py) se publican con publish_changes()
+
+Reglas de aporte (sign):
+- Factura no cancelada: +1
+- Nota de crédito no cancelada: -1 (devolución)
+- Documento cancelado: 0 (no se reporta)
+"""
+
+from collections import namedtuple
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import event, inspect
+
+from extensions import db
+from models.models import Invoice, InvoiceItem
+
+CO_TZ = ZoneInfo("America/Bogota")
+
+# Aporte de un item: sold_at es UTC naive
+ItemChange = namedtuple('ItemChange', 'product_id quantity price sign sold_at direction')
+
+# Aporte de un documento completo (conteos, totales, método de pago)
+DocumentChange = namedtuple('DocumentChange', 'sign sold_at total payment_method direction')
+
+# Atributos que cambian el aporte de un documento/item
+_INVOICE_ATTRS = ('status', 'document_type', 'date', 'total', 'payment_method')
+_ITEM_ATTRS = ('invoice_id', 'product_id', 'quantity', 'price')
+
+_handlers = []
+_events_registered = False
+
+
+def document_sign(document_type, status):
+    """Aporte de un documento a las ventas: +1, -1 (NC) o 0 (cancelado)."""
+    if status == 'cancelled':
+        return 0
+    return -1 if document_type == 'credit_note' else 1
+
+
+def to_utc_naive(value):
+    """Normaliza fechas de factura a UTC sin tzinfo (formato almacenado)."""
+    if value is None:
+        return datetime.utcnow()
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def to_local(utc_naive):
+    """Convierte una fecha UTC naive a hora local de Colombia (aware)."""
+    return utc_naive.replace(tzinfo=timezone.utc).astimezone(CO_TZ)
+
+
+def _previous(obj, attr):
+    """Valor de un atributo antes de los cambios pendientes del flush."""
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attr)
+
+
+def _has_changes(obj, attrs):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+def _document_state(invoice, previous=False):
+    """Retorna (sign, sold_at, total, payment_method) actual o previo al flush."""
+    if invoice is None:
+        return 0, None, 0.0, None
+    read = _previous if previous else getattr
+    return (
+        document_sign(read(invoice, 'document_type'), read(invoice, 'status')),
+        to_utc_naive(read(invoice, 'date')),
+        read(invoice, 'total') or 0.0,
+        read(invoice, 'payment_method')
+    )
+
+
+def _item_invoice(session, item, previous=False):
+    invoice_id = _previous(item, 'invoice_id') if previous else item.invoice_id
+    if invoice_id is None:
+        return item.invoice
+    return session.get(Invoice, invoice_id)
+
+
+def collect_changes(session):
+    """Calcula los cambios de aporte pendientes en la sesión (llamar en after_flush).
+
+    Args:
+        session: Sesión SQLAlchemy
+
+    Returns:
+        tuple: (list[ItemChange], list[DocumentChange]) sin aportes nulos
+    """
+    items = []
+    documents = []
+    handled_items = set()
+
+    def add_item(product_id, quantity, price, state, direction):
+        sign, sold_at = state[0], state[1]
+        if sign and product_id is not None and quantity:
+            items.append(ItemChange(product_id, quantity, price or 0.0, sign, sold_at, direction))
+
+    def add_document(state, direction):
+        sign, sold_at, total, payment_method = state
+        if sign:
+            documents.append(DocumentChange(sign, sold_at, total, payment_method, direction))
+
+    for obj in session.new:
+        if isinstance(obj, InvoiceItem):
+            handled_items.add(obj)
+            add_item(obj.product_id, obj.quantity, obj.price,
+                     _document_state(_item_invoice(session, obj)), +1)
+        elif isinstance(obj, Invoice):
+            add_document(_document_state(obj), +1)
+
+    for obj in session.deleted:
+        if isinstance(obj, InvoiceItem):
+            handled_items.add(obj)
+            invoice = _item_invoice(session, obj, previous=True)
+            add_item(_previous(obj, 'product_id'), _previous(obj, 'quantity'),
+                     _previous(obj, 'price'), _document_state(invoice, previous=True), -1)
+        elif isinstance(obj, Invoice):
+            add_document(_document_state(obj, previous=True), -1)
+
+    for obj in session.dirty:
+        if isinstance(obj, InvoiceItem) and obj not in handled_items and _has_changes(obj, _ITEM_ATTRS):
+            handled_items.add(obj)
+            old_invoice = _item_invoice(session, obj, previous=True)
+            add_item(_previous(obj, 'product_id'), _previous(obj, 'quantity'),
+                     _previous(obj, 'price'), _document_state(old_invoice, previous=True), -1)
+            add_item(obj.product_id, obj.quantity, obj.price,
+                     _document_state(_item_invoice(session, obj)), +1)
+
+    for obj in session.dirty:
+        if isinstance(obj, Invoice) and _has_changes(obj, _INVOICE_ATTRS):
+            old_state = _document_state(obj, previous=True)
+            new_state = _document_state(obj)
+            if old_state == new_state:
+                continue
+            add_document(old_state, -1)
+            add_document(new_state, +1)
+
+            # Items solo cambian de aporte si cambió el signo o la fecha
+            if old_state[:2] == new_state[:2]:
+                continue
+            for item in obj.items:
+                if item in handled_items:
+                    continue
+                add_item(item.product_id, item.quantity, item.price, old_state, -1)
+                add_item(item.product_id, item.quantity, item.price, new_state, +1)
+
+    return items, documents
+
+
+def publish_changes(connection, items, documents=()):
+    """Entrega cambios a los consumidores registrados.
+
+    Args:
+        connection: Conexión de la transacción en curso
+        items: list[ItemChange]
+        documents: list[DocumentChange]
+    """
+    if not items and not documents:
+        return
+    for handler in _handlers:
+        handler(connection, list(items), list(documents))
+
+
+def _dispatch_changes(session, flush_context):
+    """after_flush: entrega los cambios a los consumidores registrados."""
+    if not _handlers:
+        return
+    items, documents = collect_changes(session)
+    publish_changes(session.connection(), items, documents)
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    """Listener vacío: solo activa active_history en el atributo."""
+
+
+def register_invoice_change_handler(handler):
+    """Registra un consumidor de cambios de facturas (idempotente).
+
+    Args:
+        handler: fn(connection, item_changes, document_changes); se ejecuta
+                 dentro de la transacción del flush
+    """
+    if handler not in _handlers:
+        _handlers.append(handler)
+    _register_events()
+
+
+def _register_events():
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(db.session, 'after_flush', _dispatch_changes)
+    # Cargar el valor anterior aunque el atributo esté expirado (ej: tras un
+    # commit) para poder revertir el aporte previo del documento/item
+    for attr in _INVOICE_ATTRS:
+        event.listen(getattr(Invoice, attr), 'set', _keep_previous_value, active_history=True)
+    for attr in _ITEM_ATTRS:
+        event.listen(getattr(InvoiceItem, attr), 'set', _keep_previous_value, active_history=True)
+    _events_registered = True
@@ -0,0 +1,207 @@
+"""Green-POS - Métricas de Latencia en Formato Prometheus
+Histogramas y contadores en memoria del proceso, expuestos como texto en
+/metrics (formato de exposición de Prometheus 0.0.4) para ver qué endpoints
+ocupan los hilos de waitress.
+
+Series:
+- greenpos_http_request_duration_seconds{endpoint,method}: histograma de latencia
+- greenpos_http_requests_total{endpoint,method,status}: requests por código
+- greenpos_http_requests_in_flight: requests en curso
+- greenpos_db_duration_seconds{endpoint}: tiempo de BD por request
+- greenpos_template_render_seconds{template}: tiempo de render por template
+- greenpos_process_start_time_seconds: inicio del proceso (epoch)
+
+Costo por request: una actualización de histograma bajo lock; el tiempo de
+BD lo mide el listener compartido de utils/query_counter.py. Sin
+dependencias externas (prometheus_client no es requerido).
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+
+from utils.query_counter import request_db_time
+
+# Límites superiores (segundos) de los buckets de latencia
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """Contador monotónico con etiquetas."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    """Valor que sube y baja (ej: requests en curso)."""
+
+    kind = 'gauge'
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram:
+    """Histograma acumulativo con etiquetas (buckets fijos)."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}       # label_values -> [conteos por bucket..., +Inf, suma]
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._values.items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield (f'{self.name}_bucket',
+                       _format_labels(self.labels + ('le',), label_values + (le,)), cumulative)
+            yield f'{self.name}_count', _format_labels(self.labels, label_values), cumulative
+            yield f'{self.name}_sum', _format_labels(self.labels, label_values), round(series[-1], 6)
+
+
+class MetricsRegistry:
+    """Conjunto de métricas del proceso."""
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            'greenpos_http_request_duration_seconds', 'Latencia de requests HTTP',
+            ('endpoint', 'method'))
+        self.requests_total = Counter(
+            'greenpos_http_requests_total', 'Requests HTTP por código de estado',
+            ('endpoint', 'method', 'status'))
+        self.in_flight = Gauge(
+            'greenpos_http_requests_in_flight', 'Requests HTTP en curso')
+        self.db_duration = Histogram(
+            'greenpos_db_duration_seconds', 'Tiempo de base de datos por request',
+            ('endpoint',))
+        self.template_duration = Histogram(
+            'greenpos_template_render_seconds', 'Tiempo de render por template',
+            ('template',))
+        self.start_time = Gauge(
+            'greenpos_process_start_time_seconds', 'Inicio del proceso (epoch)')
+        self.start_time.set(value=time.time())
+
+    def collect(self):
+        return (self.request_duration, self.requests_total, self.in_flight,
+                self.db_duration, self.template_duration, self.start_time)
+
+    def render(self):
+        """Texto en formato de exposición de Prometheus."""
+        lines = []
+        for metric in self.collect():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# Instancia compartida del proceso
+METRICS = MetricsRegistry()
+
+
+def _endpoint_label():
+    # Rutas no encontradas agrupadas: evita una serie por URL inválida
+    return request.endpoint or 'unmatched'
+
+
+def _before_render(app, template, context):
+    if has_request_context():
+        g.setdefault('metrics_render_started', []).append(time.perf_counter())
+
+
+def _after_render(app, template, context):
+    if has_request_context():
+        started = g.get('metrics_render_started')
+        if started:
+            METRICS.template_duration.observe(time.perf_counter() - started.pop(), template.name or 'string')
+
+
+def init_metrics(app):
+    """Registra los hooks que alimentan METRICS.
+
+    Debe llamarse después de init_query_counter (tiempo de BD del request).
+    No hace nada si METRICS_ENABLED está desactivado.
+
+    Args:
+        app: Instancia de Flask
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        METRICS.in_flight.inc()
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc=None):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        METRICS.in_flight.dec()
+        endpoint = _endpoint_label()
+        status = g.pop('metrics_status', 500 if exc is not None else 200)
+        METRICS.request_duration.observe(time.perf_counter() - started, endpoint, request.method)
+        METRICS.requests_total.inc(endpoint, request.method, str(status))
+        METRICS.db_duration.observe(request_db_time(), endpoint)
@@ -0,0 +1,154 @@
+"""Green-POS - Numeración de Documentos
+Asigna consecutivos de facturas y notas de crédito sin leer-modificar-
+escribir la fila de Setting: cada asignación es un único
+UPDATE document_sequence SET next_value = next_value + n ... RETURNING
+dentro de la transacción del documento.
+
+Garantías:
+- Sin duplicados: el incremento lo hace SQLite de forma atómica (nunca se
+  escribe un valor leído antes en Python)
+- Sin números quemados: si la venta hace rollback, el incremento también
+- Sin escalamiento de bloqueo lectura -> escritura sobre Setting al vender
+
+Bloques por terminal (opcional, config.py):
+- TERMINAL_ID: identificador de la caja (ej: 'caja-1')
+- INVOICE_NUMBER_BLOCK_SIZE > 1: la terminal reserva N números a la vez y
+  los consume de su fila en document_number_block; document_sequence solo se
+  toca al agotar el bloque. Los números siguen siendo únicos pero dejan de
+  ser cronológicos entre terminales.
+
+Requiere SQLite 3.35+ (RETURNING).
+"""
+
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models.models import DocumentNumberBlock, DocumentSequence, Setting
+
+# Facturas y notas de crédito comparten consecutivo (numeración unificada)
+INVOICE_SEQUENCE = 'invoice'
+
+_sequences = DocumentSequence.__table__
+_blocks = DocumentNumberBlock.__table__
+
+
+def _initial_value(name):
+    """Valor inicial de una secuencia nueva (bases existentes: Setting)."""
+    if name == INVOICE_SEQUENCE:
+        setting = Setting.query.first()
+        if setting and setting.next_invoice_number:
+            return setting.next_invoice_number
+    return 1
+
+
+def _ensure_sequence(name):
+    db.session.execute(
+        sqlite_insert(_sequences)
+        .values(name=name, next_value=_initial_value(name))
+        .on_conflict_do_nothing(index_elements=[_sequences.c.name])
+    )
+
+
+def allocate_numbers(name=INVOICE_SEQUENCE, count=1):
+    """Reserva `count` números consecutivos de la secuencia.
+
+    Se ejecuta en la transacción de db.session: un rollback los libera.
+
+    Args:
+        name: Nombre de la secuencia
+        count: Cantidad de números
+
+    Returns:
+        int: Primer número reservado (los siguientes son first+1 ... first+count-1)
+    """
+    stmt = (
+        update(_sequences)
+        .where(_sequences.c.name == name)
+        .values(next_value=_sequences.c.next_value + count)
+        .returning(_sequences.c.next_value)
+    )
+    new_value = db.session.execute(stmt).scalar()
+    if new_value is None:
+        _ensure_sequence(name)
+        new_value = db.session.execute(stmt).scalar()
+    return new_value - count
+
+
+def _allocate_from_block(name, terminal, block_size):
+    """Toma el siguiente número del bloque de la terminal (reserva otro si se agotó)."""
+    current = db.session.execute(
+        update(_blocks)
+        .where(_blocks.c.terminal == terminal, _blocks.c.sequence == name,
+               _blocks.c.next_value <= _blocks.c.last_value)
+        .values(next_value=_blocks.c.next_value + 1)
+        .returning(_blocks.c.next_value)
+    ).scalar()
+    if current is not None:
+        return current - 1
+
+    first = allocate_numbers(name, block_size)
+    stmt = sqlite_insert(_blocks).values(
+        terminal=terminal, sequence=name, next_value=first + 1, last_value=first + block_size - 1
+    )
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[_blocks.c.terminal, _blocks.c.sequence],
+        set_={'next_value': stmt.excluded.next_value, 'last_value': stmt.excluded.last_value}
+    ))
+    return first
+
+
+def next_number(name=INVOICE_SEQUENCE):
+    """Siguiente número de la secuencia (por bloque de terminal si está configurado).
+
+    Returns:
+        int: Número asignado
+    """
+    terminal = current_app.config.get('TERMINAL_ID')
+    block_size = current_app.config.get('INVOICE_NUMBER_BLOCK_SIZE', 1)
+    if terminal and block_size > 1:
+        return _allocate_from_block(name, terminal, block_size)
+    return allocate_numbers(name)
+
+
+def next_document_number(prefix):
+    """Número formateado para una factura/nota de crédito (ej: INV-000123).
+
+    Args:
+        prefix: Prefijo de numeración (Setting.invoice_prefix)
+
+    Returns:
+        str: Número del documento
+    """
+    return f"{prefix}-{next_number(INVOICE_SEQUENCE):06d}"
+
+
+def peek_next_number(name=INVOICE_SEQUENCE):
+    """Próximo número de la secuencia sin asignarlo (para mostrar en Configuración)."""
+    value = db.session.execute(
+        select(_sequences.c.next_value).where(_sequences.c.name == name)
+    ).scalar()
+    return value if value is not None else _initial_value(name)
+
+
+def set_next_number(value, name=INVOICE_SEQUENCE):
+    """Fija el próximo número (ajuste manual del administrador).
+
+    Descarta los bloques reservados por terminales: sus números restantes
+    quedarían fuera de la nueva numeración.
+    """
+    _ensure_sequence(name)
+    db.session.execute(
+        update(_sequences).where(_sequences.c.name == name).values(next_value=value)
+    )
+    db.session.execute(_blocks.delete().where(_blocks.c.sequence == name))
+
+
+def setup_document_sequences():
+    """Crea la secuencia de facturas en bases existentes (desde Setting).
+
+    Debe llamarse dentro de un app context después de db.create_all().
+    """
+    _ensure_sequence(INVOICE_SEQUENCE)
+    db.session.commit()
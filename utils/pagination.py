@@ -0,0 +1,76 @@
+"""Green-POS - Paginación por Cursor (Keyset)
+Cursores opacos sobre (fecha, id) para listados ordenados de forma
+descendente. A diferencia de OFFSET, el costo de cada página no crece con la
+cantidad de páginas ya recorridas y no se duplican/saltan filas si se
+insertan registros nuevos mientras el usuario navega.
+
+Uso:
+    query = keyset_filter(query, Invoice.date, Invoice.id, decode_cursor(cursor))
+    rows = query.order_by(Invoice.date.desc(), Invoice.id.desc()).limit(100).all()
+    next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+"""
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(value, row_id):
+    """Codifica la posición (valor, id) como cursor opaco apto para URLs.
+
+    Args:
+        value: datetime de la última fila entregada
+        row_id: ID de la última fila entregada
+
+    Returns:
+        str: Cursor en base64 urlsafe
+    """
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None)
+    raw = f"{value.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decodifica un cursor generado por encode_cursor.
+
+    Args:
+        cursor: Cursor recibido del cliente (None o '' = primera página)
+
+    Returns:
+        tuple|None: (datetime, int) o None si no hay cursor
+
+    Raises:
+        ValueError: Si el cursor está malformado
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        value, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(value), int(row_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f'Cursor inválido: {cursor}') from e
+
+
+def keyset_filter(query, value_column, id_column, position):
+    """Filtra filas estrictamente posteriores a `position` en orden descendente.
+
+    Args:
+        query: Query SQLAlchemy
+        value_column: Columna de ordenamiento principal (ej: Invoice.date)
+        id_column: Columna de desempate única (ej: Invoice.id)
+        position: (valor, id) decodificado o None
+
+    Returns:
+        Query filtrada (sin cambios si position es None)
+    """
+    if position is None:
+        return query
+    value, row_id = position
+    return query.filter(or_(
+        value_column < value,
+        and_(value_column == value, id_column < row_id)
+    ))
@@ -0,0 +1,95 @@
+"""Green-POS - Ensamblador de Códigos de Producto
+Carga en lote los códigos alternativos (ProductCode) de una página de
+productos con una sola consulta IN, evitando el N+1 de la relación dinámica
+Product.alternative_codes.
+
+Usado por:
+- api.products_search (respuesta JSON)
+- Product.get_all_codes
+- products.merge y products.stock_history
+"""
+
+from collections import defaultdict
+
+from models.models import ProductCode
+
+# Máximo de parámetros por consulta IN (límite conservador de SQLite)
+_IN_CHUNK_SIZE = 900
+
+
+def load_alternative_codes(product_ids=None):
+    """Carga los códigos alternativos agrupados por producto.
+
+    Args:
+        product_ids: IDs de productos; None carga todos los códigos (una
+                     sola consulta sin IN, útil para pantallas de catálogo)
+
+    Returns:
+        dict: product_id -> list[ProductCode] (ordenados por id)
+    """
+    codes_by_product = defaultdict(list)
+
+    if product_ids is None:
+        chunks = [None]
+    else:
+        ids = sorted(set(product_ids))
+        if not ids:
+            return codes_by_product
+        chunks = [ids[i:i + _IN_CHUNK_SIZE] for i in range(0, len(ids), _IN_CHUNK_SIZE)]
+
+    for chunk in chunks:
+        query = ProductCode.query
+        if chunk is not None:
+            query = query.filter(ProductCode.product_id.in_(chunk))
+        for alt_code in query.order_by(ProductCode.id).all():
+            codes_by_product[alt_code.product_id].append(alt_code)
+
+    return codes_by_product
+
+
+def assemble_all_codes(products, codes_by_product=None):
+    """Construye la lista completa de códigos (principal + alternativos).
+
+    Args:
+        products: Lista de Product
+        codes_by_product: Resultado previo de load_alternative_codes (opcional)
+
+    Returns:
+        dict: product_id -> [{'code', 'type', 'is_primary', 'notes'?}, ...]
+    """
+    if codes_by_product is None:
+        codes_by_product = load_alternative_codes([p.id for p in products])
+
+    result = {}
+    for product in products:
+        codes = [{'code': product.code, 'type': 'principal', 'is_primary': True}]
+        for alt_code in codes_by_product.get(product.id, []):
+            codes.append({
+                'code': alt_code.code,
+                'type': alt_code.code_type,
+                'is_primary': False,
+                'notes': alt_code.notes
+            })
+        result[product.id] = codes
+    return result
+
+
+def product_search_payload(products):
+    """Serializa productos para respuestas de búsqueda (2 consultas en total).
+
+    Args:
+        products: Lista de Product ya cargados
+
+    Returns:
+        list[dict]: [{id, name, code, alternative_codes, sale_price, stock}, ...]
+    """
+    codes_by_product = load_alternative_codes([p.id for p in products])
+
+    return [{
+        'id': p.id,
+        'name': p.name,
+        'code': p.code,
+        'alternative_codes': [ac.code for ac in codes_by_product.get(p.id, [])],
+        'sale_price': float(p.sale_price or 0),
+        'stock': p.stock
+    } for p in products]
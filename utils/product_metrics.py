@@ -0,0 +1,289 @@
+"""Green-POS - Métricas de Inventario por Producto (cálculo en lote)
+product_metrics guarda, para todo el catálogo, las métricas que el historial
+de stock calcula para un producto: velocidad de ventas de 30 días, días hasta
+agotarse, rotación, promedio mensual, meses con ventas y última venta.
+
+- refresh_product_metrics(): recalcula todo el catálogo con unas pocas
+  consultas agrupadas (libro de stock + ventas por mes) y reescribe la tabla
+- derive_metrics(): fórmulas compartidas con products.stock_history
+- PRODUCT_METRICS_JOB: recálculo nocturno en segundo plano (el primer
+  request de cada día local lanza el hilo; el request no espera)
+- CLI: migrations/refresh_product_metrics.py
+
+El listado de productos ordena/filtra por días hasta agotarse con
+stockout_days_expression(): stock actual / velocidad precalculada, en la
+misma consulta del listado.
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, case, func, insert, text
+
+from extensions import db
+from models.models import Invoice, InvoiceItem, Product, ProductMetrics
+from utils.invoice_changes import to_local
+from utils.stock_ledger import VELOCITY_WINDOW_DAYS
+from utils.time_buckets import local_bucket, utc_bounds
+
+# Meses considerados para el promedio mensual de ventas
+MONTHLY_WINDOW_DAYS = 180
+# Divisor del promedio mensual cuando no hay ventas en la ventana
+DEFAULT_MONTHS = 6
+# Espera tras un recálculo fallido antes de reintentar
+PRODUCT_METRICS_RETRY_MINUTES = 30
+
+# Última fila del libro por producto, antes y dentro de la ventana de velocidad
+_LEDGER_SNAPSHOT = text("""
+    SELECT product_id, in_window, units_sold, units_returned, last_sale_at
+    FROM (
+        SELECT product_id,
+               created_at >= :cutoff AS in_window,
+               units_sold, units_returned, last_sale_at,
+               ROW_NUMBER() OVER (
+                   PARTITION BY product_id, created_at >= :cutoff
+                   ORDER BY created_at DESC, id DESC
+               ) AS position
+        FROM stock_ledger
+    )
+    WHERE position = 1
+""").bindparams(bindparam('cutoff', type_=db.DateTime)).columns(
+    product_id=db.Integer, in_window=db.Boolean, units_sold=db.Integer,
+    units_returned=db.Integer, last_sale_at=db.DateTime
+)
+
+
+def derive_metrics(stock, sold_in_window, net_sold, monthly_quantities,
+                   window_days=VELOCITY_WINDOW_DAYS):
+    """Métricas de un producto a partir de sus contadores.
+
+    Args:
+        stock: Stock actual
+        sold_in_window: Unidades vendidas en la ventana de velocidad
+        net_sold: Vendido total menos devoluciones
+        monthly_quantities: Unidades por mes con ventas (últimos 6 meses)
+        window_days: Días de la ventana de velocidad
+
+    Returns:
+        dict: sales_velocity, days_until_stockout, inventory_turnover,
+              avg_monthly_sales, months_with_sales
+    """
+    # Velocidad de ventas (unidades/día en la ventana)
+    sales_velocity = max(sold_in_window, 0) / float(window_days)
+
+    # Proyección (None = nunca se agota, sin ventas recientes)
+    days_until_stockout = stock / sales_velocity if sales_velocity > 0 else None
+
+    # Rotación de inventario (total vendido / stock actual como referencia)
+    inventory_turnover = net_sold / stock if stock > 0 else None
+
+    months_with_sales = len(monthly_quantities)
+    avg_monthly_sales = sum(monthly_quantities) / (months_with_sales or DEFAULT_MONTHS)
+
+    return {
+        'sales_velocity': sales_velocity,
+        'days_until_stockout': days_until_stockout,
+        'inventory_turnover': inventory_turnover,
+        'avg_monthly_sales': avg_monthly_sales,
+        'months_with_sales': months_with_sales,
+    }
+
+
+def _ledger_counters(cutoff):
+    """{product_id: (sold_in_window, net_sold, last_sale_at)} en una consulta."""
+    latest = {}
+    before_window = {}
+    for product_id, in_window, sold, returned, last_sale_at in db.session.execute(
+            _LEDGER_SNAPSHOT, {'cutoff': cutoff}):
+        if in_window:
+            latest[product_id] = (sold, returned, last_sale_at)
+        else:
+            before_window[product_id] = sold
+            latest.setdefault(product_id, (sold, returned, last_sale_at))
+    return {
+        product_id: (sold - before_window.get(product_id, 0), sold - returned, last_sale_at)
+        for product_id, (sold, returned, last_sale_at) in latest.items()
+    }
+
+
+def _monthly_quantities(since_day):
+    """{product_id: [unidades por mes]} de facturas desde since_day (mes local)."""
+    month = local_bucket(Invoice.date, 'month')
+    start, _ = utc_bounds(since_day, since_day)
+    rows = db.session.query(
+        InvoiceItem.product_id,
+        func.sum(InvoiceItem.quantity)
+    ).join(Invoice, InvoiceItem.invoice_id == Invoice.id).filter(
+        Invoice.document_type == 'invoice',
+        Invoice.date >= start
+    ).group_by(InvoiceItem.product_id, month).all()
+
+    monthly = {}
+    for product_id, quantity in rows:
+        monthly.setdefault(product_id, []).append(quantity or 0)
+    return monthly
+
+
+def refresh_product_metrics(now=None):
+    """Recalcula product_metrics para todo el catálogo (3 consultas + escritura).
+
+    No hace commit: el llamador decide (tarea nocturna / script).
+
+    Args:
+        now: Momento del cálculo (UTC naive); None = ahora
+
+    Returns:
+        int: Productos calculados
+    """
+    now = now or datetime.utcnow()
+    counters = _ledger_counters(now - timedelta(days=VELOCITY_WINDOW_DAYS))
+    monthly = _monthly_quantities(to_local(now).date() - timedelta(days=MONTHLY_WINDOW_DAYS))
+
+    rows = []
+    for product_id, stock in db.session.query(Product.id, Product.stock):
+        sold_in_window, net_sold, last_sale_at = counters.get(product_id, (0, 0, None))
+        metrics = derive_metrics(stock, sold_in_window, net_sold, monthly.get(product_id, []))
+        metrics.update(product_id=product_id, stock=stock, net_sold=net_sold,
+                       last_sale_at=last_sale_at, computed_at=now)
+        rows.append(metrics)
+
+    db.session.execute(ProductMetrics.__table__.delete())
+    if rows:
+        db.session.execute(insert(ProductMetrics), rows)
+    return len(rows)
+
+
+def last_refresh():
+    """Fecha (UTC naive) del último cálculo o None si nunca se calculó."""
+    return db.session.query(func.max(ProductMetrics.computed_at)).scalar()
+
+
+def stockout_days_expression():
+    """Expresión SQL de días hasta agotarse con el stock actual.
+
+    Usa la velocidad precalculada (requiere outerjoin a ProductMetrics);
+    NULL si el producto no tuvo ventas recientes o no tiene métricas.
+    """
+    return case(
+        (ProductMetrics.sales_velocity > 0,
+         func.max(Product.stock, 0) / ProductMetrics.sales_velocity),
+        else_=None
+    )
+
+
+class ProductMetricsJob:
+    """Recalcula product_metrics una vez por día local en un hilo aparte."""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.last_refresh = None
+        self.last_error = None
+        self.last_failure = None
+        self.retry_delay = timedelta(minutes=PRODUCT_METRICS_RETRY_MINUTES)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def configure(self, app):
+        """Lee la configuración y la fecha del último cálculo.
+
+        Debe llamarse dentro de un app context (requiere db.engine). Las bases
+        en memoria (testing) dejan la tarea desactivada.
+
+        Args:
+            app: Instancia de Flask
+        """
+        database = db.engine.url.database
+        self.app = app
+        self.enabled = bool(app.config.get('PRODUCT_METRICS_NIGHTLY', True)
+                            and database and database != ':memory:')
+        self.retry_delay = timedelta(minutes=app.config.get('PRODUCT_METRICS_RETRY_MINUTES',
+                                                            PRODUCT_METRICS_RETRY_MINUTES))
+        self.last_refresh = last_refresh()
+
+    def is_due(self, now=None):
+        """True si el último cálculo es de un día local anterior (sin tocar disco).
+
+        Tras un fallo espera retry_delay antes de volver a intentarlo.
+        """
+        if not self.enabled:
+            return False
+        now = now or datetime.utcnow()
+        if self.last_failure is not None and now - self.last_failure < self.retry_delay:
+            return False
+        if self.last_refresh is None:
+            return True
+        return to_local(self.last_refresh).date() < to_local(now).date()
+
+    def schedule(self):
+        """Lanza el recálculo en segundo plano si toca y no hay otro en curso.
+
+        Returns:
+            bool: True si se lanzó el hilo
+        """
+        if not self.is_due():
+            return False
+        with self._lock:
+            if self.running or not self.is_due():
+                return False
+            self._thread = threading.Thread(
+                target=self.run, name='greenpos-product-metrics', daemon=True
+            )
+            self._thread.start()
+        return True
+
+    def run(self):
+        """Recalcula y confirma en un app context propio (bloquea al llamador).
+
+        Returns:
+            int|None: Productos calculados o None si falló
+        """
+        started = datetime.utcnow()
+        with self.app.app_context():
+            try:
+                count = refresh_product_metrics(started)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.last_error = str(e)
+                self.last_failure = datetime.utcnow()
+                self.app.logger.error(f"Error calculando métricas de productos "
+                                      f"(reintento en {self.retry_delay}): {e}")
+                return None
+
+        self.last_refresh = started
+        self.last_error = None
+        self.last_failure = None
+        elapsed = (datetime.utcnow() - started).total_seconds()
+        self.app.logger.info(f"Métricas de productos calculadas: {count} productos ({elapsed:.1f}s)")
+        return count
+
+    def wait(self, timeout=None):
+        """Espera el cálculo en curso (scripts y pruebas)."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+# Instancia compartida del proceso
+PRODUCT_METRICS_JOB = ProductMetricsJob()
+
+
+def init_product_metrics(app):
+    """Configura la tarea nocturna y la dispara desde before_request.
+
+    Debe llamarse dentro de un app context (requiere db.engine).
+
+    Args:
+        app: Instancia de Flask
+    """
+    PRODUCT_METRICS_JOB.configure(app)
+
+    @app.before_request
+    def _schedule_product_metrics():
+        PRODUCT_METRICS_JOB.schedule()
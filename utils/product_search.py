@@ -0,0 +1,354 @@
+"""Green-POS - Búsqueda de Productos (FTS5)
+Índice de texto completo SQLite FTS5 sobre nombre, código principal y
+códigos alternativos de productos.
+
+Estructura:
+- product_fts: tabla virtual FTS5 (rowid = product.id), búsqueda por prefijo
+  de palabra con ranking bm25
+- product_trigram: tabla FTS5 con tokenizer trigram (SQLite >= 3.34) sobre
+  nombre y códigos, para subcadenas ("123" encuentra "ABC123") sin recorrer
+  product ni product_code
+- Triggers sobre product y product_code mantienen ambos índices
+  sincronizados, incluso con escrituras SQL directas (ej:
+  migrations/merge_products.py)
+
+Cada palabra buscada coincide por prefijo o, si tiene 3 caracteres o más,
+por subcadena (match_subquery). Sin trigram (SQLite anterior a 3.34) solo
+hay prefijos y filter_by_search usa LIKE cuando FTS5 no encuentra nada.
+
+Si la versión de SQLite no soporta FTS5, las funciones retornan None y las
+rutas usan la búsqueda LIKE tradicional como fallback.
+"""
+
+import re
+import logging
+
+from sqlalchemy import text, column, or_, and_, bindparam
+
+from extensions import db
+from models.models import Product
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'product_fts'
+TRIGRAM_TABLE = 'product_trigram'
+
+# Largo mínimo de una subcadena indexable por el tokenizer trigram
+TRIGRAM_MIN_LENGTH = 3
+
+# Los códigos alternativos se concatenan separados por espacio
+_ALT_CODES_SQL = "(SELECT group_concat(code, ' ') FROM product_code WHERE product_id = {ref})"
+
+_SETUP_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, code, alt_codes,
+        tokenize = "unicode61 remove_diacritics 2",
+        prefix = '2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, code, alt_codes)
+        VALUES (new.id, new.name, new.code, {_ALT_CODES_SQL.format(ref='new.id')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, code ON product BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, name, code, alt_codes)
+        VALUES (new.id, new.name, new.code, {_ALT_CODES_SQL.format(ref='new.id')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_code_fts_ai AFTER INSERT ON product_code BEGIN
+        UPDATE {FTS_TABLE} SET alt_codes = {_ALT_CODES_SQL.format(ref='new.product_id')}
+        WHERE rowid = new.product_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_code_fts_au AFTER UPDATE ON product_code BEGIN
+        UPDATE {FTS_TABLE} SET alt_codes = {_ALT_CODES_SQL.format(ref='old.product_id')}
+        WHERE rowid = old.product_id;
+        UPDATE {FTS_TABLE} SET alt_codes = {_ALT_CODES_SQL.format(ref='new.product_id')}
+        WHERE rowid = new.product_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_code_fts_ad AFTER DELETE ON product_code BEGIN
+        UPDATE {FTS_TABLE} SET alt_codes = {_ALT_CODES_SQL.format(ref='old.product_id')}
+        WHERE rowid = old.product_id;
+    END""",
+]
+
+_REBUILD_STATEMENTS = [
+    f"DELETE FROM {FTS_TABLE}",
+    f"""INSERT INTO {FTS_TABLE}(rowid, name, code, alt_codes)
+        SELECT p.id, p.name, p.code, {_ALT_CODES_SQL.format(ref='p.id')}
+        FROM product p""",
+]
+
+# Código principal y alternativos en una sola columna del índice trigram
+_CODES_SQL = "{code} || ' ' || COALESCE(" + _ALT_CODES_SQL + ", '')"
+_PRODUCT_CODES_SQL = _CODES_SQL.format(
+    code='(SELECT code FROM product WHERE id = {ref})', ref='{ref}'
+)
+
+_TRIGRAM_SETUP_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TRIGRAM_TABLE} USING fts5(
+        name, codes,
+        tokenize = 'trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_trigram_ai AFTER INSERT ON product BEGIN
+        INSERT INTO {TRIGRAM_TABLE}(rowid, name, codes)
+        VALUES (new.id, new.name, {_CODES_SQL.format(code='new.code', ref='new.id')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_trigram_au AFTER UPDATE OF name, code ON product BEGIN
+        DELETE FROM {TRIGRAM_TABLE} WHERE rowid = old.id;
+        INSERT INTO {TRIGRAM_TABLE}(rowid, name, codes)
+        VALUES (new.id, new.name, {_CODES_SQL.format(code='new.code', ref='new.id')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_trigram_ad AFTER DELETE ON product BEGIN
+        DELETE FROM {TRIGRAM_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_code_trigram_ai AFTER INSERT ON product_code BEGIN
+        UPDATE {TRIGRAM_TABLE} SET codes = {_PRODUCT_CODES_SQL.format(ref='new.product_id')}
+        WHERE rowid = new.product_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_code_trigram_au AFTER UPDATE ON product_code BEGIN
+        UPDATE {TRIGRAM_TABLE} SET codes = {_PRODUCT_CODES_SQL.format(ref='old.product_id')}
+        WHERE rowid = old.product_id;
+        UPDATE {TRIGRAM_TABLE} SET codes = {_PRODUCT_CODES_SQL.format(ref='new.product_id')}
+        WHERE rowid = new.product_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_code_trigram_ad AFTER DELETE ON product_code BEGIN
+        UPDATE {TRIGRAM_TABLE} SET codes = {_PRODUCT_CODES_SQL.format(ref='old.product_id')}
+        WHERE rowid = old.product_id;
+    END""",
+]
+
+_TRIGRAM_REBUILD_STATEMENTS = [
+    f"DELETE FROM {TRIGRAM_TABLE}",
+    f"""INSERT INTO {TRIGRAM_TABLE}(rowid, name, codes)
+        SELECT p.id, p.name, {_CODES_SQL.format(code='p.code', ref='p.id')}
+        FROM product p""",
+]
+
+# Estado del módulo: None = no inicializado, True/False = FTS5 disponible
+_fts_enabled = None
+# True si además existe el índice trigram (subcadenas)
+_trigram_enabled = False
+
+# Caracteres que no forman parte de un token unicode61
+_TOKEN_SPLIT = re.compile(r'[^\w]+', re.UNICODE)
+
+
+def _setup_index(statements, rebuild_statements, table, label):
+    """Crea un índice FTS5 con sus triggers y lo reconstruye si está desincronizado."""
+    with db.engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+        indexed = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+        products = conn.execute(text("SELECT COUNT(*) FROM product")).scalar()
+        if indexed != products:
+            for statement in rebuild_statements:
+                conn.execute(text(statement))
+            logger.info(f"Indice {label} reconstruido: {products} productos")
+
+
+def setup_product_fts():
+    """Crea las tablas FTS5 (prefijos y trigram) y sus triggers si no existen.
+
+    Si una tabla se crea por primera vez (o está desincronizada en cantidad de
+    filas), se reconstruye desde product/product_code en una sola pasada.
+    Debe llamarse dentro de un app context, después de db.create_all().
+
+    Returns:
+        bool: True si FTS5 quedó disponible, False si se usará fallback LIKE
+    """
+    global _fts_enabled, _trigram_enabled
+
+    if db.engine.dialect.name != 'sqlite':
+        _fts_enabled = _trigram_enabled = False
+        return False
+
+    try:
+        _setup_index(_SETUP_STATEMENTS, _REBUILD_STATEMENTS, FTS_TABLE, 'FTS5')
+        _fts_enabled = True
+    except Exception as e:
+        logger.warning(f"FTS5 no disponible, se usara busqueda LIKE: {e}")
+        _fts_enabled = _trigram_enabled = False
+        return False
+
+    try:
+        _setup_index(_TRIGRAM_SETUP_STATEMENTS, _TRIGRAM_REBUILD_STATEMENTS,
+                     TRIGRAM_TABLE, 'trigram')
+        _trigram_enabled = True
+    except Exception as e:
+        logger.warning(f"Tokenizer trigram no disponible, subcadenas con LIKE: {e}")
+        _trigram_enabled = False
+
+    return _fts_enabled
+
+
+def rebuild_product_fts():
+    """Reconstruye los índices FTS5 completos desde product y product_code."""
+    if not _fts_enabled:
+        return
+
+    with db.engine.begin() as conn:
+        for statement in _REBUILD_STATEMENTS:
+            conn.execute(text(statement))
+        if _trigram_enabled:
+            for statement in _TRIGRAM_REBUILD_STATEMENTS:
+                conn.execute(text(statement))
+
+
+def build_match_query(query):
+    """Convierte texto de usuario en expresión MATCH de FTS5.
+
+    Cada palabra se convierte en una búsqueda por prefijo y todas las palabras
+    deben aparecer (AND lógico), igual que la búsqueda multi-palabra LIKE.
+
+    Args:
+        query: Texto ingresado por el usuario
+
+    Returns:
+        str|None: Expresión MATCH (ej: '"churu"* "cat"*') o None si no hay tokens
+
+    Example:
+        >>> build_match_query('Churu  cat-x4')
+        '"Churu"* "cat"* "x4"*'
+    """
+    tokens = [t for t in _TOKEN_SPLIT.split(query or '') if t]
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_product_ids(query, limit=None):
+    """Busca productos en el índice FTS5 ordenados por relevancia (bm25).
+
+    Los códigos (principal y alternativos) pesan más que el nombre para que
+    un escaneo o código exacto quede primero. Hasta completar el límite se
+    agregan, ordenados por nombre, los productos que solo coinciden por
+    subcadena (índice trigram).
+
+    Args:
+        query: Texto de búsqueda
+        limit: Máximo de resultados (None = sin límite)
+
+    Returns:
+        list[int]|None: IDs de producto por relevancia (vacía = sin
+        coincidencias), o None si el llamador debe usar LIKE (sin FTS5, o
+        sin trigram y sin coincidencias por prefijo)
+    """
+    match = build_match_query(query)
+    if not _fts_enabled or match is None:
+        return None
+
+    sql = (f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+           f"ORDER BY bm25({FTS_TABLE}, 1.0, 5.0, 5.0)")
+    params = {'match': match}
+    if limit:
+        sql += " LIMIT :limit"
+        params['limit'] = limit
+
+    try:
+        ranked = [row[0] for row in db.session.execute(text(sql), params)]
+    except Exception as e:
+        logger.warning(f"Error en busqueda FTS5 '{query}': {e}")
+        return None
+
+    if not _trigram_enabled:
+        return ranked or None
+    if limit and len(ranked) >= limit:
+        return ranked
+
+    extra = db.session.query(Product.id).filter(Product.id.in_(match_subquery(query)))\
+        .order_by(Product.name.asc())
+    if ranked:
+        extra = extra.filter(Product.id.notin_(ranked))
+    if limit:
+        extra = extra.limit(limit - len(ranked))
+    return ranked + [row[0] for row in extra]
+
+
+def _term_selects(term, index):
+    """SELECTs (id) que coinciden con una palabra: prefijo y subcadena."""
+    selects = []
+    params = []
+    match = build_match_query(term)
+    if match is not None:
+        selects.append(f"SELECT rowid AS id FROM {FTS_TABLE} "
+                       f"WHERE {FTS_TABLE} MATCH :fts_match_{index}")
+        params.append(bindparam(f'fts_match_{index}', match, unique=True))
+    if _trigram_enabled and len(term) >= TRIGRAM_MIN_LENGTH:
+        selects.append(f"SELECT rowid AS id FROM {TRIGRAM_TABLE} "
+                       f"WHERE {TRIGRAM_TABLE} MATCH :trigram_match_{index}")
+        quoted = term.replace('"', '""')
+        params.append(bindparam(f'trigram_match_{index}', f'"{quoted}"', unique=True))
+    return selects, params
+
+
+def match_subquery(query):
+    """Subconsulta de IDs que coinciden con el texto, para usar en filtros.
+
+    Cada palabra coincide por prefijo (product_fts) o por subcadena
+    (product_trigram); todas las palabras deben coincidir (INTERSECT).
+    Útil cuando el llamador aplica su propio ordenamiento/paginación
+    (ej: products.list, inventory.pending):
+
+        ids = match_subquery(query)
+        if ids is not None:
+            base_query = base_query.filter(Product.id.in_(ids))
+
+    Args:
+        query: Texto de búsqueda
+
+    Returns:
+        TextualSelect|None: SELECT id ... MATCH, o None si FTS5 no aplica
+    """
+    if not _fts_enabled or build_match_query(query) is None:
+        return None
+
+    term_sql = []
+    params = []
+    for index, term in enumerate((query or '').split()):
+        selects, term_params = _term_selects(term, index)
+        if not selects:
+            # Palabra sin tokens ni subcadena indexable (ej: "-"): se ignora
+            continue
+        term_sql.append(f"SELECT id FROM ({' UNION '.join(selects)})")
+        params.extend(term_params)
+
+    # unique: la subconsulta puede repetirse en la misma query (ej: conteo + página)
+    return text(' INTERSECT '.join(term_sql))\
+        .bindparams(*params)\
+        .columns(column('id'))
+
+
+def filter_by_search(base_query, query, like_columns):
+    """Aplica filtro de búsqueda a una query de productos.
+
+    Con FTS5 y trigram filtra por match_subquery (prefijos y subcadenas, todo
+    por índice). Sin trigram usa FTS5 si tiene coincidencias; si no (o sin
+    FTS5) aplica la búsqueda LIKE por palabra con AND lógico.
+
+    Args:
+        base_query: Query de SQLAlchemy que incluye Product
+        query: Texto de búsqueda del usuario
+        like_columns: Columnas para el fallback LIKE (ej: [Product.name, Product.code])
+
+    Returns:
+        tuple: (query filtrada, True si se usó FTS5 / False si se usó LIKE)
+    """
+    ids = match_subquery(query)
+    if ids is not None:
+        if _trigram_enabled:
+            return base_query.filter(Product.id.in_(ids)), True
+        has_matches = db.session.execute(
+            text(f"SELECT 1 FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match LIMIT 1"),
+            {'match': build_match_query(query)}
+        ).first()
+        if has_matches:
+            return base_query.filter(Product.id.in_(ids)), True
+
+    filters = [
+        or_(*[col.ilike(f'%{term}%') for col in like_columns])
+        for term in query.strip().split()
+    ]
+    return base_query.filter(and_(*filters)), False
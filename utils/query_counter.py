@@ -0,0 +1,145 @@
+"""Green-POS - Contador de Consultas SQL
+Cuenta y cronometra las sentencias SQL ejecutadas por request (y dentro de
+bloques arbitrarios) para detectar regresiones N+1.
+
+Es el ÚNICO par de listeners before/after_cursor_execute del engine: la
+instrumentación que necesita cada sentencia (utils/sql_profiler.py,
+utils/slow_queries.py) se registra con add_statement_observer() y recibe el
+tiempo ya medido; utils/metrics.py lee el acumulado del request (g.db_time).
+Los observadores son de cada app (app.extensions['query_counter']): otra
+app del mismo proceso (ej: pruebas) no hereda los de la anterior.
+
+Uso en pruebas:
+    with count_queries() as counter:
+        client.get('/api/products/search?q=churu')
+    assert counter.count <= 3
+
+En DEBUG/TESTING cada respuesta incluye el header X-Query-Count.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+from extensions import db
+
+# Contadores activos por hilo (bloques `with count_queries()`)
+_local = threading.local()
+
+
+class QueryCounter:
+    """Acumula cantidad, sentencias y tiempo (segundos) de SQL ejecutado."""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+        self.elapsed = 0.0
+
+    def record(self, statement):
+        self.count += 1
+        self.statements.append(statement)
+
+
+class QueryInstrumentation:
+    """Listeners del engine de una app y sus observadores de sentencias."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        # Funciones observer(cursor, statement, parameters, executemany, elapsed)
+        self.observers = []
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        """Listener de engine: cuenta la sentencia e inicia su cronómetro."""
+        for counter in getattr(_local, 'counters', ()):
+            counter.record(statement)
+        if has_request_context():
+            g.query_count = g.get('query_count', 0) + 1
+        # Una conexión ejecuta una sentencia a la vez: si falló, la siguiente lo sobrescribe
+        conn.info['query_started'] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        """Listener de engine: acumula el tiempo y avisa a los observadores."""
+        started = conn.info.pop('query_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        for counter in getattr(_local, 'counters', ()):
+            counter.elapsed += elapsed
+        if has_request_context():
+            g.db_time = g.get('db_time', 0.0) + elapsed
+        for observer in self.observers:
+            observer(cursor, statement, parameters, executemany, elapsed)
+
+
+def _instrumentation(app):
+    """QueryInstrumentation de la app (la crea y registra la primera vez)."""
+    instrumentation = app.extensions.get('query_counter')
+    if instrumentation is None:
+        instrumentation = app.extensions['query_counter'] = QueryInstrumentation(db.engine)
+    return instrumentation
+
+
+def add_statement_observer(app, observer):
+    """Recibe cada sentencia ejecutada en la app con su tiempo, sin listeners propios.
+
+    Debe llamarse dentro de un app context (requiere db.engine).
+
+    Args:
+        app: Instancia de Flask
+        observer: Función (cursor, statement, parameters, executemany, elapsed)
+                  con elapsed en segundos
+    """
+    observers = _instrumentation(app).observers
+    if observer not in observers:
+        observers.append(observer)
+
+
+def request_db_time():
+    """Segundos de BD acumulados en el request actual."""
+    return g.get('db_time', 0.0) if has_request_context() else 0.0
+
+
+@contextmanager
+def count_queries():
+    """Context manager que cuenta las consultas ejecutadas en el bloque.
+
+    Yields:
+        QueryCounter: contador con .count, .statements y .elapsed
+    """
+    counter = QueryCounter()
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = []
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+def init_query_counter(app):
+    """Registra el listener en el engine de la app y el header X-Query-Count.
+
+    Debe llamarse dentro de un app context (requiere db.engine) y antes que
+    la instrumentación que lo usa (sus before_request corren después).
+
+    Args:
+        app: Instancia de Flask
+    """
+    _instrumentation(app)
+
+    @app.before_request
+    def reset_query_count():
+        g.query_count = 0
+        g.db_time = 0.0
+
+    if app.debug or app.testing:
+        @app.after_request
+        def add_query_count_header(response):
+            response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+            return response
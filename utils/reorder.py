@@ -0,0 +1,335 @@
+"""Green-POS - Sugerencias de Reabastecimiento por Proveedor
+Pronostica la demanda diaria de todo el catálogo y arma un pedido sugerido
+agrupado por proveedor (product_supplier), en lugar de revisar a ojo los
+productos bajo stock mínimo del dashboard.
+
+Datos (3 consultas):
+- Serie diaria de unidades por producto: sales_rollup_product de las
+  últimas HISTORY_DAYS días locales (una consulta, ya agregada por día)
+- Productos con stock y umbrales (stock_min / stock_warning)
+- Proveedor de cada producto (product_supplier + proveedores activos)
+
+Pronóstico por producto (matriz productos x días):
+- Estacionalidad semanal: promedio de cada día de la semana / promedio
+  general, atenuada hacia 1 cuando el producto vende pocas unidades
+- Nivel sobre la serie desestacionalizada: suavizado exponencial simple
+  ('ses') o promedio móvil de las últimas MOVING_AVERAGE_DAYS ('moving_average')
+- Demanda diaria futura = nivel x índice del día de la semana
+- Desviación de los errores de un paso para el stock de seguridad
+
+Punto de pedido y cantidad:
+- seguridad = max(stock_min, Z x desviación x raíz(tiempo de entrega))
+- punto de pedido = max(stock_warning, demanda en el tiempo de entrega + seguridad)
+- pedir hasta = punto de pedido + demanda del período de revisión
+- Se sugiere pedido si stock <= punto de pedido: cantidad = pedir hasta - stock
+
+NumPy es opcional (no está en requirements.txt): con numpy el pronóstico se
+calcula vectorizado sobre la matriz completa; sin él, la misma cuenta en
+Python puro producto por producto. test_reorder.py verifica que ambos
+caminos den el mismo resultado.
+    pip install numpy
+"""
+
+import math
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from extensions import db
+from models.models import Product, SalesRollupProduct, Supplier, product_supplier
+from utils.time_buckets import CO_TZ
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NUMPY_AVAILABLE = np is not None
+
+FORECAST_METHODS = ('ses', 'moving_average')
+
+HISTORY_DAYS = 56            # 8 semanas completas (múltiplo de 7)
+SMOOTHING_ALPHA = 0.3        # peso del último día en el suavizado exponencial
+MOVING_AVERAGE_DAYS = 28
+WARMUP_DAYS = 7              # días iniciales sin medir error (nivel inicial)
+SEASONAL_PRIOR_UNITS = 14    # unidades a partir de las cuales pesa la estacionalidad
+SEASONAL_FLOOR = 0.1         # índice mínimo (evita dividir por días sin ventas)
+SERVICE_LEVEL_Z = 1.65       # ~95% de ciclos sin quiebre de stock
+
+DEFAULT_LEAD_TIME_DAYS = 3
+DEFAULT_REVIEW_DAYS = 7
+
+# Productos que no se reabastecen por pedido
+_EXCLUDED_CATEGORY = 'Servicios'
+
+
+# ==================== DATOS ====================
+
+def _load_products():
+    """Productos reabastecibles: excluye servicios y productos a necesidad (0/0)."""
+    return db.session.query(
+        Product.id, Product.code, Product.name, Product.stock,
+        Product.stock_min, Product.stock_warning, Product.purchase_price
+    ).filter(
+        or_(Product.category.is_(None), Product.category != _EXCLUDED_CATEGORY),
+        or_(Product.stock_min.is_(None), Product.stock_min != 0,
+            Product.stock_warning.is_(None), Product.stock_warning != 0)
+    ).order_by(Product.id).all()
+
+
+def _load_sales(start_day, end_day):
+    """Filas (día local, producto, unidades netas) de la ventana en una consulta."""
+    return db.session.query(
+        SalesRollupProduct.day, SalesRollupProduct.product_id, SalesRollupProduct.units_sold
+    ).filter(
+        SalesRollupProduct.day >= start_day.isoformat(),
+        SalesRollupProduct.day <= end_day.isoformat()
+    ).all()
+
+
+def _load_suppliers():
+    """{product_id: Supplier}: el proveedor activo asociado más recientemente."""
+    rows = db.session.query(product_supplier.c.product_id, Supplier).join(
+        Supplier, Supplier.id == product_supplier.c.supplier_id
+    ).filter(Supplier.active == True).order_by(
+        product_supplier.c.created_at.asc(), Supplier.id.asc()
+    ).all()
+    return {product_id: supplier for product_id, supplier in rows}
+
+
+# ==================== PRONÓSTICO ====================
+
+def _forecast_numpy(series, day_weekdays, horizon_weekdays, method, alpha):
+    """Pronóstico vectorizado sobre la matriz productos x días.
+
+    Returns:
+        tuple: (matriz productos x horizonte con la demanda diaria, desviaciones)
+    """
+    products, days = series.shape
+    weekday_index = np.asarray(day_weekdays)
+
+    # Estacionalidad: promedio por día de la semana / promedio general
+    weekday_mean = np.stack(
+        [series[:, weekday_index == weekday].mean(axis=1) for weekday in range(7)], axis=1
+    )
+    overall_mean = series.mean(axis=1, keepdims=True)
+    raw = np.divide(weekday_mean, overall_mean, out=np.ones_like(weekday_mean),
+                    where=overall_mean > 0)
+    total = series.sum(axis=1, keepdims=True)
+    weight = total / (total + SEASONAL_PRIOR_UNITS)
+    seasonal = np.maximum(weight * raw + (1 - weight), SEASONAL_FLOOR)
+
+    day_seasonal = seasonal[:, weekday_index]
+    deseasonalized = series / day_seasonal
+
+    # Nivel con error de un paso (para la desviación)
+    level = deseasonalized[:, :WARMUP_DAYS].mean(axis=1)
+    squared_error = np.zeros(products)
+    for day in range(WARMUP_DAYS, days):
+        error = series[:, day] - level * day_seasonal[:, day]
+        squared_error += error * error
+        if method == 'moving_average':
+            window = deseasonalized[:, max(0, day + 1 - MOVING_AVERAGE_DAYS):day + 1]
+            level = window.mean(axis=1)
+        else:
+            level = alpha * deseasonalized[:, day] + (1 - alpha) * level
+    sigma = np.sqrt(squared_error / max(days - WARMUP_DAYS, 1))
+
+    daily = level[:, None] * seasonal[:, np.asarray(horizon_weekdays)]
+    return daily, sigma
+
+
+def _forecast_python(series, day_weekdays, horizon_weekdays, method, alpha):
+    """Misma cuenta que _forecast_numpy en Python puro (lista de series)."""
+    days = len(day_weekdays)
+    weekday_days = [[day for day in range(days) if day_weekdays[day] == weekday]
+                    for weekday in range(7)]
+
+    forecasts = []
+    sigmas = []
+    for values in series:
+        total = sum(values)
+        if not total:
+            # Sin ventas en la ventana: demanda y desviación cero
+            forecasts.append([0.0] * len(horizon_weekdays))
+            sigmas.append(0.0)
+            continue
+        overall_mean = total / days
+        weight = total / (total + SEASONAL_PRIOR_UNITS)
+        seasonal = []
+        for indexes in weekday_days:
+            raw = 1.0
+            if overall_mean > 0 and indexes:
+                raw = sum(values[day] for day in indexes) / len(indexes) / overall_mean
+            seasonal.append(max(weight * raw + (1 - weight), SEASONAL_FLOOR))
+
+        day_seasonal = [seasonal[weekday] for weekday in day_weekdays]
+        deseasonalized = [value / factor for value, factor in zip(values, day_seasonal)]
+
+        level = sum(deseasonalized[:WARMUP_DAYS]) / WARMUP_DAYS
+        squared_error = 0.0
+        for day in range(WARMUP_DAYS, days):
+            error = values[day] - level * day_seasonal[day]
+            squared_error += error * error
+            if method == 'moving_average':
+                window = deseasonalized[max(0, day + 1 - MOVING_AVERAGE_DAYS):day + 1]
+                level = sum(window) / len(window)
+            else:
+                level = alpha * deseasonalized[day] + (1 - alpha) * level
+
+        sigmas.append(math.sqrt(squared_error / max(days - WARMUP_DAYS, 1)))
+        forecasts.append([level * seasonal[weekday] for weekday in horizon_weekdays])
+    return forecasts, sigmas
+
+
+def forecast_demand(product_ids, sales_rows, start_day, days, horizon_start, horizon_days,
+                    method='ses', alpha=SMOOTHING_ALPHA):
+    """Demanda diaria pronosticada de cada producto para el horizonte.
+
+    Args:
+        product_ids: IDs en el orden deseado de las filas
+        sales_rows: Filas (día 'YYYY-MM-DD', product_id, unidades)
+        start_day: Primer día local de la serie
+        days: Largo de la serie en días
+        horizon_start: Primer día local a pronosticar
+        horizon_days: Días a pronosticar
+        method: 'ses' o 'moving_average'
+        alpha: Peso del suavizado exponencial
+
+    Returns:
+        tuple: (lista por producto de demandas diarias del horizonte,
+                lista de desviaciones del error diario)
+    """
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"Método de pronóstico inválido: {method}")
+
+    row_of = {product_id: row for row, product_id in enumerate(product_ids)}
+    day_weekdays = [(start_day + timedelta(days=day)).weekday() for day in range(days)]
+    horizon_weekdays = [(horizon_start + timedelta(days=day)).weekday()
+                        for day in range(horizon_days)]
+    column_of = {(start_day + timedelta(days=day)).isoformat(): day for day in range(days)}
+
+    if NUMPY_AVAILABLE:
+        series = np.zeros((len(product_ids), days))
+        rows, columns, units = [], [], []
+        for day, product_id, quantity in sales_rows:
+            row = row_of.get(product_id)
+            if row is not None:
+                rows.append(row)
+                columns.append(column_of[day])
+                units.append(quantity)
+        if rows:
+            series[rows, columns] = units
+        # Devoluciones netas de un día (NC) no son demanda negativa
+        np.maximum(series, 0, out=series)
+        daily, sigma = _forecast_numpy(series, day_weekdays, horizon_weekdays, method, alpha)
+        return daily.tolist(), sigma.tolist()
+
+    series = [[0.0] * days for _ in product_ids]
+    for day, product_id, quantity in sales_rows:
+        row = row_of.get(product_id)
+        if row is not None:
+            series[row][column_of[day]] = max(quantity, 0)
+    return _forecast_python(series, day_weekdays, horizon_weekdays, method, alpha)
+
+
+# ==================== PEDIDO SUGERIDO ====================
+
+def reorder_line(product, daily_forecast, sigma, lead_time_days):
+    """Punto de pedido y cantidad sugerida de un producto.
+
+    Args:
+        product: Fila con stock, stock_min, stock_warning
+        daily_forecast: Demanda diaria pronosticada (tiempo de entrega + revisión)
+        sigma: Desviación del error diario del pronóstico
+        lead_time_days: Días entre el pedido y la llegada
+
+    Returns:
+        dict: Demanda, seguridad, punto de pedido, pedir hasta y cantidad
+              (quantity = 0 si el stock está sobre el punto de pedido)
+    """
+    # Umbrales efectivos (mismos defaults que Product.effective_stock_*)
+    stock_min = product.stock_min if product.stock_min is not None else 1
+    stock_warning = product.stock_warning if product.stock_warning is not None else stock_min + 2
+
+    lead_demand = sum(daily_forecast[:lead_time_days])
+    review_demand = sum(daily_forecast[lead_time_days:])
+    safety_stock = max(stock_min, SERVICE_LEVEL_Z * sigma * math.sqrt(lead_time_days))
+    reorder_point = max(stock_warning, math.ceil(lead_demand + safety_stock))
+    order_up_to = reorder_point + math.ceil(review_demand)
+
+    # Stock negativo (preventas / pedidos pendientes) también se repone
+    stock = product.stock or 0
+    quantity = order_up_to - stock if stock <= reorder_point else 0
+
+    return {
+        'daily_demand': (lead_demand + review_demand) / max(len(daily_forecast), 1),
+        'lead_demand': lead_demand,
+        'safety_stock': safety_stock,
+        'reorder_point': reorder_point,
+        'order_up_to': order_up_to,
+        'quantity': quantity,
+    }
+
+
+def suggest_purchase_order(lead_time_days=DEFAULT_LEAD_TIME_DAYS, review_days=DEFAULT_REVIEW_DAYS,
+                           method='ses', today=None):
+    """Pedido sugerido de todo el catálogo agrupado por proveedor.
+
+    Args:
+        lead_time_days: Días entre el pedido y la llegada de la mercancía
+        review_days: Días que debe cubrir el pedido (hasta la próxima revisión)
+        method: 'ses' (suavizado exponencial) o 'moving_average'
+        today: Día local de referencia (default: hoy en Colombia)
+
+    Returns:
+        list[dict]: [{'supplier': Supplier|None, 'lines': [...], 'total_units',
+                      'total_cost'}, ...] ordenado por nombre de proveedor;
+                    los productos sin proveedor van al final (supplier=None)
+    """
+    today = today or datetime.now(CO_TZ).date()
+    # Serie hasta ayer: el día en curso está incompleto
+    end_day = today - timedelta(days=1)
+    start_day = end_day - timedelta(days=HISTORY_DAYS - 1)
+
+    products = _load_products()
+    if not products:
+        return []
+
+    daily, sigmas = forecast_demand(
+        [product.id for product in products], _load_sales(start_day, end_day),
+        start_day, HISTORY_DAYS, today, lead_time_days + review_days, method
+    )
+    suppliers = _load_suppliers()
+
+    groups = {}
+    for product, daily_forecast, sigma in zip(products, daily, sigmas):
+        line = reorder_line(product, daily_forecast, sigma, lead_time_days)
+        if line['quantity'] <= 0:
+            continue
+
+        unit_cost = product.purchase_price or 0.0
+        line.update(
+            product_id=product.id, code=product.code, name=product.name,
+            stock=product.stock or 0, unit_cost=unit_cost,
+            cost=unit_cost * line['quantity'],
+            days_of_stock=(max(product.stock or 0, 0) / line['daily_demand']
+                           if line['daily_demand'] > 0 else None)
+        )
+
+        supplier = suppliers.get(product.id)
+        key = supplier.id if supplier else None
+        group = groups.setdefault(key, {'supplier': supplier, 'lines': [],
+                                        'total_units': 0, 'total_cost': 0.0})
+        group['lines'].append(line)
+        group['total_units'] += line['quantity']
+        group['total_cost'] += line['cost']
+
+    for group in groups.values():
+        # Lo que se agota primero arriba
+        group['lines'].sort(key=lambda line: (line['days_of_stock'] is None,
+                                              line['days_of_stock'] or 0, line['name']))
+
+    return sorted(groups.values(),
+                  key=lambda group: (group['supplier'] is None,
+                                     group['supplier'].name.lower() if group['supplier'] else ''))
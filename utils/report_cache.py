@@ -0,0 +1,201 @@
+"""Green-POS - Caché de Resultados de Reportes
+Caché LRU en memoria del proceso para las secciones de /reports, con clave
+(sección, fecha_inicio, fecha_fin) sobre días locales ya normalizados.
+
+Estructura:
+- REPORT_CACHE: instancia única compartida por todos los hilos de waitress
+- Tamaño máximo fijo: al superarlo se descarta la entrada usada hace más tiempo
+- Invalidación dirigida: cada flush de facturas/notas de crédito
+  (utils/invoice_changes.py) registra los días locales tocados; al hacer
+  commit se descartan solo las entradas cuyo rango incluye alguno de esos días
+- Productos editados (nombre, código o precios): al hacer commit se descartan
+  las secciones que muestran esos campos (PRODUCT_SECTIONS)
+- Un resultado calculado mientras ocurría una invalidación no se guarda
+- Contadores hits/misses/evictions/invalidations para monitoreo
+
+La caché vive en la memoria del proceso de la aplicación: escrituras SQL
+directas dentro de la app (fusión de productos) llaman a REPORT_CACHE.clear();
+los scripts de migrations/ corren en otro proceso y no pueden limpiarla, por
+lo que hay que reiniciar la aplicación después de ejecutarlos.
+"""
+
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+
+from extensions import db
+from models.models import Product
+from utils.invoice_changes import register_invoice_change_handler, to_local
+
+# Entradas máximas (≈ 6 secciones por rango consultado)
+DEFAULT_MAX_ENTRIES = 256
+
+# Secciones que muestran datos del producto y campos que las desactualizan
+PRODUCT_SECTIONS = ('top_units', 'top_profit')
+_PRODUCT_FIELDS = ('name', 'code', 'sale_price', 'purchase_price')
+
+
+class ReportCache:
+    """Caché LRU de secciones de reportes con invalidación por días."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (section, start, end) -> resultado
+        self._generation = 0            # Aumenta en cada invalidación
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # ==================== LECTURA ====================
+
+    def get_or_compute(self, section, start_date, end_date, compute):
+        """Retorna el resultado cacheado o lo calcula y lo guarda.
+
+        Args:
+            section: Nombre de la sección del reporte (ej: 'summary')
+            start_date, end_date: date locales (inclusive)
+            compute: Callable sin argumentos que calcula el resultado
+
+        Returns:
+            Resultado de compute() (compartido entre requests: no modificar)
+        """
+        key = (section, start_date, end_date)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            generation = self._generation
+
+        # Calcular fuera del lock: otros hilos pueden leer mientras tanto
+        value = compute()
+
+        with self._lock:
+            # No guardar un valor calculado antes de una invalidación concurrente
+            if generation != self._generation:
+                return value
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        """Contadores actuales de la caché.
+
+        Returns:
+            dict: entries, max_entries, hits, misses, hit_ratio, evictions, invalidations
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+    # ==================== ESCRITURA ====================
+
+    def invalidate_days(self, days):
+        """Descarta las entradas cuyo rango incluye alguno de los días dados.
+
+        Args:
+            days: Iterable de date locales tocados por una escritura
+
+        Returns:
+            int: Entradas descartadas
+        """
+        days = sorted(set(days))
+        if not days:
+            return 0
+        return self._discard(lambda key: any(key[1] <= day <= key[2] for day in days))
+
+    def invalidate_sections(self, sections):
+        """Descarta todas las entradas de las secciones dadas (cualquier rango).
+
+        Args:
+            sections: Iterable de nombres de sección
+
+        Returns:
+            int: Entradas descartadas
+        """
+        sections = set(sections)
+        return self._discard(lambda key: key[0] in sections)
+
+    def _discard(self, is_stale):
+        with self._lock:
+            self._generation += 1
+            stale = [key for key in self._entries if is_stale(key)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        """Descarta todas las entradas (mantiene los contadores)."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+
+# Instancia compartida del proceso
+REPORT_CACHE = ReportCache()
+
+_events_registered = False
+
+
+def _track_touched_days(connection, item_changes, document_changes):
+    """Consumidor de cambios de facturas: acumula los días locales tocados."""
+    days = db.session.info.setdefault('report_cache_days', set())
+    for change in document_changes:
+        days.add(to_local(change.sold_at).date())
+    for change in item_changes:
+        days.add(to_local(change.sold_at).date())
+
+
+def _track_product_changes(session, flush_context):
+    """after_flush: marca si se editó/eliminó un campo de producto que muestran los reportes."""
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            session.info['report_cache_products'] = True
+            return
+    for obj in session.dirty:
+        if isinstance(obj, Product) and session.is_modified(obj, include_collections=False) and any(
+                getattr(inspect(obj).attrs, field).history.has_changes() for field in _PRODUCT_FIELDS):
+            session.info['report_cache_products'] = True
+            return
+
+
+def _invalidate_on_commit(session):
+    days = session.info.pop('report_cache_days', None)
+    if days:
+        REPORT_CACHE.invalidate_days(days)
+    if session.info.pop('report_cache_products', False):
+        REPORT_CACHE.invalidate_sections(PRODUCT_SECTIONS)
+
+
+def _discard_on_rollback(session, previous_transaction):
+    session.info.pop('report_cache_days', None)
+    session.info.pop('report_cache_products', None)
+
+
+def register_report_cache_events():
+    """Registra la invalidación de REPORT_CACHE por escrituras de facturas (idempotente)."""
+    global _events_registered
+    if _events_registered:
+        return
+    register_invoice_change_handler(_track_touched_days)
+    event.listen(db.session, 'after_flush', _track_product_changes)
+    event.listen(db.session, 'after_commit', _invalidate_on_commit)
+    event.listen(db.session, 'after_soft_rollback', _discard_on_rollback)
+    _events_registered = True
@@ -0,0 +1,361 @@
+"""Green-POS - Rollups de Ventas para Reportes
+Tablas pre-agregadas por hora y día local de Colombia que alimentan
+/reports: el costo del reporte depende de la cantidad de días del rango, no
+de la cantidad de facturas.
+
+Tablas (models/models.py):
+- sales_rollup_hourly: (day, hour) -> conteos, totales, NC y utilidad
+- sales_rollup_daily: (day) -> mismas métricas
+- sales_rollup_payment: (day, payment_method) -> documentos y total neto
+- sales_rollup_product: (day, product_id) -> unidades, ingresos y utilidad
+
+Mantenimiento:
+- Consumidor de utils/invoice_changes.py: aplica los deltas de cada flush
+  con UPSERTs dentro de la misma transacción
+- rebuild_sales_rollups(): backfill completo desde el historial
+  (migrations/backfill_sales_rollups.py)
+
+Nota: la utilidad incremental usa el precio de compra vigente al momento de
+la escritura; el backfill usa el precio de compra actual del producto.
+"""
+
+from collections import defaultdict
+
+from sqlalchemy import bindparam, func, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models.models import (
+    Invoice, Product, SalesRollupHourly, SalesRollupDaily,
+    SalesRollupPayment, SalesRollupProduct
+)
+from utils.invoice_changes import register_invoice_change_handler, to_local
+from utils.time_buckets import BOGOTA_OFFSET
+
+# Método de pago por defecto de Invoice.payment_method
+_DEFAULT_PAYMENT_METHOD = 'cash'
+
+_METRIC_COLUMNS = ('invoice_count', 'invoice_total', 'credit_note_count', 'credit_note_total', 'profit')
+
+
+# ==================== MANTENIMIENTO INCREMENTAL ====================
+
+def _upsert_add(connection, model, key_columns, rows):
+    """INSERT ... ON CONFLICT DO UPDATE sumando las columnas no clave."""
+    if not rows:
+        return
+    table = model.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c[name] for name in key_columns],
+        set_={
+            column.name: column + stmt.excluded[column.name]
+            for column in table.c if column.name not in key_columns
+        }
+    )
+    connection.execute(stmt, rows)
+
+
+def _apply_changes(connection, item_changes, document_changes):
+    """Consumidor de cambios de facturas: actualiza los cuatro rollups."""
+    hourly = defaultdict(lambda: [0, 0.0, 0, 0.0, 0.0])   # (day, hour) -> métricas
+    payments = defaultdict(lambda: [0, 0.0])              # (day, method) -> [docs, total neto]
+    products = defaultdict(lambda: [0, 0.0, 0.0])         # (day, pid) -> [units, revenue, profit]
+
+    for change in document_changes:
+        local = to_local(change.sold_at)
+        day = local.strftime('%Y-%m-%d')
+        bucket = hourly[(day, local.hour)]
+        total = change.direction * (change.total or 0.0)
+        if change.sign > 0:
+            bucket[0] += change.direction
+            bucket[1] += total
+        else:
+            bucket[2] += change.direction
+            bucket[3] += total
+
+        payment = payments[(day, change.payment_method or _DEFAULT_PAYMENT_METHOD)]
+        payment[0] += change.direction
+        payment[1] += change.sign * total
+
+    if item_changes:
+        product_ids = {change.product_id for change in item_changes}
+        costs = dict(connection.execute(
+            select(Product.id, Product.purchase_price).where(Product.id.in_(product_ids))
+        ).all())
+
+        for change in item_changes:
+            local = to_local(change.sold_at)
+            day = local.strftime('%Y-%m-%d')
+            units = change.direction * change.sign * change.quantity
+            profit = units * (change.price - (costs.get(change.product_id) or 0.0))
+
+            hourly[(day, local.hour)][4] += profit
+            product = products[(day, change.product_id)]
+            product[0] += units
+            product[1] += units * change.price
+            product[2] += profit
+
+    daily = defaultdict(lambda: [0, 0.0, 0, 0.0, 0.0])
+    for (day, _hour), metrics in hourly.items():
+        daily[day] = [a + b for a, b in zip(daily[day], metrics)]
+
+    _upsert_add(connection, SalesRollupHourly, ('day', 'hour'), [
+        dict(zip(('day', 'hour') + _METRIC_COLUMNS, key + tuple(metrics)))
+        for key, metrics in hourly.items()
+    ])
+    _upsert_add(connection, SalesRollupDaily, ('day',), [
+        dict(zip(('day',) + _METRIC_COLUMNS, (day,) + tuple(metrics)))
+        for day, metrics in daily.items()
+    ])
+    _upsert_add(connection, SalesRollupPayment, ('day', 'payment_method'), [
+        {'day': day, 'payment_method': method, 'document_count': count, 'total': total}
+        for (day, method), (count, total) in payments.items()
+    ])
+    _upsert_add(connection, SalesRollupProduct, ('day', 'product_id'), [
+        {'day': day, 'product_id': pid, 'units_sold': units, 'revenue': revenue, 'profit': profit}
+        for (day, pid), (units, revenue, profit) in products.items()
+    ])
+
+
+def register_sales_rollup_events():
+    """Registra el consumidor que mantiene los rollups (idempotente)."""
+    register_invoice_change_handler(_apply_changes)
+
+
+# ==================== BACKFILL ====================
+
+# Documentos no cancelados con su día/hora local (mismo offset que utils/time_buckets.py)
+_DOCS_CTE = f"""
+    docs AS (
+        SELECT i.id,
+               strftime('%Y-%m-%d', i.date, '{BOGOTA_OFFSET}') AS day,
+               CAST(strftime('%H', i.date, '{BOGOTA_OFFSET}') AS INTEGER) AS hour,
+               i.document_type,
+               COALESCE(i.total, 0) AS total,
+               COALESCE(i.payment_method, 'cash') AS payment_method,
+               CASE WHEN i.document_type = 'credit_note' THEN -1 ELSE 1 END AS sign
+        FROM invoice i
+        WHERE COALESCE(i.status, '') != 'cancelled'
+    )
+"""
+
+
+def rebuild_sales_rollups(product_ids=None):
+    """Reconstruye los rollups desde el historial en una pasada por tabla.
+
+    No hace commit: el llamador decide.
+
+    Args:
+        product_ids: Si se indica, solo recalcula sales_rollup_product para
+                     esos productos (ej: tras fusionar productos)
+
+    Returns:
+        int: Días con ventas en sales_rollup_daily (o filas de producto)
+    """
+    product_filter = ''
+    params = {}
+    bind = []
+    if product_ids is not None:
+        product_filter = 'AND ii.product_id IN :ids'
+        params['ids'] = sorted(set(product_ids)) or [-1]
+        bind = [bindparam('ids', expanding=True)]
+
+    def execute(sql):
+        return db.session.execute(text(sql).bindparams(*bind), params)
+
+    if product_ids is None:
+        for table in ('sales_rollup_hourly', 'sales_rollup_daily', 'sales_rollup_payment'):
+            execute(f"DELETE FROM {table}")
+
+        execute(f"""
+            WITH {_DOCS_CTE},
+            item_profit AS (
+                SELECT ii.invoice_id,
+                       SUM(ii.quantity * (ii.price - COALESCE(p.purchase_price, 0))) AS profit
+                FROM invoice_item ii
+                LEFT JOIN product p ON p.id = ii.product_id
+                GROUP BY ii.invoice_id
+            )
+            INSERT INTO sales_rollup_hourly
+                (day, hour, invoice_count, invoice_total, credit_note_count, credit_note_total, profit)
+            SELECT docs.day, docs.hour,
+                   SUM(docs.sign > 0),
+                   SUM(CASE WHEN docs.sign > 0 THEN docs.total ELSE 0 END),
+                   SUM(docs.sign < 0),
+                   SUM(CASE WHEN docs.sign < 0 THEN docs.total ELSE 0 END),
+                   SUM(docs.sign * COALESCE(ip.profit, 0))
+            FROM docs
+            LEFT JOIN item_profit ip ON ip.invoice_id = docs.id
+            GROUP BY docs.day, docs.hour
+        """)
+
+        execute("""
+            INSERT INTO sales_rollup_daily
+                (day, invoice_count, invoice_total, credit_note_count, credit_note_total, profit)
+            SELECT day, SUM(invoice_count), SUM(invoice_total),
+                   SUM(credit_note_count), SUM(credit_note_total), SUM(profit)
+            FROM sales_rollup_hourly
+            GROUP BY day
+        """)
+
+        execute(f"""
+            WITH {_DOCS_CTE}
+            INSERT INTO sales_rollup_payment (day, payment_method, document_count, total)
+            SELECT day, payment_method, COUNT(*), SUM(sign * total)
+            FROM docs
+            GROUP BY day, payment_method
+        """)
+
+    execute(f"DELETE FROM sales_rollup_product WHERE 1=1 {product_filter.replace('ii.', '')}")
+    result = execute(f"""
+        WITH {_DOCS_CTE}
+        INSERT INTO sales_rollup_product (day, product_id, units_sold, revenue, profit)
+        SELECT docs.day, ii.product_id,
+               SUM(docs.sign * ii.quantity),
+               SUM(docs.sign * ii.quantity * ii.price),
+               SUM(docs.sign * ii.quantity * (ii.price - COALESCE(p.purchase_price, 0)))
+        FROM invoice_item ii
+        JOIN docs ON docs.id = ii.invoice_id
+        LEFT JOIN product p ON p.id = ii.product_id
+        WHERE 1=1 {product_filter}
+        GROUP BY docs.day, ii.product_id
+    """)
+
+    if product_ids is not None:
+        return result.rowcount
+    return db.session.query(func.count(SalesRollupDaily.day)).scalar()
+
+
+def setup_sales_rollups():
+    """Backfill automático en bases existentes (rollups vacíos con facturas).
+
+    Debe llamarse dentro de un app context después de db.create_all().
+    """
+    has_rollups = db.session.query(SalesRollupDaily.day).first() is not None
+    has_invoices = db.session.query(Invoice.id).first() is not None
+    if has_invoices and not has_rollups:
+        rebuild_sales_rollups()
+        db.session.commit()
+
+
+# ==================== LECTURA (REPORTES) ====================
+
+def _day_range(query, column, start_day, end_day):
+    return query.filter(column >= start_day.isoformat(), column <= end_day.isoformat())
+
+
+def sales_summary(start_day, end_day):
+    """Totales del rango.
+
+    Args:
+        start_day, end_day: date locales (inclusive)
+
+    Returns:
+        dict: {invoice_count, credit_note_count, document_count,
+               invoice_total, credit_note_total, revenue, profit}
+    """
+    row = _day_range(db.session.query(
+        func.coalesce(func.sum(SalesRollupDaily.invoice_count), 0),
+        func.coalesce(func.sum(SalesRollupDaily.invoice_total), 0.0),
+        func.coalesce(func.sum(SalesRollupDaily.credit_note_count), 0),
+        func.coalesce(func.sum(SalesRollupDaily.credit_note_total), 0.0),
+        func.coalesce(func.sum(SalesRollupDaily.profit), 0.0)
+    ), SalesRollupDaily.day, start_day, end_day).one()
+
+    invoice_count, invoice_total, credit_note_count, credit_note_total, profit = row
+    return {
+        'invoice_count': invoice_count,
+        'credit_note_count': credit_note_count,
+        'document_count': invoice_count + credit_note_count,
+        'invoice_total': invoice_total,
+        'credit_note_total': credit_note_total,
+        'revenue': invoice_total - credit_note_total,
+        'profit': profit
+    }
+
+
+def sales_by_payment_method(start_day, end_day):
+    """Documentos y total neto por método de pago.
+
+    Returns:
+        list[dict]: [{'method', 'count', 'total'}, ...]
+    """
+    rows = _day_range(db.session.query(
+        SalesRollupPayment.payment_method,
+        func.sum(SalesRollupPayment.document_count),
+        func.sum(SalesRollupPayment.total)
+    ), SalesRollupPayment.day, start_day, end_day)\
+        .group_by(SalesRollupPayment.payment_method)\
+        .having(func.sum(SalesRollupPayment.document_count) != 0)\
+        .all()
+    return [{'method': method, 'count': count, 'total': total or 0.0} for method, count, total in rows]
+
+
+def sales_by_hour(start_day, end_day):
+    """Documentos y total neto por hora local del día (0-23), solo horas con ventas.
+
+    Returns:
+        list[dict]: [{'hour': int, 'count', 'total'}, ...] ordenado por hora
+    """
+    count = func.sum(SalesRollupHourly.invoice_count + SalesRollupHourly.credit_note_count)
+    rows = _day_range(db.session.query(
+        SalesRollupHourly.hour,
+        count,
+        func.sum(SalesRollupHourly.invoice_total - SalesRollupHourly.credit_note_total)
+    ), SalesRollupHourly.day, start_day, end_day)\
+        .group_by(SalesRollupHourly.hour)\
+        .having(count > 0)\
+        .order_by(SalesRollupHourly.hour)\
+        .all()
+    return [{'hour': hour, 'count': docs, 'total': total or 0.0} for hour, docs, total in rows]
+
+
+def sales_by_day(start_day, end_day):
+    """Documentos y total neto por día local, solo días con ventas.
+
+    Returns:
+        list[dict]: [{'day': 'YYYY-MM-DD', 'count', 'total'}, ...] ordenado por día
+    """
+    rows = _day_range(db.session.query(
+        SalesRollupDaily.day,
+        SalesRollupDaily.invoice_count + SalesRollupDaily.credit_note_count,
+        SalesRollupDaily.invoice_total - SalesRollupDaily.credit_note_total
+    ), SalesRollupDaily.day, start_day, end_day)\
+        .filter(SalesRollupDaily.invoice_count + SalesRollupDaily.credit_note_count > 0)\
+        .order_by(SalesRollupDaily.day)\
+        .all()
+    return [{'day': day, 'count': docs, 'total': total or 0.0} for day, docs, total in rows]
+
+
+def top_products(start_day, end_day, order_by='units', limit=20):
+    """Productos (sin servicios) con más unidades vendidas o más utilidad en el rango.
+
+    Args:
+        start_day, end_day: date locales (inclusive)
+        order_by: 'units' o 'profit'
+        limit: Máximo de productos
+
+    Returns:
+        list: Filas con name, code, sale_price, purchase_price, quantity_sold, revenue, total_profit
+    """
+    quantity_sold = func.sum(SalesRollupProduct.units_sold)
+    total_profit = func.sum(SalesRollupProduct.profit)
+    order_column = total_profit if order_by == 'profit' else quantity_sold
+
+    return _day_range(db.session.query(
+        Product.name,
+        Product.code,
+        Product.sale_price,
+        Product.purchase_price,
+        quantity_sold.label('quantity_sold'),
+        func.sum(SalesRollupProduct.revenue).label('revenue'),
+        total_profit.label('total_profit')
+    ).join(
+        Product, SalesRollupProduct.product_id == Product.id
+    ), SalesRollupProduct.day, start_day, end_day)\
+        .filter(~Product.code.like('SERV-%'))\
+        .group_by(Product.id)\
+        .order_by(order_column.desc())\
+        .limit(limit)\
+        .all()
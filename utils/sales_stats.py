@@ -0,0 +1,202 @@
+"""Green-POS - Contadores de Ventas por Producto
+Mantiene product_sales_stats (unidades, ingresos, última venta) y
+product_sales_monthly (buckets por mes local) en la MISMA transacción que
+las escrituras de facturas, para que los listados no recalculen
+SUM(invoice_item.quantity) sobre todo el historial en cada request.
+
+Estructura:
+- Consumidor de utils/invoice_changes.py: recibe los cambios de aporte de
+  items de cada flush y aplica los deltas con un UPSERT (executemany) por tabla
+- rebuild_sales_stats(): recálculo completo desde el historial en una pasada
+  (usado por migrations/rebuild_product_sales_stats.py y tras fusionar
+  productos con SQL directo)
+
+Reglas de conteo:
+- Factura no cancelada: suma
+- Nota de crédito no cancelada: resta (devolución)
+- Documento cancelado: no cuenta
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models.models import InvoiceItem, ProductSalesStats, ProductSalesMonthly
+from utils.invoice_changes import register_invoice_change_handler, to_local
+from utils.time_buckets import BOGOTA_OFFSET
+
+
+class _SalesDelta:
+    """Acumula deltas de ventas de un flush y los aplica con UPSERTs."""
+
+    def __init__(self):
+        self.stats = defaultdict(lambda: [0, 0.0, None])   # pid -> [units, revenue, last_sale_at]
+        self.monthly = defaultdict(lambda: [0, 0.0])        # (pid, month) -> [units, revenue]
+        self.recheck_last_sale = set()
+
+    def add(self, change):
+        """Suma (direction=+1) o revierte (direction=-1) el aporte de un item."""
+        units = change.direction * change.sign * change.quantity
+        revenue = units * change.price
+        month = to_local(change.sold_at).strftime('%Y-%m')
+
+        stats = self.stats[change.product_id]
+        stats[0] += units
+        stats[1] += revenue
+        self.monthly[(change.product_id, month)][0] += units
+        self.monthly[(change.product_id, month)][1] += revenue
+
+        if change.sign > 0:
+            if change.direction > 0:
+                if stats[2] is None or change.sold_at > stats[2]:
+                    stats[2] = change.sold_at
+            else:
+                # La última venta pudo ser la revertida: recalcular con MAX()
+                self.recheck_last_sale.add(change.product_id)
+
+    def apply(self, connection):
+        if not self.stats:
+            return
+        now = datetime.utcnow()
+
+        stats_table = ProductSalesStats.__table__
+        stmt = sqlite_insert(stats_table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[stats_table.c.product_id],
+            set_={
+                'units_sold': stats_table.c.units_sold + stmt.excluded.units_sold,
+                'revenue': stats_table.c.revenue + stmt.excluded.revenue,
+                # max() escalar de SQLite retorna NULL si algún argumento es NULL
+                'last_sale_at': func.max(
+                    func.coalesce(stats_table.c.last_sale_at, stmt.excluded.last_sale_at),
+                    func.coalesce(stmt.excluded.last_sale_at, stats_table.c.last_sale_at)
+                ),
+                'updated_at': stmt.excluded.updated_at
+            }
+        )
+        connection.execute(stmt, [
+            {'product_id': pid, 'units_sold': units, 'revenue': revenue,
+             'last_sale_at': last_sale_at, 'updated_at': now}
+            for pid, (units, revenue, last_sale_at) in self.stats.items()
+        ])
+
+        monthly_table = ProductSalesMonthly.__table__
+        stmt = sqlite_insert(monthly_table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[monthly_table.c.product_id, monthly_table.c.month],
+            set_={
+                'units_sold': monthly_table.c.units_sold + stmt.excluded.units_sold,
+                'revenue': monthly_table.c.revenue + stmt.excluded.revenue
+            }
+        )
+        connection.execute(stmt, [
+            {'product_id': pid, 'month': month, 'units_sold': units, 'revenue': revenue}
+            for (pid, month), (units, revenue) in self.monthly.items()
+        ])
+
+        if self.recheck_last_sale:
+            connection.execute(
+                text(f"""
+                    UPDATE product_sales_stats
+                    SET last_sale_at = ({_LAST_SALE_SQL})
+                    WHERE product_id IN :ids
+                """).bindparams(bindparam('ids', expanding=True)),
+                {'ids': sorted(self.recheck_last_sale)}
+            )
+
+
+# Última factura no cancelada que incluye el producto
+_LAST_SALE_SQL = """
+    SELECT MAX(i.date)
+    FROM invoice_item ii
+    JOIN invoice i ON i.id = ii.invoice_id
+    WHERE ii.product_id = product_sales_stats.product_id
+      AND i.document_type = 'invoice'
+      AND COALESCE(i.status, '') != 'cancelled'
+"""
+
+
+def _apply_item_changes(connection, item_changes, document_changes):
+    """Consumidor de cambios de facturas: actualiza los contadores por producto."""
+    delta = _SalesDelta()
+    for change in item_changes:
+        delta.add(change)
+    delta.apply(connection)
+
+
+def register_sales_stats_events():
+    """Registra el consumidor que mantiene los contadores (idempotente)."""
+    register_invoice_change_handler(_apply_item_changes)
+
+
+def rebuild_sales_stats(product_ids=None):
+    """Recalcula los contadores desde el historial en una sola pasada.
+
+    No hace commit: el llamador decide (scripts de migración / fusión).
+
+    Args:
+        product_ids: Limitar a estos productos; None recalcula todo
+
+    Returns:
+        int: Filas escritas en product_sales_stats
+    """
+    where_ids = ''
+    params = {'now': datetime.utcnow()}
+    bind = []
+    if product_ids is not None:
+        ids = sorted(set(product_ids))
+        if not ids:
+            return 0
+        where_ids = 'AND ii.product_id IN :ids'
+        params['ids'] = ids
+        bind = [bindparam('ids', expanding=True)]
+
+    def execute(sql):
+        return db.session.execute(text(sql).bindparams(*bind), params)
+
+    for table in ('product_sales_stats', 'product_sales_monthly'):
+        execute(f"DELETE FROM {table} WHERE 1=1 {where_ids.replace('ii.', '')}")
+
+    result = execute(f"""
+        INSERT INTO product_sales_stats (product_id, units_sold, revenue, last_sale_at, updated_at)
+        SELECT ii.product_id,
+               SUM(CASE WHEN i.document_type = 'credit_note' THEN -ii.quantity ELSE ii.quantity END),
+               SUM(CASE WHEN i.document_type = 'credit_note' THEN -ii.quantity ELSE ii.quantity END * ii.price),
+               MAX(CASE WHEN i.document_type = 'invoice' THEN i.date END),
+               :now
+        FROM invoice_item ii
+        JOIN invoice i ON i.id = ii.invoice_id
+        WHERE COALESCE(i.status, '') != 'cancelled' {where_ids}
+        GROUP BY ii.product_id
+    """)
+
+    # Mes local de Colombia (offset fijo, ver utils/time_buckets.py)
+    execute(f"""
+        INSERT INTO product_sales_monthly (product_id, month, units_sold, revenue)
+        SELECT ii.product_id,
+               strftime('%Y-%m', i.date, '{BOGOTA_OFFSET}'),
+               SUM(CASE WHEN i.document_type = 'credit_note' THEN -ii.quantity ELSE ii.quantity END),
+               SUM(CASE WHEN i.document_type = 'credit_note' THEN -ii.quantity ELSE ii.quantity END * ii.price)
+        FROM invoice_item ii
+        JOIN invoice i ON i.id = ii.invoice_id
+        WHERE COALESCE(i.status, '') != 'cancelled' {where_ids}
+        GROUP BY ii.product_id, strftime('%Y-%m', i.date, '{BOGOTA_OFFSET}')
+    """)
+
+    return result.rowcount
+
+
+def setup_sales_stats():
+    """Inicializa los contadores en bases existentes (primer arranque tras actualizar).
+
+    Si product_sales_stats está vacía pero ya hay ventas, reconstruye desde el
+    historial. Debe llamarse dentro de un app context después de db.create_all().
+    """
+    has_stats = db.session.query(ProductSalesStats.product_id).first() is not None
+    has_sales = db.session.query(InvoiceItem.id).first() is not None
+    if has_sales and not has_stats:
+        rebuild_sales_stats()
+        db.session.commit()
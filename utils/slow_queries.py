@@ -0,0 +1,216 @@
+"""Green-POS - Log de Consultas Lentas con EXPLAIN QUERY PLAN
+Toda sentencia que supere SLOW_QUERY_THRESHOLD_MS se registra con sus
+parámetros, la ruta que la ejecutó y el plan de SQLite capturado en ese
+momento (ej: "SCAN product" delata un recorrido completo de tabla).
+
+Destinos:
+- Archivo rotativo (instance/slow_queries.log por defecto, 5 MB x 3)
+- Últimos eventos en memoria, agrupados por sentencia normalizada en
+  /settings/slow-queries
+
+Cada app tiene su SlowQueryLog (app.extensions['slow_queries'], ver
+slow_query_log()) con su umbral, historial y logger propios: otra app del
+mismo proceso (ej: pruebas) no hereda el umbral ni el archivo.
+
+El tiempo de cada sentencia lo mide el listener compartido de
+utils/query_counter.py. El plan se obtiene con la conexión DBAPI
+directamente (no dispara de nuevo los listeners del engine) y solo para
+sentencias lentas: las consultas rápidas pagan una comparación.
+"""
+
+import logging
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from flask import current_app, has_request_context, request
+
+from utils.query_counter import add_statement_observer
+from utils.sql_profiler import normalize_statement
+
+CO_TZ = ZoneInfo("America/Bogota")
+
+LOGGER_NAME = 'greenpos.slow_queries'
+
+# Eventos guardados para la página de administración
+SLOW_QUERY_HISTORY_SIZE = 500
+
+# Rotación del archivo de log
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+# Longitud máxima de parámetros en el log (INSERT masivos, blobs)
+MAX_PARAMS_LENGTH = 500
+
+# Sentencias con plan de consulta (PRAGMA, BEGIN, COMMIT... no lo tienen)
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def explain_query_plan(dbapi_connection, statement, parameters):
+    """Plan de SQLite para una sentencia, una línea por paso.
+
+    Args:
+        dbapi_connection: Conexión sqlite3 subyacente
+        statement: SQL con marcadores ?
+        parameters: Parámetros de la ejecución (el primer set si es executemany)
+
+    Returns:
+        list[str]: Pasos del plan (vacío si no aplica o falla)
+    """
+    if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return []
+    try:
+        rows = dbapi_connection.execute(f'EXPLAIN QUERY PLAN {statement}', parameters or ()).fetchall()
+    except sqlite3.Error:
+        return []
+    # Filas: (id, parent, notused, detail); la profundidad se muestra con sangría
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _notused, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return lines
+
+
+def has_full_scan(plan):
+    """True si el plan recorre una tabla completa sin índice."""
+    return any(
+        step.strip().startswith('SCAN ') and 'USING' not in step
+        for step in plan
+    )
+
+
+class SlowQueryLog:
+    """Umbral, historial circular y archivo de consultas lentas de una app.
+
+    El historial lo comparten los hilos de waitress.
+    """
+
+    def __init__(self, threshold_ms, size=SLOW_QUERY_HISTORY_SIZE):
+        self.threshold_ms = threshold_ms
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=size)
+        # Logger fuera del árbol de logging: su archivo no afecta a otras apps.
+        # NullHandler: sin archivo configurado tampoco escribe en la consola
+        self.logger = logging.Logger(LOGGER_NAME, logging.WARNING)
+        self.logger.addHandler(logging.NullHandler())
+
+    def attach_file(self, path):
+        """Escribe los eventos en un archivo rotativo."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                      encoding='utf-8')
+        handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s'))
+        self.logger.addHandler(handler)
+
+    def record_statement(self, cursor, statement, parameters, executemany, elapsed):
+        """Observador de utils/query_counter.py: registra la sentencia si es lenta."""
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms < self.threshold_ms:
+            return
+
+        plan_params = parameters[0] if executemany and parameters else parameters
+        plan = explain_query_plan(cursor.connection, statement, plan_params)
+        entry = {
+            'at': datetime.now(CO_TZ).strftime('%Y-%m-%d %H:%M:%S'),
+            'ms': round(elapsed_ms, 2),
+            'route': _route_label(),
+            'statement': normalize_statement(statement),
+            'params': _format_params(parameters),
+            'plan': plan,
+            'full_scan': has_full_scan(plan),
+        }
+        self.add(entry)
+        self.logger.warning(
+            "%.1f ms en %s%s\n  SQL: %s\n  Parámetros: %s\n  Plan:\n    %s",
+            entry['ms'], entry['route'], ' [SCAN completo]' if entry['full_scan'] else '',
+            entry['statement'], entry['params'], '\n    '.join(plan) or '(sin plan)'
+        )
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def entries(self):
+        """Eventos del más reciente al más antiguo."""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def by_statement(self):
+        """Agrupa los eventos por sentencia normalizada, la más costosa primero.
+
+        Returns:
+            list[dict]: statement, count, total_ms, avg_ms, max_ms, routes,
+                        full_scan, plan y params del evento más lento
+        """
+        groups = {}
+        for entry in self.entries():
+            group = groups.get(entry['statement'])
+            if group is None:
+                group = groups[entry['statement']] = {
+                    'statement': entry['statement'], 'count': 0, 'total_ms': 0.0,
+                    'max_ms': 0.0, 'routes': set(), 'plan': [], 'params': '', 'full_scan': False
+                }
+            group['count'] += 1
+            group['total_ms'] += entry['ms']
+            group['routes'].add(entry['route'])
+            if entry['ms'] >= group['max_ms']:
+                group.update(max_ms=entry['ms'], plan=entry['plan'], params=entry['params'],
+                             full_scan=entry['full_scan'])
+
+        rows = []
+        for group in groups.values():
+            group['avg_ms'] = round(group['total_ms'] / group['count'], 2)
+            group['total_ms'] = round(group['total_ms'], 2)
+            group['routes'] = sorted(group['routes'])
+            rows.append(group)
+        return sorted(rows, key=lambda row: -row['total_ms'])
+
+
+def _route_label():
+    if has_request_context():
+        return f'{request.method} {request.endpoint or request.path}'
+    return 'sin request'
+
+
+def _format_params(parameters):
+    text = repr(parameters)
+    if len(text) > MAX_PARAMS_LENGTH:
+        text = text[:MAX_PARAMS_LENGTH] + '...'
+    return text
+
+
+def slow_query_log(app=None):
+    """SlowQueryLog de la app (por defecto la actual) o None si está desactivado."""
+    return (app or current_app).extensions.get('slow_queries')
+
+
+def init_slow_query_log(app):
+    """Registra el observador de sentencias y el archivo rotativo.
+
+    Debe llamarse dentro de un app context (requiere db.engine). No hace nada
+    si SLOW_QUERY_THRESHOLD_MS es 0 o negativo.
+
+    Args:
+        app: Instancia de Flask
+    """
+    threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS', 0)
+    if not threshold_ms or threshold_ms <= 0:
+        return
+
+    log = app.extensions['slow_queries'] = SlowQueryLog(threshold_ms)
+
+    log_file = app.config.get('SLOW_QUERY_LOG_FILE')
+    if log_file:
+        log.attach_file(Path(app.instance_path) / log_file)
+
+    add_statement_observer(app, log.record_statement)
@@ -0,0 +1,206 @@
+"""Green-POS - Instrumentación SQL por Request
+Mide, para cada request muestreado, cuántas consultas ejecutó, cuánto tiempo
+pasó en la base de datos y qué sentencias se repitieron, para encontrar
+páginas lentas y patrones N+1 sin herramientas externas.
+
+Estructura:
+- Observador del listener compartido de utils/query_counter.py (cantidad
+  y tiempo de BD del request salen de ahí, medidos una sola vez)
+- RequestProfile en g.sql_profile: sentencias normalizadas -> (veces, ms)
+- Header Server-Timing (visible en la pestaña Network del navegador):
+      Server-Timing: db;dur=12.3;desc="18 consultas", app;dur=45.0
+- N+1: una misma sentencia ejecutada más de SQL_N_PLUS_ONE_THRESHOLD veces
+  se marca (header X-SQL-N-Plus-One + warning en el log)
+- SQL_PROFILES: últimos resúmenes en memoria, visibles en /settings/sql-profile
+
+Configuración (config.py):
+- SQL_PROFILING: activo por defecto en desarrollo; en producción es opt-in
+  (variable de entorno SQL_PROFILING=1)
+- SQL_PROFILING_SAMPLE_RATE: fracción de requests medidos (ej: 0.05)
+"""
+
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from flask import g, has_request_context, request
+
+from utils.query_counter import add_statement_observer, request_db_time
+
+CO_TZ = ZoneInfo("America/Bogota")
+
+# Resúmenes guardados para la página de administración
+PROFILE_HISTORY_SIZE = 200
+
+# Sentencias repetidas a mostrar por request
+TOP_STATEMENTS = 5
+
+# IN (?, ?, ?) con distinta cantidad de parámetros cuenta como la misma sentencia
+_IN_LIST = re.compile(r'\(\?(?:,\s*\?)+\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_statement(statement):
+    """Normaliza una sentencia SQL para agrupar repeticiones."""
+    return _IN_LIST.sub('(?, ...)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class RequestProfile:
+    """Sentencias repetidas y su tiempo durante un request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = {}    # sentencia normalizada -> [veces, segundos]
+
+    def record(self, statement, elapsed):
+        entry = self.statements.setdefault(normalize_statement(statement), [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def summary(self, threshold, queries, db_time):
+        """Resumen serializable del request.
+
+        Args:
+            threshold: Repeticiones a partir de las cuales se marca N+1
+            queries: Consultas del request (g.query_count)
+            db_time: Segundos de BD del request (request_db_time())
+
+        Returns:
+            dict: total_ms, db_ms, queries, top (repetidas), n_plus_one
+        """
+        ranked = sorted(self.statements.items(), key=lambda item: (-item[1][0], -item[1][1]))
+        top = [
+            {'statement': statement, 'count': count, 'ms': round(seconds * 1000, 2)}
+            for statement, (count, seconds) in ranked[:TOP_STATEMENTS]
+        ]
+        return {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'db_ms': round(db_time * 1000, 2),
+            'queries': queries,
+            'top': top,
+            'n_plus_one': [entry for entry in top if entry['count'] > threshold],
+        }
+
+
+class ProfileLog:
+    """Historial circular de resúmenes (compartido por los hilos de waitress)."""
+
+    def __init__(self, size=PROFILE_HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=size)
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def entries(self):
+        """Resúmenes del más reciente al más antiguo."""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def by_endpoint(self):
+        """Agrega el historial por endpoint, ordenado por tiempo promedio.
+
+        Returns:
+            list[dict]: endpoint, requests, avg_ms, avg_db_ms, avg_queries,
+                        max_queries, n_plus_one (requests marcados)
+        """
+        groups = {}
+        for entry in self.entries():
+            group = groups.setdefault(entry['endpoint'] or entry['path'], {
+                'endpoint': entry['endpoint'] or entry['path'], 'requests': 0, 'total_ms': 0.0,
+                'db_ms': 0.0, 'queries': 0, 'max_queries': 0, 'n_plus_one': 0
+            })
+            group['requests'] += 1
+            group['total_ms'] += entry['total_ms']
+            group['db_ms'] += entry['db_ms']
+            group['queries'] += entry['queries']
+            group['max_queries'] = max(group['max_queries'], entry['queries'])
+            group['n_plus_one'] += 1 if entry['n_plus_one'] else 0
+
+        rows = []
+        for group in groups.values():
+            count = group['requests']
+            rows.append({
+                'endpoint': group['endpoint'],
+                'requests': count,
+                'avg_ms': round(group['total_ms'] / count, 2),
+                'avg_db_ms': round(group['db_ms'] / count, 2),
+                'avg_queries': round(group['queries'] / count, 1),
+                'max_queries': group['max_queries'],
+                'n_plus_one': group['n_plus_one'],
+            })
+        return sorted(rows, key=lambda row: -row['avg_ms'])
+
+
+# Instancia compartida del proceso
+SQL_PROFILES = ProfileLog()
+
+
+def _record_statement(cursor, statement, parameters, executemany, elapsed):
+    if has_request_context():
+        profile = g.get('sql_profile')
+        if profile is not None:
+            profile.record(statement, elapsed)
+
+
+def init_sql_profiler(app):
+    """Registra el observador de sentencias y los hooks de request.
+
+    Debe llamarse dentro de un app context (requiere db.engine). No hace nada
+    si SQL_PROFILING está desactivado.
+
+    Args:
+        app: Instancia de Flask
+    """
+    if not app.config.get('SQL_PROFILING'):
+        return
+
+    sample_rate = app.config.get('SQL_PROFILING_SAMPLE_RATE', 1.0)
+    threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 10)
+
+    add_statement_observer(app, _record_statement)
+
+    @app.before_request
+    def start_sql_profile():
+        if request.endpoint == 'static':
+            return
+        if sample_rate >= 1 or random.random() < sample_rate:
+            g.sql_profile = RequestProfile()
+
+    @app.after_request
+    def finish_sql_profile(response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+
+        summary = profile.summary(threshold, g.get('query_count', 0), request_db_time())
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={summary["db_ms"]};desc="{summary["queries"]} consultas", app;dur={summary["total_ms"]}'
+        )
+        if summary['n_plus_one']:
+            worst = summary['n_plus_one'][0]
+            response.headers['X-SQL-N-Plus-One'] = str(worst['count'])
+            app.logger.warning(
+                f"Posible N+1 en {request.method} {request.path}: "
+                f"{worst['count']}x {worst['statement'][:200]}"
+            )
+
+        summary.update({
+            'at': datetime.now(CO_TZ).strftime('%Y-%m-%d %H:%M:%S'),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+        })
+        SQL_PROFILES.add(summary)
+        return response
@@ -0,0 +1,307 @@
+"""Green-POS - Libro de Movimientos de Stock
+stock_ledger registra cada movimiento de inventario (ventas, notas de
+crédito, eliminaciones, ajustes, conteos físicos, consolidaciones) con el
+stock resultante y los contadores acumulados del producto, escritos en la
+MISMA transacción que modifica product.stock.
+
+- Historial paginado por cursor (created_at, id) en lugar de cargar logs +
+  ventas y recalcular el stock hacia atrás en Python
+- Estadísticas (comprado, vendido neto, perdido, ventas de 30 días, última
+  venta) como lecturas de una fila: la última del producto y la última
+  anterior a la ventana
+
+Escritura:
+- record_movements() después de actualizar el stock en la BD (hace flush):
+  el balance se lee de product.stock y los contadores se calculan desde la
+  fila anterior con un único INSERT ... SELECT por movimiento (executemany)
+- rebuild_stock_ledger(): reconstrucción desde product_stock_log + ventas
+  (backfill inicial, tras fusionar productos con SQL directo,
+  migrations/rebuild_stock_ledger.py)
+
+Contadores acumulados:
+- units_purchased: ajustes positivos (excluye conteos físicos)
+- units_lost: ajustes negativos (excluye conteos físicos)
+- units_sold: ventas (una venta eliminada se descuenta)
+- units_returned: devoluciones por nota de crédito
+"""
+
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, insert, select, text
+from sqlalchemy.orm import joinedload
+
+from extensions import db
+from models.models import Invoice, InvoiceItem, Product, ProductStockLog, StockLedger
+from utils.pagination import encode_cursor, keyset_filter
+
+MOVEMENT_SALE = 'sale'
+MOVEMENT_SALE_DELETED = 'sale_deleted'
+MOVEMENT_CREDIT_NOTE = 'credit_note'
+MOVEMENT_ADJUSTMENT = 'adjustment'
+MOVEMENT_INVENTORY = 'inventory'
+MOVEMENT_MERGE = 'merge'
+MOVEMENT_INITIAL = 'initial'
+
+LEDGER_PAGE_SIZE = 50
+VELOCITY_WINDOW_DAYS = 30
+
+# Movimiento pendiente de registrar (quantity con signo: + entra, - sale)
+StockMovement = namedtuple('StockMovement', 'product_id quantity movement reason reference',
+                           defaults=(None, None))
+
+# Razones que escriben las rutas en product_stock_log (reconstrucción)
+_CREDIT_NOTE_REASON = 'Devolución por Nota de Crédito'
+_SALE_DELETED_REASON = 'Devolución por eliminación de venta'
+_MERGE_REASON = 'Consolidacion de productos'
+
+_ledger = StockLedger.__table__
+
+# Balance desde product.stock (ya actualizado) y contadores desde la fila anterior
+_RECORD_MOVEMENT = text("""
+    INSERT INTO stock_ledger (product_id, user_id, created_at, movement, quantity, balance,
+                              reference, reason, units_purchased, units_sold, units_returned,
+                              units_lost, last_sale_at)
+    SELECT p.id, :user_id, :created_at, :movement, :quantity, p.stock,
+           :reference, :reason,
+           COALESCE(prev.units_purchased, 0) + :purchased,
+           COALESCE(prev.units_sold, 0) + :sold,
+           COALESCE(prev.units_returned, 0) + :returned,
+           COALESCE(prev.units_lost, 0) + :lost,
+           CASE WHEN :movement = 'sale' THEN :created_at ELSE prev.last_sale_at END
+    FROM product p
+    LEFT JOIN stock_ledger prev ON prev.id = (
+        SELECT id FROM stock_ledger WHERE product_id = p.id
+        ORDER BY created_at DESC, id DESC LIMIT 1
+    )
+    WHERE p.id = :product_id
+""").bindparams(bindparam('created_at', type_=db.DateTime))
+
+
+def counter_deltas(movement, quantity):
+    """Aporte de un movimiento a los contadores acumulados.
+
+    Returns:
+        tuple: (purchased, sold, returned, lost)
+    """
+    if movement == MOVEMENT_SALE:
+        return 0, -quantity, 0, 0
+    if movement == MOVEMENT_SALE_DELETED:
+        return 0, -quantity, 0, 0
+    if movement == MOVEMENT_CREDIT_NOTE:
+        return 0, 0, quantity, 0
+    if movement == MOVEMENT_ADJUSTMENT:
+        return max(quantity, 0), 0, 0, max(-quantity, 0)
+    return 0, 0, 0, 0
+
+
+def record_movements(movements, user_id=None, created_at=None):
+    """Agrega movimientos al libro (sin commit).
+
+    Llamar DESPUÉS de modificar product.stock: hace flush y toma el balance
+    de la BD. Un producto debe aparecer una sola vez por llamada.
+
+    Args:
+        movements: Iterable de StockMovement
+        user_id: Usuario que registra
+        created_at: Fecha (UTC naive) del movimiento; por defecto ahora
+    """
+    created_at = created_at or datetime.utcnow()
+    params = []
+    for movement in movements:
+        purchased, sold, returned, lost = counter_deltas(movement.movement, movement.quantity)
+        params.append({
+            'product_id': movement.product_id, 'user_id': user_id, 'created_at': created_at,
+            'movement': movement.movement, 'quantity': movement.quantity,
+            'reference': movement.reference, 'reason': movement.reason,
+            'purchased': purchased, 'sold': sold, 'returned': returned, 'lost': lost,
+        })
+    if not params:
+        return
+    db.session.flush()
+    db.session.execute(_RECORD_MOVEMENT, params)
+
+
+def record_movement(product_id, quantity, movement, reason=None, reference=None, user_id=None):
+    """Atajo de record_movements para un solo movimiento."""
+    record_movements([StockMovement(product_id, quantity, movement, reason, reference)], user_id)
+
+
+# ==================== LECTURA ====================
+
+def _latest_row_query(product_id):
+    return StockLedger.query.filter(StockLedger.product_id == product_id)\
+        .order_by(StockLedger.created_at.desc(), StockLedger.id.desc())
+
+
+def ledger_page(product_id, position=None, page_size=LEDGER_PAGE_SIZE):
+    """Una página del historial del producto, más reciente primero.
+
+    Args:
+        product_id: ID del producto
+        position: Cursor decodificado (created_at, id) o None
+        page_size: Movimientos por página
+
+    Returns:
+        tuple: (list[StockLedger], next_cursor) - next_cursor es None en la última página
+    """
+    query = keyset_filter(_latest_row_query(product_id), StockLedger.created_at,
+                          StockLedger.id, position)
+    rows = query.options(joinedload(StockLedger.user)).limit(page_size + 1).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def ledger_stats(product_id, window_days=VELOCITY_WINDOW_DAYS, now=None):
+    """Estadísticas acumuladas del producto (dos lecturas de una fila).
+
+    Returns:
+        dict: total_purchased, net_sold, total_lost, sold_in_window, last_sale_at
+    """
+    latest = _latest_row_query(product_id).first()
+    if latest is None:
+        return {'total_purchased': 0, 'net_sold': 0, 'total_lost': 0,
+                'sold_in_window': 0, 'last_sale_at': None}
+
+    cutoff = (now or datetime.utcnow()) - timedelta(days=window_days)
+    before_window = db.session.execute(
+        select(StockLedger.units_sold)
+        .where(StockLedger.product_id == product_id, StockLedger.created_at < cutoff)
+        .order_by(StockLedger.created_at.desc(), StockLedger.id.desc())
+        .limit(1)
+    ).scalar() or 0
+
+    return {
+        'total_purchased': latest.units_purchased,
+        'net_sold': latest.units_sold - latest.units_returned,
+        'total_lost': latest.units_lost,
+        'sold_in_window': latest.units_sold - before_window,
+        'last_sale_at': latest.last_sale_at,
+    }
+
+
+# ==================== RECONSTRUCCIÓN ====================
+
+def _classify_log(reason, is_inventory):
+    if is_inventory:
+        return MOVEMENT_INVENTORY
+    reason = reason or ''
+    if reason.startswith(_CREDIT_NOTE_REASON):
+        return MOVEMENT_CREDIT_NOTE
+    if reason.startswith(_SALE_DELETED_REASON):
+        return MOVEMENT_SALE_DELETED
+    if reason.startswith(_MERGE_REASON):
+        return MOVEMENT_MERGE
+    return MOVEMENT_ADJUSTMENT
+
+
+def _rebuild_product_rows(product_id, stock, events):
+    """Filas del libro de un producto desde sus logs y ventas (orden cronológico).
+
+    Los logs traen su stock anterior/nuevo; el de las ventas se calcula hacia
+    atrás desde el stock actual (misma regla que el historial anterior).
+    """
+    events.sort(key=lambda event: event['created_at'])
+    current = stock
+    for event in reversed(events):
+        if event['movement'] == MOVEMENT_SALE:
+            event['balance'] = current
+            current -= event['quantity']
+        else:
+            current = event['balance'] - event['quantity']
+
+    purchased = sold = returned = lost = 0
+    last_sale_at = None
+    rows = []
+    for event in events:
+        movement, quantity = event['movement'], event['quantity']
+        # Las ventas eliminadas ya no existen en invoice_item: no se descuentan
+        if movement != MOVEMENT_SALE_DELETED:
+            d_purchased, d_sold, d_returned, d_lost = counter_deltas(movement, quantity)
+            purchased += d_purchased
+            sold += d_sold
+            returned += d_returned
+            lost += d_lost
+        if movement == MOVEMENT_SALE:
+            last_sale_at = event['created_at']
+        rows.append(dict(event, product_id=product_id, units_purchased=purchased,
+                         units_sold=sold, units_returned=returned, units_lost=lost,
+                         last_sale_at=last_sale_at))
+    return rows
+
+
+def rebuild_stock_ledger(product_ids=None):
+    """Reconstruye el libro desde product_stock_log y las ventas.
+
+    No hace commit: el llamador decide. Los IDs que ya no existen (productos
+    fusionados) solo se eliminan del libro.
+
+    Args:
+        product_ids: Limitar a estos productos; None reconstruye todo
+
+    Returns:
+        int: Filas escritas
+    """
+    products_query = select(Product.id, Product.stock)
+    logs_query = select(ProductStockLog.product_id, ProductStockLog.user_id,
+                        ProductStockLog.created_at, ProductStockLog.reason,
+                        ProductStockLog.previous_stock, ProductStockLog.new_stock,
+                        ProductStockLog.is_inventory)\
+        .order_by(ProductStockLog.created_at, ProductStockLog.id)
+    sales_query = select(InvoiceItem.product_id, Invoice.user_id, Invoice.date,
+                         InvoiceItem.quantity, Invoice.number)\
+        .join(Invoice, InvoiceItem.invoice_id == Invoice.id)\
+        .where(Invoice.document_type == 'invoice')\
+        .order_by(Invoice.date, InvoiceItem.id)
+    delete = _ledger.delete()
+
+    if product_ids is not None:
+        ids = sorted(set(product_ids))
+        if not ids:
+            return 0
+        products_query = products_query.where(Product.id.in_(ids))
+        logs_query = logs_query.where(ProductStockLog.product_id.in_(ids))
+        sales_query = sales_query.where(InvoiceItem.product_id.in_(ids))
+        delete = delete.where(_ledger.c.product_id.in_(ids))
+
+    db.session.execute(delete)
+
+    events = defaultdict(list)
+    for product_id, user_id, created_at, reason, previous_stock, new_stock, is_inventory \
+            in db.session.execute(logs_query):
+        events[product_id].append({
+            'user_id': user_id, 'created_at': created_at or datetime.utcnow(),
+            'movement': _classify_log(reason, is_inventory),
+            'quantity': new_stock - previous_stock, 'balance': new_stock,
+            'reference': None, 'reason': reason,
+        })
+    for product_id, user_id, sold_at, quantity, number in db.session.execute(sales_query):
+        events[product_id].append({
+            'user_id': user_id, 'created_at': sold_at, 'movement': MOVEMENT_SALE,
+            'quantity': -quantity, 'balance': None,
+            'reference': number, 'reason': f'Venta en factura {number}',
+        })
+
+    rows = []
+    for product_id, stock in db.session.execute(products_query):
+        if events.get(product_id):
+            rows.extend(_rebuild_product_rows(product_id, stock or 0, events[product_id]))
+    if rows:
+        db.session.execute(insert(_ledger), rows)
+    return len(rows)
+
+
+def setup_stock_ledger():
+    """Backfill automático en bases existentes (libro vacío con historial).
+
+    Debe llamarse dentro de un app context después de db.create_all().
+    """
+    has_ledger = db.session.query(StockLedger.id).first() is not None
+    has_history = (db.session.query(ProductStockLog.id).first() is not None
+                   or db.session.query(InvoiceItem.id).first() is not None)
+    if has_history and not has_ledger:
+        rebuild_stock_ledger()
+        db.session.commit()
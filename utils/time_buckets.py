@@ -0,0 +1,177 @@
+"""Green-POS - Agrupación por Hora/Día Local en SQL
+Expresiones que agrupan columnas datetime almacenadas en UTC por hora, día o
+mes de Colombia directamente en SQLite (strftime con offset fijo), para que
+los reportes reciban solo las filas agregadas en lugar de materializar cada
+factura y convertir la zona horaria en Python.
+
+Colombia (America/Bogota) no tiene horario de verano: UTC-5 fijo.
+
+Usado por:
+- dashboard.index (ventas del día)
+- products.stock_history (ventas mensuales)
+- utils/exports.py (fechas locales de las exportaciones)
+- day_range(): filtros por día local en inventario, dashboard, citas y reportes
+- utils/sales_rollups.py (backfill de rollups)
+"""
+
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import Integer, and_, case, cast, func, true
+
+from extensions import db
+from models.models import Invoice, InvoiceItem
+
+CO_TZ = ZoneInfo("America/Bogota")
+
+# Modificador de strftime de SQLite para pasar de UTC a hora de Colombia
+BOGOTA_OFFSET = '-5 hours'
+
+# Formatos strftime por tipo de bucket
+BUCKET_FORMATS = {
+    'hour': '%H',          # 0-23 (entero)
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+    'weekday': '%w',       # 0=domingo ... 6=sábado (entero)
+}
+
+
+def local_bucket(column, bucket):
+    """Expresión SQL con el bucket local (Colombia) de una columna datetime UTC.
+
+    Args:
+        column: Columna datetime en UTC (ej: Invoice.date)
+        bucket: 'hour', 'day', 'month' o 'weekday'
+
+    Returns:
+        Expresión SQLAlchemy (str para day/month, int para hour/weekday)
+    """
+    expression = func.strftime(BUCKET_FORMATS[bucket], column, BOGOTA_OFFSET)
+    if bucket in ('hour', 'weekday'):
+        return cast(expression, Integer)
+    return expression
+
+
+def local_timestamp(column):
+    """Expresión SQL 'YYYY-MM-DD HH:MM:SS' en hora local de una columna datetime UTC.
+
+    Args:
+        column: Columna datetime en UTC (ej: Invoice.date)
+
+    Returns:
+        Expresión SQLAlchemy de tipo texto
+    """
+    return func.strftime('%Y-%m-%d %H:%M:%S', column, BOGOTA_OFFSET)
+
+
+def utc_bounds(start_day, end_day):
+    """Convierte un rango de días locales (inclusive) a [inicio, fin) en UTC naive.
+
+    Args:
+        start_day: date local inicial
+        end_day: date local final (inclusive)
+
+    Returns:
+        tuple: (datetime, datetime) en UTC sin tzinfo, comparables con la BD
+    """
+    start = datetime.combine(start_day, time.min, tzinfo=CO_TZ)
+    end = datetime.combine(end_day + timedelta(days=1), time.min, tzinfo=CO_TZ)
+    return (start.astimezone(timezone.utc).replace(tzinfo=None),
+            end.astimezone(timezone.utc).replace(tzinfo=None))
+
+
+def local_bounds(start_day, end_day):
+    """Rango de días locales (inclusive) como [inicio, fin) naive en hora local.
+
+    Para columnas que guardan hora local sin tzinfo (ej: Appointment.scheduled_at).
+
+    Args:
+        start_day: date local inicial
+        end_day: date local final (inclusive)
+
+    Returns:
+        tuple: (datetime, datetime) sin tzinfo
+    """
+    return (datetime.combine(start_day, time.min),
+            datetime.combine(end_day + timedelta(days=1), time.min))
+
+
+def day_range(column, start_day=None, end_day=None, stored_utc=True):
+    """Condición SQL sargable "column en los días locales [start_day, end_day]".
+
+    Compara la columna directamente contra límites datetime (usa índices),
+    en lugar de func.date(column) == día, que recorre toda la tabla y además
+    toma el día UTC en vez del día de Colombia.
+
+    Args:
+        column: Columna datetime
+        start_day: date local inicial (None = sin límite inferior)
+        end_day: date local final inclusive (None = sin límite superior)
+        stored_utc: True si la columna guarda UTC naive (created_at, Invoice.date);
+                    False si guarda hora local naive (Appointment.scheduled_at)
+
+    Returns:
+        Expresión SQLAlchemy para .filter()
+    """
+    bounds = utc_bounds if stored_utc else local_bounds
+    conditions = []
+    if start_day is not None:
+        conditions.append(column >= bounds(start_day, start_day)[0])
+    if end_day is not None:
+        conditions.append(column < bounds(end_day, end_day)[1])
+    return and_(true(), *conditions)
+
+
+def sales_buckets(bucket, start_day, end_day):
+    """Documentos y total neto (facturas - NC) por bucket local, desde invoice.
+
+    Args:
+        bucket: 'hour', 'day', 'month' o 'weekday'
+        start_day, end_day: date locales (inclusive)
+
+    Returns:
+        list[dict]: [{'bucket', 'count', 'total'}, ...] ordenado por bucket
+    """
+    key = local_bucket(Invoice.date, bucket).label('bucket')
+    start, end = utc_bounds(start_day, end_day)
+
+    rows = db.session.query(
+        key,
+        func.count(Invoice.id),
+        func.sum(case(
+            (Invoice.document_type == 'credit_note', -Invoice.total),
+            else_=Invoice.total
+        ))
+    ).filter(
+        Invoice.date >= start,
+        Invoice.date < end,
+        func.coalesce(Invoice.status, '') != 'cancelled'
+    ).group_by(key).order_by(key).all()
+
+    return [{'bucket': value, 'count': count, 'total': total or 0.0} for value, count, total in rows]
+
+
+def product_units_buckets(product_id, bucket, since_day):
+    """Unidades vendidas (solo facturas) de un producto por bucket local.
+
+    Args:
+        product_id: ID del producto
+        bucket: 'hour', 'day', 'month' o 'weekday'
+        since_day: date local desde la cual contar (inclusive)
+
+    Returns:
+        list[dict]: [{'bucket', 'quantity'}, ...] ordenado por bucket
+    """
+    key = local_bucket(Invoice.date, bucket).label('bucket')
+    start, _ = utc_bounds(since_day, since_day)
+
+    rows = db.session.query(
+        key,
+        func.sum(InvoiceItem.quantity)
+    ).join(Invoice, InvoiceItem.invoice_id == Invoice.id).filter(
+        InvoiceItem.product_id == product_id,
+        Invoice.document_type == 'invoice',
+        Invoice.date >= start
+    ).group_by(key).order_by(key).all()
+
+    return [{'bucket': value, 'quantity': quantity or 0} for value, quantity in rows]